@@ -0,0 +1,205 @@
+"""
+Throughput benchmarks of the parsing and tracing pipeline.
+
+Frames come from `msg_trace.synthetic`, so runs are reproducible without
+dumps or tshark.  For every volume the script times
+
+    parse_frames       JsonParser.parse_frames (frame generation is not timed)
+    add[<store>]       MessageStore.add / ColumnarMessageStore.add
+    by_msisdn[<store>], by_tid[<store>], by_imsi[<store>], between[<store>],
+    iter_sorted[<store>]
+    chain_build        MessageChain.build, one subscriber at a time
+    build_chains       analyzer.build_chains over the same subscribers
+    render[ascii|md]   the reporters over these chains
+
+and writes the results as JSON.  `--compare` prints the ratio to an earlier
+result file:
+
+    PYTHONPATH=src python benchmarks/bench.py --sizes 10k,1m -o bench-new.json --compare bench-old.json
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+from msg_trace.analyzer import MessageChain, build_chains
+from msg_trace.colstore import ColumnarMessageStore
+from msg_trace.msgstore import MessageStore
+from msg_trace.Parser import JsonParser
+from msg_trace.report import AsciiReporter, MarkdownReporter
+from msg_trace.synthetic import DISTRIBUTIONS, generate_frames, subscriber_imsi, subscriber_msisdn
+
+RESULTS_VERSION = 1
+PARSE_BATCH = 10_000
+_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+class Bench:
+    """Collects timings of one run."""
+
+    def __init__(self):
+        self.results: list[dict] = []
+
+    def record(self, size: int, stage: str, seconds: float, ops: int):
+        self.results.append({"size": size, "stage": stage, "seconds": round(seconds, 6), "ops": ops,
+                             "us_per_op": round(seconds / ops * 1e6, 3) if ops else None})
+        print(f'{size:>10} {stage:<24} {seconds:10.3f} s {ops:>10} ops'
+              f' {self.results[-1]["us_per_op"] or 0:12.3f} us/op', flush=True)
+
+    def time(self, size: int, stage: str, ops: int, func):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        self.record(size, stage, time.perf_counter() - start, ops)
+        return result
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value[-1:] in _SUFFIXES:
+        return int(float(value[:-1]) * _SUFFIXES[value[-1]])
+    return int(value)
+
+
+def run_size(bench: Bench, size: int, args):
+    rng = random.Random(args.seed)
+    parser = JsonParser()
+    frames = generate_frames(size, subscribers=args.subscribers, distribution=args.distribution,
+                             mt_v3_ratio=args.mt_v3_ratio, seed=args.seed)
+
+    messages = []
+    parse_seconds = 0.0
+    while batch := list(itertools.islice(frames, PARSE_BATCH)):
+        start = time.perf_counter()
+        messages.extend(parser.parse_frames(batch))
+        parse_seconds += time.perf_counter() - start
+    bench.record(size, 'parse_frames', parse_seconds, len(messages))
+
+    msisdns = [subscriber_msisdn(rng.randrange(args.subscribers)) for _ in range(args.queries)]
+    imsis = [subscriber_imsi(rng.randrange(args.subscribers)) for _ in range(args.queries)]
+    tids = [messages[rng.randrange(len(messages))].tid for _ in range(args.queries)]
+    first_us, last_us = messages[0].ts_us, messages[-1].ts_us
+    windows = []
+    for _ in range(args.queries):
+        since = rng.randint(first_us, last_us)
+        windows.append((since, since + 1_000_000))
+
+    stores = {}
+    for name, store_cls in (('objects', MessageStore), ('columnar', ColumnarMessageStore)):
+        store = store_cls()
+
+        def add_all():
+            for msg in messages:
+                store.add(msg)
+        bench.time(size, f'add[{name}]', len(messages), add_all)
+        bench.time(size, f'by_msisdn[{name}]', len(msisdns), lambda: [store.by_msisdn(n) for n in msisdns])
+        bench.time(size, f'by_tid[{name}]', len(tids), lambda: [store.by_tid(t) for t in tids])
+        bench.time(size, f'by_imsi[{name}]', len(imsis), lambda: [store.by_imsi(i) for i in imsis])
+        bench.time(size, f'between[{name}]', len(windows), lambda: [store.between(s, t) for s, t in windows])
+        bench.time(size, f'iter_sorted[{name}]', len(messages), lambda: sum(1 for _ in store.iter_sorted()))
+        stores[name] = store
+
+    traced = list(dict.fromkeys(msisdns[:args.chains]))
+    store = stores['objects']
+
+    def build_each():
+        chains = []
+        for msisdn in traced:
+            chain = MessageChain(store, msisdn)
+            chain.build()
+            chains.append(chain.get_chain())
+        return chains
+    chains = bench.time(size, 'chain_build', len(traced), build_each)
+    bench.time(size, 'build_chains', len(traced), lambda: build_chains(store, traced))
+
+    # MarkdownReporter writes ./reports/<msisdn>.md, keep that out of the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for name, reporter in (('ascii', AsciiReporter(total_width=80)), ('md', MarkdownReporter())):
+                bench.time(size, f'render[{name}]', sum(len(chain) for chain in chains),
+                           lambda: [reporter.render(chain) for chain in chains])
+        finally:
+            os.chdir(cwd)
+
+
+def environment(args) -> dict:
+    try:
+        version = metadata.version('sms-dump-analyzer')
+    except metadata.PackageNotFoundError:
+        version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"results_version": RESULTS_VERSION,
+            "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "package_version": version,
+            "commit": commit,
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "subscribers": args.subscribers,
+            "distribution": args.distribution,
+            "queries": args.queries,
+            "chains": args.chains}
+
+
+def compare(results: list[dict], baseline_path: Path):
+    with open(baseline_path) as fh:
+        baseline = {(row["size"], row["stage"]): row for row in json.load(fh)["results"]}
+    print(f'\ncompared to {baseline_path} (time ratio, > 1 is slower):')
+    for row in results:
+        old = baseline.get((row["size"], row["stage"]))
+        if old is None or not old["seconds"]:
+            continue
+        ratio = row["seconds"] / old["seconds"]
+        flag = '  <-- slower' if ratio > 1.1 else ''
+        print(f'{row["size"]:>10} {row["stage"]:<24} {ratio:8.2f}{flag}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark parsing, stores, chain building and reports")
+    parser.add_argument('--sizes', default='10k,1m,10m', help="comma separated frame counts, e.g. 10k,1m,10m")
+    parser.add_argument('--subscribers', type=int, default=100_000, help="distinct subscribers in the traffic")
+    parser.add_argument('--distribution', default='zipf', choices=DISTRIBUTIONS)
+    parser.add_argument('--mt-v3-ratio', type=float, default=0.2,
+                        help="share of deliveries sent as MAP v3 MT_Forward_SM instead of Forward_SM")
+    parser.add_argument('--queries', type=int, default=1_000, help="lookups per query benchmark")
+    parser.add_argument('--chains', type=int, default=200, help="subscribers traced by the chain benchmarks")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='bench.json', help="JSON result file")
+    parser.add_argument('--compare', help="earlier JSON result file to compare with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    bench = Bench()
+    for size in (parse_size(value) for value in args.sizes.split(',')):
+        run_size(bench, size, args)
+        gc.collect()
+
+    with open(args.output, 'w') as fh:
+        json.dump({"environment": environment(args), "results": bench.results}, fh, indent=2)
+    print(f'results written to {args.output}')
+    if args.compare:
+        compare(bench.results, Path(args.compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
+import sys
+from itertools import islice
 from typing import Iterable, Any, Literal
-from .models import Message, MsgType, TCAPState, RPDestinationAddress, MessageTypeIndicator, ErrorCode
+from .models import Message, MsgType, TCAPState, RPDestinationAddress, MessageTypeIndicator, ErrorCode, epoch_str_to_us
+from .profiling import stage
 from enum import Enum
-from datetime import datetime, timezone
 
 
 # ─── MAP specific JSON keys ─────────────────────────────────────────────────────
@@ -20,6 +22,28 @@ class JsonField(str, Enum):
     OldErrorTree           = "gsm_old.returnError_element"
 
 
+class _Fallback(Exception):
+    """Frame shape not covered by the fast path of `JsonParser`."""
+
+
+# lookup tables of the fast path, keyed by tshark's string values
+_TCAP_ELEMENTS = (("tcap.begin_element", TCAPState.Begin),
+                  ("tcap.end_element", TCAPState.End),
+                  ("tcap.continue_element", TCAPState.Continue))
+_OPCODES = {str(member.value): member for member in MsgType}
+_ERROR_NAMES = {str(member.value): member.name for member in ErrorCode}
+_RP_DA_IMSI = str(RPDestinationAddress.IMSI.value)
+_RP_DA_SERVICE_CENTRE = str(RPDestinationAddress.ServiceCenterAddress.value)
+_MTI_MO = str(MessageTypeIndicator.MO.value)
+_MTI_OTHER = (str(MessageTypeIndicator.MT.value), str(MessageTypeIndicator.SMS_STATUS_REPORT.value))
+_RETURN_RESULT_LAST_KEY = JsonField.RETURN_RESULT_LAST_KEY.value
+_ERROR_TREE_KEY = JsonField.Error.value
+_OLD_ERROR_TREE_KEY = JsonField.OldErrorTree.value
+_TP_DA_PREFIX = "TP-Destination-Address"
+_new_message = object.__new__
+_intern = sys.intern
+
+
 class JsonParser:
     """
     A class that provides functionality to parse frames and construct messages.
@@ -35,6 +59,18 @@ class JsonParser:
     :ivar attribute2: Placeholder description of attribute2.
     """
 
+    def __init__(self, timer=None):
+        """
+        :param timer: `StageTimer`; frames taking the generic path are counted
+                      as items of its `parse_fallback` stage
+        """
+        # m3ua "Protocol data (...)" key of the previous frame and position of the
+        # "TP-Destination-Address - (...)" key among the gsm_sms fields of the
+        # previous MO frame, see `_fast_frame_to_msg`
+        self._m3ua_key = None
+        self._tp_da_position = None
+        self._timer = timer
+
     # ---------- api --------------
     def parse_frame(self, frame) -> Message:
         return self._frame_to_msg(frame)
@@ -44,10 +80,144 @@ class JsonParser:
             yield self._frame_to_msg(f)
 
     def _frame_to_msg(self, frame: dict) -> Message:
+        try:
+            return self._fast_frame_to_msg(frame)
+        except _Fallback:
+            # unusual frame: the generic path gives the result, or its error/warning
+            pass
+        with stage(self._timer, 'parse_fallback', 1):
+            return self._generic_frame_to_msg(frame)
+
+    def _fast_frame_to_msg(self, frame: dict) -> Message:
+        """
+        Table-driven path for the frame shapes of SMS traffic.
+
+        Only the keys the message is built from are read, opcodes and error
+        codes are looked up by their raw string value and the frame is not
+        modified.  Shapes the generic path treats differently (unknown opcodes
+        and RP-DA types, odd result trees, a missing invoke or TP-DA) raise
+        `_Fallback` and are handed to `_generic_frame_to_msg`, so the result is
+        always the same.  A key both paths need is looked up the same way, its
+        error propagates.
+        """
+        layers = frame["_source"]["layers"]
+        frame_layer = layers["frame"]
+        ts_us = epoch_str_to_us(frame_layer["frame.time_epoch"])
+        frame_number = frame_layer.get("frame.number")
+
+        tcap_json = layers["tcap"]
+        for key, tcap_state in _TCAP_ELEMENTS:
+            element = tcap_json.get(key)
+            if element is not None:
+                break
+        else:
+            raise _Fallback
+        tid = element["tcap.tid"]
+
+        component = layers["gsm_map"]["gsm_map.old.Component_tree"]
+        opcode = MsgType.Unknown
+        msisdn = imsi = None
+        if tcap_state is not TCAPState.End:
+            invoke = component.get("gsm_old.invoke_element")
+            opcode_tree = invoke.get("gsm_old.opCode_tree") if invoke is not None else None
+            if opcode_tree is None:
+                raise _Fallback
+            opcode = _OPCODES.get(opcode_tree.get("gsm_old.localValue"))
+            if opcode is None:
+                raise _Fallback
+            if opcode is MsgType.SRI:
+                msisdn = invoke["gsm_map.sm.msisdn_tree"]["e164.msisdn"]
+            elif opcode is MsgType.Forward_SM:
+                if "gsm_map.sm.sm_RP_DA" in invoke:
+                    rp_da, rp_da_tree = invoke["gsm_map.sm.sm_RP_DA"], invoke.get("gsm_map.sm.sm_RP_DA_tree")
+                elif "gsm_old.sm_RP_DA" in invoke:
+                    rp_da, rp_da_tree = invoke["gsm_old.sm_RP_DA"], invoke.get("gsm_old.sm_RP_DA_tree")
+                else:
+                    raise _Fallback
+                if rp_da == _RP_DA_IMSI:
+                    imsi = rp_da_tree.get("e212.imsi")
+                elif rp_da != _RP_DA_SERVICE_CENTRE:
+                    raise _Fallback
+        elif _RETURN_RESULT_LAST_KEY in component:
+            result_element = component[_RETURN_RESULT_LAST_KEY]
+            result_tree = result_element.get("gsm_old.resultretres_element")
+            if result_tree is None:
+                if len(result_element) != 1 or "gsm_old.invokeID" not in result_element:
+                    raise _Fallback
+                opcode = MsgType.ResultLast
+            else:
+                imsi = result_tree.get("e212.imsi")
+                result_opcode = result_tree.get("gsm_old.opCode")
+                if result_opcode is not None:
+                    opcode = _OPCODES.get(result_opcode)
+                    if opcode is None:
+                        raise _Fallback
+        elif _ERROR_TREE_KEY in component:
+            raise _Fallback
+        elif _OLD_ERROR_TREE_KEY in component:
+            opcode = MsgType.Error
+            error_code_tree = component[_OLD_ERROR_TREE_KEY].get("gsm_old.errorCode_tree")
+            imsi = _ERROR_NAMES.get(error_code_tree.get("gsm_old.localValue", "-1"))
+            if imsi is None:
+                raise _Fallback
+        else:
+            opcode = MsgType.ResultLast
+
+        sms_pdu = layers.get("gsm_sms")
+        if sms_pdu is not None:
+            mti = sms_pdu["gsm_sms.tp-mti"]
+            if mti == _MTI_MO:
+                # the key holds the address itself, but tshark puts it at the same place in every frame
+                position = self._tp_da_position
+                key = next(islice(sms_pdu, position, None), "") if position is not None else ""
+                if not key.startswith(_TP_DA_PREFIX):
+                    for position, key in enumerate(sms_pdu):
+                        if key.startswith(_TP_DA_PREFIX):
+                            break
+                    else:
+                        position, key = None, "tp-destination-address"
+                    self._tp_da_position = position
+                destination = sms_pdu.get(key)
+                msisdn = destination.get("gsm_sms.tp-da") if destination is not None else None
+                if msisdn is None:
+                    # the generic path warns about it
+                    raise _Fallback
+            elif mti not in _MTI_OTHER:
+                raise _Fallback
+
+        m3ua_json = layers["m3ua"]
+        m3ua_key = self._m3ua_key
+        if m3ua_key is None or m3ua_key not in m3ua_json:
+            for m3ua_key in m3ua_json:
+                if m3ua_key.startswith("Protocol data"):
+                    break
+            else:
+                m3ua_key = "protocol-data"
+            self._m3ua_key = m3ua_key
+        protocol_data = m3ua_json[m3ua_key]
+        opc = protocol_data.get("m3ua.protocol_data_opc")
+        dpc = protocol_data.get("m3ua.protocol_data_dpc")
+
+        # the fields are set directly: same values and interning as `Message(...)`
+        # without its keyword handling and `__post_init__` per frame
+        message = _new_message(Message)
+        message.ts_us = ts_us
+        message.meta = None
+        message.tcap_state = tcap_state
+        message.tid = tid
+        message.opcode = opcode
+        message.opc = None if opc is None else _intern(opc)
+        message.dpc = None if dpc is None else _intern(dpc)
+        message.frame = int(frame_number) if frame_number is not None else None
+        message.msisdn = msisdn
+        message.imsi = imsi
+        return message
+
+    def _generic_frame_to_msg(self, frame: dict) -> Message:
         layers = frame["_source"]["layers"]
         # generate timestamp
-        ts = float(layers["frame"]["frame.time_epoch"])
-        ts = datetime.fromtimestamp(ts).astimezone(timezone.utc)
+        ts_us = epoch_str_to_us(layers["frame"]["frame.time_epoch"])
+        frame_number = layers["frame"].get("frame.number")
 
         # helpers
         m3ua_json = layers['m3ua']
@@ -61,9 +231,10 @@ class JsonParser:
         tid, tcap_state = self._fill_tcap(tcap_json)
 
         # Initialize message
-        message = Message(time=ts,
+        message = Message(ts_us=ts_us,
                           tid=tid,
-                          tcap_state=tcap_state)
+                          tcap_state=tcap_state,
+                          frame=int(frame_number) if frame_number is not None else None)
 
         #fill_map_part
         message = self._new_fill_gsm_map(gsm_map,message)
@@ -253,3 +424,147 @@ class JsonParser:
         dpc = m3ua_json["protocol-data"].get("m3ua.protocol_data_dpc")
 
         return opc, dpc
+
+
+# ─── tshark `-T fields` projection ──────────────────────────────────────────────
+class ProjectedField(str, Enum):
+    """tshark fields requested with `-e` by the field-projection backend, in column order."""
+    FRAME_NUMBER  = "frame.number"
+    TIME_EPOCH    = "frame.time_epoch"
+    TCAP_OTID     = "tcap.otid"
+    TCAP_DTID     = "tcap.dtid"
+    TCAP_TID      = "tcap.tid"
+    COMPONENT     = "gsm_old.Component"
+    LOCAL_VALUE   = "gsm_old.localValue"
+    RESULT_OPCODE = "gsm_old.opCode"
+    MSISDN        = "e164.msisdn"
+    IMSI          = "e212.imsi"
+    RP_DA         = "gsm_map.sm.sm_RP_DA"
+    OLD_RP_DA     = "gsm_old.sm_RP_DA"
+    TP_MTI        = "gsm_sms.tp-mti"
+    TP_DA         = "gsm_sms.tp-da"
+    OPC           = "m3ua.protocol_data_opc"
+    DPC           = "m3ua.protocol_data_dpc"
+
+
+# values of the `gsm_old.Component` CHOICE
+COMPONENT_INVOKE = 1
+COMPONENT_RETURN_RESULT_LAST = 2
+COMPONENT_RETURN_ERROR = 3
+
+
+class FieldsParser:
+    """
+    Build `Message` objects from flat `tshark -T fields` rows.
+
+    The rows are produced with `-E occurrence=a -E aggregator=,`, so a column holds
+    every occurrence of its field in the frame.  The rules below mirror
+    `JsonParser._frame_to_msg`, which picks the same values out of the full
+    dissection tree, so both backends produce equal messages.
+    """
+    FIELDS = tuple(field.value for field in ProjectedField)
+    AGGREGATOR = ','
+
+    def __init__(self):
+        self._column = {field: i for i, field in enumerate(ProjectedField)}
+
+    # ---------- api --------------
+    def parse_row(self, row: list[str]) -> Message:
+        return self._row_to_msg(row)
+
+    def parse_rows(self, rows: Iterable[list[str]]) -> Iterable[Message]:
+        for row in rows:
+            yield self._row_to_msg(row)
+
+    def parse_line(self, line: str) -> Message:
+        return self._row_to_msg(line.rstrip('\r\n').split('\t'))
+
+    # ---------- helpers ----------
+    def _get(self, row: list[str], field: ProjectedField, last=False) -> str | None:
+        """Return the first (or the last) occurrence of a field, None if it is absent."""
+        idx = self._column[field]
+        if idx >= len(row) or not row[idx]:
+            return None
+        values = row[idx].split(self.AGGREGATOR)
+        return values[-1] if last else values[0]
+
+    def _row_to_msg(self, row: list[str]) -> Message:
+        ts_us = epoch_str_to_us(self._get(row, ProjectedField.TIME_EPOCH))
+
+        # Begin carries only otid, End only dtid, Continue both. JsonParser takes
+        # the last `tcap.tid` of the element, i.e. dtid for Continue.
+        has_otid = self._get(row, ProjectedField.TCAP_OTID) is not None
+        has_dtid = self._get(row, ProjectedField.TCAP_DTID) is not None
+        if has_otid and has_dtid:
+            tcap_state = TCAPState.Continue
+        elif has_otid:
+            tcap_state = TCAPState.Begin
+        elif has_dtid:
+            tcap_state = TCAPState.End
+        else:
+            raise RuntimeError(f"Cound't parse TCAP info. row: {row}")
+
+        frame_number = self._get(row, ProjectedField.FRAME_NUMBER)
+        message = Message(ts_us=ts_us,
+                          tid=self._get(row, ProjectedField.TCAP_TID, last=True),
+                          tcap_state=tcap_state,
+                          frame=int(frame_number) if frame_number is not None else None)
+
+        message = self._fill_gsm_map(row, message)
+
+        mti = self._get(row, ProjectedField.TP_MTI)
+        if mti is not None and MessageTypeIndicator(int(mti)) == MessageTypeIndicator.MO:
+            message.msisdn = self._get(row, ProjectedField.TP_DA, last=True)
+
+        message.opc = self._get(row, ProjectedField.OPC)
+        message.dpc = self._get(row, ProjectedField.DPC)
+        return message
+
+    def _fill_gsm_map(self, row: list[str], msg: Message) -> Message:
+        component = self._get(row, ProjectedField.COMPONENT)
+        component = int(component) if component is not None else None
+
+        match msg.tcap_state:
+            case TCAPState.Begin | TCAPState.Continue:
+                local_value = self._get(row, ProjectedField.LOCAL_VALUE)
+                if component != COMPONENT_INVOKE or local_value is None:
+                    raise RuntimeError(f'gsm_invoke, {row}')
+
+                msg.opcode = MsgType(int(local_value))
+                match msg.opcode:
+                    case MsgType.SRI:
+                        # a repeated key of tshark's JSON is read back as its last value
+                        msg.msisdn = self._get(row, ProjectedField.MSISDN, last=True)
+                    case MsgType.Forward_SM:
+                        self._rp_da_based_fill(row, msg)
+
+            case TCAPState.End:
+                if component == COMPONENT_RETURN_RESULT_LAST:
+                    opcode = self._get(row, ProjectedField.RESULT_OPCODE)
+                    if opcode is None:
+                        # possibly just a good empty response
+                        msg.opcode = MsgType.ResultLast
+                    else:
+                        msg.imsi = self._get(row, ProjectedField.IMSI, last=True)
+                        msg.opcode = MsgType(int(opcode))
+                elif component == COMPONENT_RETURN_ERROR:
+                    msg.opcode = MsgType.Error
+                    err_code = self._get(row, ProjectedField.LOCAL_VALUE) or '-1'
+                    msg.imsi = f"{ErrorCode(int(err_code)).name}"
+                else:
+                    msg.opcode = MsgType.ResultLast
+
+        return msg
+
+    def _rp_da_based_fill(self, row: list[str], msg: Message) -> Message:
+        rp_da_val = self._get(row, ProjectedField.RP_DA)
+        if rp_da_val is None:
+            rp_da_val = self._get(row, ProjectedField.OLD_RP_DA)
+        if rp_da_val is None:
+            return msg
+
+        rp_da = RPDestinationAddress(int(rp_da_val))
+        if rp_da == RPDestinationAddress.IMSI:
+            # SCCP addresses precede the MAP layer, the RP-DA IMSI is the last one
+            msg.imsi = self._get(row, ProjectedField.IMSI, last=True)
+        return msg
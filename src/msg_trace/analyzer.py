@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from .msgstore import MessageStore, Message
 from .models import MsgType
 
@@ -5,6 +7,7 @@ from .models import MsgType
 class MessageChain(object):
     def __init__(self, msgstore: MessageStore, msisdn: str):
         self._chain = []
+        self._sorted_chain = None
         self._msg_store = msgstore
         self._desired_msisdn = msisdn
         self.__messages_by_msisdn = []
@@ -24,9 +27,12 @@ class MessageChain(object):
     def fill_chain(self, *args):
         for list_ in args:
             self._chain.extend(list_)
+        self._sorted_chain = None
 
     def get_chain(self):
-        return sorted(self._chain, key=lambda msg: msg.time)
+        if self._sorted_chain is None:
+            self._sorted_chain = sorted(self._chain, key=lambda msg: msg.ts_us)
+        return list(self._sorted_chain)
 
     """ 
     1. Search all messages with msisdn info. Possible variants (SRI or Mo-ForwardSM)
@@ -69,7 +75,96 @@ class MessageChain(object):
 
     @staticmethod
     def sort_by_datetime( _list: list[Message]|set[Message]) -> list|tuple:
-        return sorted(_list, key=lambda msg: msg.time)
+        return sorted(_list, key=lambda msg: msg.ts_us)
+
+
+class ImsiMessageChain(MessageChain):
+    """
+    Chain of a subscriber traced from its IMSI instead of its MSISDN.
 
+    The indexes are walked backwards, every step is a `by_imsi`/`by_tid`
+    lookup:
+
+    1. Forward_SM / MT_Forward_SM to the IMSI and their results by tid
+    2. SRI results carrying the IMSI
+    3. the SRI / MO_Forward_SM those results answer, by tid, and all
+       responses of these dialogues
+
+    The chain holds the same messages as `MessageChain` does for the
+    subscriber's MSISDN, the deliveries themselves are only followed.
+    """
 
+    def __init__(self, msgstore: MessageStore, imsi: str):
+        super().__init__(msgstore, None)
+        self._desired_imsi = imsi
 
+    def build(self):
+        messages_by_imsi = self._msg_store.by_imsi(self._desired_imsi)
+        # deliveries to the IMSI and their results
+        fsm = self.sort_by_datetime(msg for msg in messages_by_imsi
+                                    if msg.opcode == MsgType.Forward_SM or msg.opcode == MsgType.MT_Forward_SM)
+        fsm_resp = self._get_forward_sm_resp(fsm)
+        # results that brought the IMSI, back to the requests they answer
+        delivery_tids = {msg.tid for msg in fsm}
+        imsi_resp = [msg for msg in messages_by_imsi
+                     if msg.opcode == MsgType.ResultLast and msg.tid not in delivery_tids]
+        requests = self._get_requests_by_tid(imsi_resp)
+        sri_resp, mo_resp_list = self._get_messages_by_tid(requests)
+        # a result whose request is outside of the dumps still belongs to the chain
+        resp = set(imsi_resp).union(sri_resp, mo_resp_list)
+
+        self.fill_chain(requests, self.sort_by_datetime(resp), fsm_resp)
+
+    def _get_requests_by_tid(self, messages: list[Message]) -> list:
+        requests = set()
+        for msg in messages:
+            result = [req for req in self._msg_store.by_tid(msg.tid) if req.opcode == MsgType.SRI or req.opcode == MsgType.MO_Forward_SM]
+            requests.update(result)
+        return self.sort_by_datetime(requests)
+
+
+class _SharedLookups:
+    """
+    Store proxy that remembers `by_tid`/`by_imsi` results.
+
+    Chains of different subscribers meet on the same dialogues and IMSIs
+    (shared SMSCs, multi-part messages, retries), so every tid or imsi is
+    looked up in the store only once for the whole bulk run.
+    """
+
+    def __init__(self, msgstore: MessageStore):
+        self._msg_store = msgstore
+        self._by_tid: dict[str, list[Message]] = {}
+        self._by_imsi: dict[str, list[Message]] = {}
+
+    def by_msisdn(self, num: str) -> list[Message]:
+        return self._msg_store.by_msisdn(num)
+
+    def by_tid(self, tid: str) -> list[Message]:
+        result = self._by_tid.get(tid)
+        if result is None:
+            result = self._by_tid[tid] = self._msg_store.by_tid(tid)
+        return result
+
+    def by_imsi(self, imsi: str) -> list[Message]:
+        result = self._by_imsi.get(imsi)
+        if result is None:
+            result = self._by_imsi[imsi] = self._msg_store.by_imsi(imsi)
+        return result
+
+
+def build_chains(msgstore: MessageStore, msisdns: Iterable[str]) -> dict[str, list[Message]]:
+    """
+    Build the chain of every msisdn over one loaded store.
+
+    Index lookups are shared between subscribers; the result maps msisdn to
+    its time-ordered chain in the order the numbers were given (duplicates
+    are traced once).
+    """
+    lookups = _SharedLookups(msgstore)
+    chains = {}
+    for msisdn in dict.fromkeys(msisdns):
+        message_chain = MessageChain(lookups, msisdn)
+        message_chain.build()
+        chains[msisdn] = message_chain.get_chain()
+    return chains
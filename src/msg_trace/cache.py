@@ -0,0 +1,252 @@
+"""
+On-disk cache of parsed messages per pcap file.
+
+Every cache entry is a pair of files in the cache directory (by default
+`.msg_trace_cache/` next to the dump):
+
+    <pcap name>.<entry id>.meta.json   file identity and the extracted window
+    <pcap name>.<entry id>.msgs        parsed messages in the binary format below
+
+    .meta.json:
+    { "file": "packets-2025-05-16.pcapng",
+      "identity": [size, mtime_ns, inode],
+      "since": 1747353600.0,            # epoch, null = from the first packet
+      "to": null,                       # epoch, null = up to the last packet
+      "count": 12345,
+      "version": 3 }                    # CACHE_VERSION, other entries are dropped
+
+A request for a `since`/`to` window is served from any entry of the same
+unchanged file whose window contains it; the cached messages are filtered by
+time instead of running tshark again.
+"""
+import json
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
+
+from . import pcapfile
+from .models import Message, MsgType, TCAPState
+
+CACHE_DIR_NAME = '.msg_trace_cache'
+
+# ─── binary message format ──────────────────────────────────────────────────────
+# segment: magic, record count, string count, string table, records
+# string:  u16 length + utf-8 bytes
+# record:  time (epoch µs), tcap_state, opcode, frame number, string refs of tid, opc, dpc, msisdn, imsi
+#
+# Older segments are not read: MTC1 has no frame numbers, MTC2 numbers the
+# frames among those that passed the -R time window, not within the dump.
+SEGMENT_MAGIC = b'MTC3'
+CACHE_VERSION = 3
+_OUTDATED_MAGICS = (b'MTC1', b'MTC2')
+_SEGMENT_HEADER = struct.Struct('<4sII')
+_STRING_LEN = struct.Struct('<H')
+_RECORD = struct.Struct('<qbhiiiiii')
+_NONE = -1
+_NONE_OPCODE = -32768
+
+
+def write_messages(fh: BinaryIO, messages: Iterable[Message]) -> int:
+    """Write messages as one binary segment, return the number of records."""
+    strings: dict[str, int] = {}
+
+    def ref(value) -> int:
+        if value is None:
+            return _NONE
+        return strings.setdefault(str(value), len(strings))
+
+    records = []
+    for msg in messages:
+        records.append(_RECORD.pack(
+            msg.ts_us,
+            msg.tcap_state.value if msg.tcap_state is not None else _NONE,
+            msg.opcode.value if msg.opcode is not None else _NONE_OPCODE,
+            msg.frame if msg.frame is not None else _NONE,
+            ref(msg.tid), ref(msg.opc), ref(msg.dpc), ref(msg.msisdn), ref(msg.imsi),
+        ))
+
+    fh.write(_SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(records), len(strings)))
+    for string in strings:
+        encoded = string.encode()
+        fh.write(_STRING_LEN.pack(len(encoded)))
+        fh.write(encoded)
+    fh.write(b''.join(records))
+    return len(records)
+
+
+def skip_messages(fh: BinaryIO) -> bool:
+    """Move past one segment written by `write_messages` without decoding it, False at the end of the file."""
+    header = fh.read(_SEGMENT_HEADER.size)
+    if not header:
+        return False
+    if len(header) < _SEGMENT_HEADER.size:
+        raise ValueError('truncated message segment header')
+    magic, n_records, n_strings = _SEGMENT_HEADER.unpack(header)
+    if magic != SEGMENT_MAGIC:
+        raise ValueError(f'bad message segment magic {magic!r}')
+    for _ in range(n_strings):
+        (length,) = _STRING_LEN.unpack(fh.read(_STRING_LEN.size))
+        fh.seek(length, os.SEEK_CUR)
+    fh.seek(_RECORD.size * n_records, os.SEEK_CUR)
+    return True
+
+
+def read_messages(fh: BinaryIO) -> Optional[list[Message]]:
+    """Read one segment written by `write_messages`, None at the end of the file."""
+    header = fh.read(_SEGMENT_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _SEGMENT_HEADER.size:
+        raise ValueError('truncated message segment header')
+    magic, n_records, n_strings = _SEGMENT_HEADER.unpack(header)
+    if magic in _OUTDATED_MAGICS:
+        raise ValueError(f'outdated message segment {magic!r}')
+    if magic != SEGMENT_MAGIC:
+        raise ValueError(f'bad message segment magic {magic!r}')
+
+    strings = []
+    for _ in range(n_strings):
+        (length,) = _STRING_LEN.unpack(fh.read(_STRING_LEN.size))
+        strings.append(fh.read(length).decode())
+
+    def deref(idx: int):
+        return None if idx == _NONE else strings[idx]
+
+    data = fh.read(_RECORD.size * n_records)
+    if len(data) != _RECORD.size * n_records:
+        raise ValueError('truncated message segment')
+
+    messages = []
+    for ts_us, state, opcode, frame, tid, opc, dpc, msisdn, imsi in _RECORD.iter_unpack(data):
+        messages.append(Message(ts_us=ts_us,
+                                frame=frame if frame != _NONE else None,
+                                tcap_state=TCAPState(state) if state != _NONE else None,
+                                tid=deref(tid),
+                                opcode=MsgType(opcode) if opcode != _NONE_OPCODE else None,
+                                opc=deref(opc),
+                                dpc=deref(dpc),
+                                msisdn=deref(msisdn),
+                                imsi=deref(imsi)))
+    return messages
+
+
+# ─── cache ──────────────────────────────────────────────────────────────────────
+class MessageCache:
+    """Window-aware cache of parsed messages keyed by pcap file identity."""
+
+    def __init__(self, cache_dir: Path = None):
+        """
+        :param cache_dir: directory for all entries; by default `.msg_trace_cache`
+                          next to every pcap file
+        """
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+
+    # ---------- public API ----------
+    def get(self, pcap_path: Path, since: float, to: float) -> Optional[list[Message]]:
+        """Return messages of the file within [since, to] or None on a cache miss."""
+        pcap_path = Path(pcap_path)
+        identity = self._identity(pcap_path)
+        best = None
+        for meta_path in self._dir(pcap_path).glob(f'{pcap_path.name}.*.meta.json'):
+            meta = self._read_meta(meta_path)
+            if meta is None or meta.get("file") != pcap_path.name:
+                continue
+            if meta.get("identity") != identity or meta.get("version") != CACHE_VERSION:
+                # the dump was rewritten or the entry was written by an older
+                # version, it will never match again
+                self._remove(meta_path)
+                continue
+            if self._covers(meta, since, to) and (best is None or meta["count"] < best[1]["count"]):
+                best = meta_path, meta
+
+        if best is None:
+            return None
+        try:
+            with open(self._msgs_path(best[0]), 'rb') as fh:
+                messages = read_messages(fh) or []
+        except (OSError, ValueError) as e:
+            print(f'[WARNING] dropping broken cache entry {best[0]}: {e}')
+            self._remove(best[0])
+            return None
+
+        since_us, to_us = since * 1_000_000, to * 1_000_000
+        return [msg for msg in messages if since_us <= msg.ts_us <= to_us]
+
+    def put(self, pcap_path: Path, since: float, to: float, messages: list[Message]):
+        """Store messages extracted from the file for the [since, to] window."""
+        pcap_path = Path(pcap_path)
+        cache_dir = self._dir(pcap_path)
+        since, to = self._clamp_to_file(pcap_path, since, to)
+        entry = f'{pcap_path.name}.{self._fmt_bound(since)}-{self._fmt_bound(to)}'
+        meta_path = cache_dir / f'{entry}.meta.json'
+        meta = {
+            "file": pcap_path.name,
+            "identity": self._identity(pcap_path),
+            "since": since,
+            "to": to,
+            "count": len(messages),
+            "version": CACHE_VERSION,
+        }
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            msgs_path = self._msgs_path(meta_path)
+            with open(msgs_path.with_name(msgs_path.name + '.tmp'), 'wb') as fh:
+                write_messages(fh, messages)
+            os.replace(msgs_path.with_name(msgs_path.name + '.tmp'), msgs_path)
+            # meta goes last: an entry without meta is never read
+            with open(meta_path.with_name(meta_path.name + '.tmp'), 'w') as fh:
+                json.dump(meta, fh)
+            os.replace(meta_path.with_name(meta_path.name + '.tmp'), meta_path)
+        except OSError as e:
+            print(f'[WARNING] could not write cache entry {meta_path}: {e}')
+
+    # ---------- helpers ----------
+    def _dir(self, pcap_path: Path) -> Path:
+        return self._cache_dir or pcap_path.parent / CACHE_DIR_NAME
+
+    @staticmethod
+    def _msgs_path(meta_path: Path) -> Path:
+        return meta_path.with_name(meta_path.name[:-len('.meta.json')] + '.msgs')
+
+    @staticmethod
+    def _identity(pcap_path: Path) -> list[int]:
+        stat = pcap_path.stat()
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    @staticmethod
+    def _covers(meta: dict, since: float, to: float) -> bool:
+        return ((meta["since"] is None or meta["since"] <= since) and
+                (meta["to"] is None or to <= meta["to"]))
+
+    @staticmethod
+    def _clamp_to_file(pcap_path: Path, since: float, to: float) -> tuple[Optional[float], Optional[float]]:
+        """Open the window ends that lie beyond the file, so any later window over them hits."""
+        try:
+            bounds = pcapfile.read_bounds(pcap_path)
+        except (OSError, ValueError):
+            return since, to
+        if bounds.ts_start is None or since <= bounds.ts_start:
+            since = None
+        if bounds.ts_end is None or to >= bounds.ts_end:
+            to = None
+        return since, to
+
+    @staticmethod
+    def _fmt_bound(bound: Optional[float]) -> str:
+        return 'x' if bound is None else f'{bound:.6f}'
+
+    @staticmethod
+    def _read_meta(meta_path: Path) -> Optional[dict]:
+        try:
+            with open(meta_path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, meta_path: Path):
+        for path in (meta_path, self._msgs_path(meta_path)):
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,108 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+from .capinfo import CapInfo
+
+INDEX_FILE_NAME = '.capinfo_index.json'
+INDEX_VERSION = 1
+
+
+class CapInfoIndex:
+    """
+    Sidecar metadata index of the dump folder.
+
+    Keeps frames, ts_start and ts_end of every probed pcap so that unchanged
+    files are not passed to capinfos again on the next start.  An entry is
+    valid only while the file keeps the same size, mtime and inode; rotated or
+    rewritten files are probed again and entries of vanished files are dropped
+    by `prune`.
+
+    Index layout::
+
+        {"version": 1,
+         "files": {"<path relative to folder>": {"identity": [size, mtime_ns, inode],
+                                                  "frames": ..., "ts_start": ..., "ts_end": ...}}}
+    """
+
+    def __init__(self, folder: Path, file_name: str = INDEX_FILE_NAME):
+        self._folder = Path(folder)
+        self._path = self._folder / file_name
+        self._entries: dict[str, dict] = {}
+        self._dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---------- public API ----------
+    def load(self):
+        try:
+            with open(self._path) as index_file:
+                data = json.load(index_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f'[WARNING] ignoring unreadable index {self._path}: {e}')
+            return
+
+        if data.get("version") != INDEX_VERSION:
+            return
+        self._entries = data.get("files", {})
+
+    def get(self, file_path: Path, stat: os.stat_result = None) -> Optional[CapInfo]:
+        """Return cached CapInfo for the file, None if it is unknown or has changed."""
+        entry = self._entries.get(self._key(file_path))
+        if entry is None:
+            return None
+        stat = stat or file_path.stat()
+        if entry.get("identity") != self._identity(stat):
+            return None
+        return CapInfo.from_dict(file_path, entry)
+
+    def put(self, info: CapInfo, stat: os.stat_result = None):
+        stat = stat or info.filepath.stat()
+        entry = info.to_dict()
+        entry["identity"] = self._identity(stat)
+        self._entries[self._key(info.filepath)] = entry
+        self._dirty = True
+
+    def prune(self, existing: set[Path], unvisited: Iterable[Path] = ()):
+        """
+        Forget files that are no longer in the folder.
+
+        :param existing: every file found
+        :param unvisited: subfolders that were not searched, their entries are kept
+        """
+        keep = {self._key(p) for p in existing}
+        prefixes = tuple(self._key(p) + os.sep for p in unvisited)
+        for key in [k for k in self._entries if k not in keep and not k.startswith(prefixes)]:
+            del self._entries[key]
+            self._dirty = True
+
+    def save(self):
+        """Atomically write the index if it has changed."""
+        if not self._dirty:
+            return
+        tmp_path = self._path.with_name(self._path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w') as index_file:
+                json.dump({"version": INDEX_VERSION, "files": self._entries}, index_file)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            # read-only archive: keep working without the index
+            print(f'[WARNING] could not write index {self._path}: {e}')
+            return
+        self._dirty = False
+
+    # ---------- helpers ----------
+    def _key(self, file_path: Path) -> str:
+        file_path = Path(file_path)
+        try:
+            return str(file_path.relative_to(self._folder))
+        except ValueError:
+            return str(file_path.absolute())
+
+    @staticmethod
+    def _identity(stat: os.stat_result) -> list[int]:
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
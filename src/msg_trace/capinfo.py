@@ -1,6 +1,7 @@
 import subprocess
 from pathlib import Path
 from datetime import datetime
+from . import pcapfile
 
 class CapInfo:
     def __init__(self, filepath):
@@ -42,6 +43,46 @@ class CapInfo:
 
         return obj
 
+    @classmethod
+    def from_file(cls, pcap_path, count_frames=False):
+        """
+        Create a CapInfo instance by reading pcap/pcapng headers directly, without capinfos.
+        :param pcap_path:
+        :param count_frames: walk all records to fill `frames`, otherwise it stays None
+        :return: CapInfo
+        :raises ValueError: unknown capture file format
+        """
+        obj = cls(pcap_path)
+        bounds = pcapfile.read_bounds(obj.filepath, count_frames=count_frames)
+
+        obj.frames = bounds.frames
+        if bounds.ts_start is not None:
+            obj.ts_start = datetime.fromtimestamp(bounds.ts_start)
+            obj.ts_end = datetime.fromtimestamp(bounds.ts_end)
+            obj.duration = obj.ts_end - obj.ts_start
+
+        return obj
+
+    def to_dict(self) -> dict:
+        """Serializable form used by the metadata index. Timestamps are epoch seconds."""
+        return {
+            "frames": self.frames,
+            "ts_start": self.ts_start.timestamp() if self.ts_start else None,
+            "ts_end": self.ts_end.timestamp() if self.ts_end else None,
+        }
+
+    @classmethod
+    def from_dict(cls, pcap_path, data: dict):
+        obj = cls(pcap_path)
+        obj.frames = data.get("frames")
+        if data.get("ts_start") is not None:
+            obj.ts_start = datetime.fromtimestamp(data["ts_start"])
+        if data.get("ts_end") is not None:
+            obj.ts_end = datetime.fromtimestamp(data["ts_end"])
+        if obj.ts_start and obj.ts_end:
+            obj.duration = obj.ts_end - obj.ts_start
+        return obj
+
     def __repr__(self):
         # Show only file name not full path -> filepath.name
         return f'<CapInfos({self.filepath.name}), {self.frames=} {self.ts_start=} {self.ts_end=}>'
@@ -0,0 +1,263 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from .models import Message, MsgType, TCAPState, datetime_to_us
+
+try:
+    import numpy as np
+except ImportError:
+    # vectorized masks are used when numpy is available, plain loops otherwise
+    np = None
+
+_NONE = -1
+_NONE_OPCODE = -32768
+_OPCODES = {member.value: member for member in MsgType}
+_STATES = {member.value: member for member in TCAPState}
+
+
+class _Dictionary:
+    """Dictionary encoding of a string column: value <-> dense integer code."""
+
+    def __init__(self):
+        self.codes: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def encode(self, value) -> int:
+        if value is None:
+            return _NONE
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value) -> int:
+        """Code of an existing value, None if the value never occurred."""
+        if value is None:
+            return _NONE
+        return self.codes.get(value)
+
+    def decode(self, code: int):
+        return None if code == _NONE else self.values[code]
+
+
+class ColumnarMessageStore:
+    """
+    Column-oriented alternative to `MessageStore`.
+
+    Times, frame numbers, TCAP states and opcodes live in typed arrays; tid,
+    point codes, msisdn and imsi are dictionary-encoded into integer code
+    arrays.  Range
+    and attribute queries (`select`) run as vectorized masks over the columns
+    when numpy is installed.  `by_tid`/`by_msisdn`/`by_imsi` use a compact
+    posting index (row numbers ordered by code plus per-code offsets) built
+    lazily on the first lookup after new rows were added.  All queries return
+    the same `Message` objects as `MessageStore`, materialized only for the
+    matching rows.
+    """
+
+    def __init__(self):
+        self._ts = array('q')
+        self._tcap_state = array('b')
+        self._opcode = array('h')
+        self._tid = array('i')
+        self._opc = array('i')
+        self._dpc = array('i')
+        self._msisdn = array('i')
+        self._imsi = array('i')
+        self._frame = array('i')
+        self._source = array('i')
+
+        self._tid_dict = _Dictionary()
+        self._pc_dict = _Dictionary()  # shared by opc and dpc
+        self._msisdn_dict = _Dictionary()
+        self._imsi_dict = _Dictionary()
+        self._source_dict = _Dictionary()  # CapInfo objects of the source dumps
+
+        # column -> (row numbers ordered by code, offsets of every code in them)
+        self._postings: dict[int, tuple[array, array]] = {}
+        # row numbers ordered by time, maintained like MessageStore._time_order
+        self._time_order = array('q')
+        self._time_order_valid = True
+
+    def __len__(self):
+        return len(self._ts)
+
+    def add(self, msg: Message):
+        if self._time_order_valid:
+            if not self._time_order or self._ts[-1] <= msg.ts_us:
+                self._time_order.append(len(self._ts))
+            else:
+                self._time_order_valid = False
+        self._ts.append(msg.ts_us)
+        self._tcap_state.append(msg.tcap_state.value if msg.tcap_state is not None else _NONE)
+        self._opcode.append(msg.opcode.value if msg.opcode is not None else _NONE_OPCODE)
+        self._opc.append(self._pc_dict.encode(msg.opc))
+        self._dpc.append(self._pc_dict.encode(msg.dpc))
+        self._tid.append(self._tid_dict.encode(msg.tid))
+        self._msisdn.append(self._msisdn_dict.encode(msg.msisdn))
+        self._imsi.append(self._imsi_dict.encode(msg.imsi))
+        self._frame.append(msg.frame if msg.frame is not None else _NONE)
+        self._source.append(self._source_dict.encode(msg.meta))
+        if self._postings:
+            self._postings.clear()
+
+    def extend(self, messages: Iterable[Message]):
+        for msg in messages:
+            self.add(msg)
+
+    # ---------- queries ----------
+    def by_tid(self, tid: str) -> list[Message]:
+        return self._lookup(self._tid, self._tid_dict, tid)
+
+    def by_msisdn(self, num: str) -> list[Message]:
+        return self._lookup(self._msisdn, self._msisdn_dict, num)
+
+    def by_imsi(self, imsi: str) -> list[Message]:
+        return self._lookup(self._imsi, self._imsi_dict, imsi)
+
+    def by_opcode(self, opcode: MsgType) -> list[Message]:
+        return self.select(opcode=opcode)
+
+    def filter_all(self) -> Iterator[Message]:
+        for idx in range(len(self._ts)):
+            yield self._row(idx)
+
+    def sort_by_datetime(self) -> list[Message]:
+        return list(self.iter_sorted())
+
+    def iter_sorted(self) -> Iterator[Message]:
+        for idx in self._ordered():
+            yield self._row(idx)
+
+    def between(self, since: datetime | int, to: datetime | int) -> list[Message]:
+        """Messages with since <= time <= to in time order; bounds are datetimes or epoch microseconds."""
+        if isinstance(since, datetime):
+            since = datetime_to_us(since)
+        if isinstance(to, datetime):
+            to = datetime_to_us(to)
+        order = self._ordered()
+        lo = bisect_left(order, since, key=self._ts.__getitem__)
+        hi = bisect_right(order, to, lo=lo, key=self._ts.__getitem__)
+        return [self._row(idx) for idx in order[lo:hi]]
+
+    def select(self, since: int = None, to: int = None, opcode: Optional[MsgType] = None,
+               tcap_state: Optional[TCAPState] = None, opc=None, dpc=None) -> list[Message]:
+        """
+        Messages matching all given conditions, in insertion order.
+
+        :param since: lower bound of `ts_us`, inclusive
+        :param to: upper bound of `ts_us`, inclusive
+        """
+        return [self._row(idx) for idx in self.select_rows(since, to, opcode, tcap_state, opc, dpc)]
+
+    def select_rows(self, since: int = None, to: int = None, opcode: Optional[MsgType] = None,
+                    tcap_state: Optional[TCAPState] = None, opc=None, dpc=None) -> list[int]:
+        """Row numbers matching all given conditions, see `select`."""
+        conditions = []
+        if opcode is not None:
+            conditions.append((self._opcode, '==', opcode.value))
+        if tcap_state is not None:
+            conditions.append((self._tcap_state, '==', tcap_state.value))
+        for column, value in ((self._opc, opc), (self._dpc, dpc)):
+            if value is not None:
+                code = self._pc_dict.lookup(value)
+                if code is None:
+                    return []
+                conditions.append((column, '==', code))
+        if since is not None:
+            conditions.append((self._ts, '>=', since))
+        if to is not None:
+            conditions.append((self._ts, '<=', to))
+
+        if np is not None:
+            return self._select_vectorized(conditions)
+        return self._select_loop(conditions)
+
+    # ---------- helpers ----------
+    def _ordered(self) -> array:
+        if not self._time_order_valid:
+            if np is not None and len(self._ts):
+                order = np.argsort(np.frombuffer(self._ts, dtype='q'), kind='stable')
+                self._time_order = array('q', order.astype('q').tobytes())
+            else:
+                self._time_order = array('q', sorted(range(len(self._ts)), key=self._ts.__getitem__))
+            self._time_order_valid = True
+        return self._time_order
+
+    def _select_vectorized(self, conditions) -> list[int]:
+        mask = np.ones(len(self._ts), dtype=bool)
+        for column, op, value in conditions:
+            view = np.frombuffer(column, dtype=column.typecode) if len(column) else np.empty(0)
+            if op == '==':
+                mask &= view == value
+            elif op == '>=':
+                mask &= view >= value
+            else:
+                mask &= view <= value
+        return np.flatnonzero(mask).tolist()
+
+    def _select_loop(self, conditions) -> list[int]:
+        rows = range(len(self._ts))
+        for column, op, value in conditions:
+            if op == '==':
+                rows = [i for i in rows if column[i] == value]
+            elif op == '>=':
+                rows = [i for i in rows if column[i] >= value]
+            else:
+                rows = [i for i in rows if column[i] <= value]
+        return list(rows)
+
+    def _lookup(self, column: array, dictionary: _Dictionary, value) -> list[Message]:
+        # falsy values are not indexed, same as in MessageStore
+        code = dictionary.lookup(value) if value else None
+        if code is None:
+            return []
+        rows, offsets = self._posting_index(column, len(dictionary.values))
+        return [self._row(idx) for idx in rows[offsets[code]:offsets[code + 1]]]
+
+    def _posting_index(self, column: array, n_codes: int) -> tuple[array, array]:
+        index = self._postings.get(id(column))
+        if index is not None:
+            return index
+
+        if np is not None:
+            codes = np.frombuffer(column, dtype=column.typecode) if len(column) else np.empty(0, dtype=column.typecode)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(n_codes + 1))
+            rows = array('q', order.astype('q').tobytes())
+            offsets = array('q', bounds.astype('q').tobytes())
+        else:
+            counts = [0] * (n_codes + 1)
+            for code in column:
+                if code != _NONE:
+                    counts[code + 1] += 1
+            offsets = array('q', counts)
+            for code in range(n_codes):
+                offsets[code + 1] += offsets[code]
+            rows = array('q', bytes(8 * offsets[n_codes]))
+            fill = array('q', offsets)
+            for idx, code in enumerate(column):
+                if code != _NONE:
+                    rows[fill[code]] = idx
+                    fill[code] += 1
+
+        self._postings[id(column)] = rows, offsets
+        return rows, offsets
+
+    def _row(self, idx: int) -> Message:
+        state = self._tcap_state[idx]
+        opcode = self._opcode[idx]
+        frame = self._frame[idx]
+        return Message(ts_us=self._ts[idx],
+                       frame=frame if frame != _NONE else None,
+                       meta=self._source_dict.decode(self._source[idx]),
+                       tcap_state=_STATES[state] if state != _NONE else None,
+                       tid=self._tid_dict.decode(self._tid[idx]),
+                       opcode=_OPCODES[opcode] if opcode != _NONE_OPCODE else None,
+                       opc=self._pc_dict.decode(self._opc[idx]),
+                       dpc=self._pc_dict.decode(self._dpc[idx]),
+                       msisdn=self._msisdn_dict.decode(self._msisdn[idx]),
+                       imsi=self._imsi_dict.decode(self._imsi[idx]))
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from .models import Message, MsgType, TCAPState
+
+_REQUESTS = (MsgType.SRI, MsgType.MO_Forward_SM)
+_DELIVERIES = (MsgType.Forward_SM, MsgType.MT_Forward_SM)
+_RESPONSES = (MsgType.ResultLast, MsgType.Error)
+
+
+class CorrelatedChain(NamedTuple):
+    """Messages of one subscriber's activity, time-ordered; complete is False if it ended with a dialogue or delivery pending."""
+    msisdn: str
+    messages: list[Message]
+    complete: bool
+
+
+@dataclass(slots=True)
+class _OpenChain:
+    msisdn: str
+    last_us: int
+    messages: list[Message] = field(default_factory=list)
+    tids: set[str] = field(default_factory=set)    # dialogues waiting for a response
+    imsis: set[str] = field(default_factory=set)   # IMSIs whose deliveries belong to the chain
+    timed_out: bool = False
+
+
+class DialogueCorrelator:
+    """
+    Incremental counterpart of `MessageChain.build`.
+
+    Messages are fed one by one in capture order, e.g. straight from
+    `TsharkExtractor.scan`, and are correlated with the same links:
+
+    * SRI / MO_Forward_SM carrying an MSISDN open a dialogue of that subscriber
+    * ResultLast / Error with the dialogue's tid are its responses; an SRI
+      result also brings the IMSI
+    * Forward_SM / MT_Forward_SM to that IMSI open delivery dialogues, whose
+      ResultLast closes them and settles the IMSI
+
+    A subscriber's chain is emitted as soon as its last dialogue ends with no
+    IMSI still waiting for a delivery, or when nothing happened to it for `ttl`
+    seconds of capture time; open dialogues are then dropped and the chain is
+    marked incomplete, as is a chain `flush` emits while it still waits for a
+    response or a delivery.  Capture time only advances with `feed`, a caller on a
+    quiet link advances it with `flush(now_us)`.
+    Only open chains and dialogues are kept, so memory depends on the traffic
+    in flight rather than on the size of the dumps.
+    """
+
+    def __init__(self, msisdns: Optional[Iterable[str]] = None, ttl: float = 30.0):
+        """
+        :param msisdns: subscribers to trace, None traces everyone
+        :param ttl: seconds of capture time a chain may stay idle
+        """
+        self._msisdns = set(msisdns) if msisdns is not None else None
+        self._ttl_us = int(ttl * 1_000_000)
+        # msisdn -> chain, least recently active first
+        self._chains: OrderedDict[str, _OpenChain] = OrderedDict()
+        # tid -> chain, request opcode, IMSI of a delivery
+        self._dialogues: dict[str, tuple[_OpenChain, MsgType, Optional[str]]] = {}
+        self._imsis: dict[str, _OpenChain] = {}
+        self._now_us = 0
+
+    def __len__(self):
+        """Number of open dialogues."""
+        return len(self._dialogues)
+
+    # ---------- public API ----------
+    def feed(self, msg: Message) -> list[CorrelatedChain]:
+        """Correlate one message, return the chains it completed or timed out."""
+        self._now_us = max(self._now_us, msg.ts_us)
+        done = self._expire()
+
+        if msg.opcode in _REQUESTS and msg.msisdn:
+            if self._msisdns is None or msg.msisdn in self._msisdns:
+                chain = self._chain_of(msg.msisdn)
+                chain.messages.append(msg)
+                self._open(chain, msg, None)
+        elif msg.opcode in _DELIVERIES and msg.imsi in self._imsis:
+            chain = self._imsis[msg.imsi]
+            self._touch(chain)
+            # followed for its result, the delivery itself is not part of the chain
+            self._open(chain, msg, msg.imsi)
+        elif msg.opcode in _RESPONSES and msg.tid in self._dialogues:
+            chain, request, imsi = self._dialogues[msg.tid]
+            # MO_Forward_SM and Forward_SM share an opcode, a delivery is a dialogue opened for an IMSI
+            if imsi is not None and msg.opcode != MsgType.ResultLast:
+                return done
+            self._touch(chain)
+            chain.messages.append(msg)
+            if msg.tcap_state != TCAPState.Continue:
+                del self._dialogues[msg.tid]
+                chain.tids.discard(msg.tid)
+                if imsi is not None:
+                    # the IMSI got its delivery
+                    chain.imsis.discard(imsi)
+                    if self._imsis.get(imsi) is chain:
+                        del self._imsis[imsi]
+            if request == MsgType.SRI and msg.opcode == MsgType.ResultLast and msg.imsi:
+                chain.imsis.add(msg.imsi)
+                self._imsis[msg.imsi] = chain
+            elif not chain.tids and not chain.imsis:
+                done.append(self._close(chain))
+        return done
+
+    def flush(self, now_us: Optional[int] = None) -> list[CorrelatedChain]:
+        """
+        Emit every open chain, e.g. at the end of the input; with `now_us`
+        (capture time, epoch µs) only the chains idle for `ttl` by then.
+        """
+        if now_us is not None:
+            self._now_us = max(self._now_us, now_us)
+            return self._expire()
+        return [self._close(chain) for chain in list(self._chains.values())]
+
+    # ---------- helpers ----------
+    def _chain_of(self, msisdn: str) -> _OpenChain:
+        chain = self._chains.get(msisdn)
+        if chain is None:
+            chain = self._chains[msisdn] = _OpenChain(msisdn, self._now_us)
+        else:
+            self._touch(chain)
+        return chain
+
+    def _touch(self, chain: _OpenChain):
+        chain.last_us = self._now_us
+        self._chains.move_to_end(chain.msisdn)
+
+    def _open(self, chain: _OpenChain, msg: Message, imsi: Optional[str]):
+        if msg.tid:
+            previous = self._dialogues.get(msg.tid)
+            if previous is not None and previous[0] is not chain:
+                # tid reused before the old dialogue ended
+                previous[0].tids.discard(msg.tid)
+                previous[0].timed_out = True
+            self._dialogues[msg.tid] = chain, msg.opcode, imsi
+            chain.tids.add(msg.tid)
+
+    def _expire(self) -> list[CorrelatedChain]:
+        done = []
+        deadline = self._now_us - self._ttl_us
+        while self._chains:
+            chain = next(iter(self._chains.values()))
+            if chain.last_us >= deadline:
+                break
+            done.append(self._close(chain))
+        return done
+
+    def _close(self, chain: _OpenChain) -> CorrelatedChain:
+        if chain.tids or chain.imsis:
+            chain.timed_out = True
+        del self._chains[chain.msisdn]
+        for tid in chain.tids:
+            if self._dialogues.get(tid, (None,))[0] is chain:
+                del self._dialogues[tid]
+        for imsi in chain.imsis:
+            if self._imsis.get(imsi) is chain:
+                del self._imsis[imsi]
+        return CorrelatedChain(chain.msisdn,
+                               sorted(chain.messages, key=lambda msg: msg.ts_us),
+                               not chain.timed_out)
+
+
+def correlate(messages: Iterable[Message], msisdns: Optional[Iterable[str]] = None,
+              ttl: float = 30.0) -> Iterator[CorrelatedChain]:
+    """Run a `DialogueCorrelator` over a message stream, yielding chains as they complete."""
+    correlator = DialogueCorrelator(msisdns, ttl)
+    for msg in messages:
+        yield from correlator.feed(msg)
+    yield from correlator.flush()
@@ -0,0 +1,83 @@
+"""
+Export of a traced chain to a capture file.
+
+Every message remembers its source dump (`Message.meta`) and frame number
+(`Message.frame`).  The chain's frames are grouped per dump, picked out of
+each dump in a single pass over its record headers (which stops at the
+highest wanted frame), and written in time order into one pcapng file.  No
+dump is dissected again and no Wireshark tool is needed.
+"""
+import struct
+from collections import defaultdict
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+from . import pcapfile
+from .models import Message
+
+_SHB_BODY = struct.pack('<IHHq', pcapfile.BYTE_ORDER_MAGIC, 1, 0, -1)
+
+
+def export_chain(chain: Iterable[Message], out_path: Path) -> int:
+    """
+    Write the frames of the chain's messages into a pcapng file.
+
+    Messages without a source dump or frame number (e.g. from a live
+    capture), or whose dump can no longer be read (e.g. rotated away since
+    it was indexed), are skipped with a warning.
+
+    :return: number of frames written
+    """
+    by_source: dict[Path, set[int]] = defaultdict(set)
+    skipped = 0
+    for msg in chain:
+        if msg.meta is None or msg.frame is None:
+            skipped += 1
+            continue
+        by_source[Path(msg.meta.filepath)].add(msg.frame)
+    if skipped:
+        print(f'[WARNING] {skipped} messages have no source frame and are not exported')
+
+    interfaces: list[pcapfile.Interface] = []
+    packets = []  # (ts, source order, frame number, output interface, frame)
+    for order, source in enumerate(sorted(by_source)):
+        wanted = by_source[source]
+        try:
+            source_interfaces, frames = pcapfile.read_frames(source, wanted)
+        except OSError as e:
+            print(f'[WARNING] {source}: frames {sorted(wanted)} not exported, the dump cannot be read: {e}')
+            continue
+        if len(frames) != len(wanted):
+            missing = sorted(wanted - {frame.number for frame in frames})
+            print(f'[WARNING] {source}: frames {missing} not found, the dump has changed since it was parsed')
+        base = len(interfaces)
+        interfaces.extend(source_interfaces)
+        for frame in frames:
+            packets.append((frame.ts, order, frame.number, base + frame.interface, frame))
+    packets.sort(key=lambda packet: packet[:3])
+
+    with open(out_path, 'wb') as fh:
+        _write_block(fh, pcapfile.SHB_TYPE, _SHB_BODY)
+        for interface in interfaces:
+            _write_block(fh, pcapfile.IDB_TYPE, _idb_body(interface))
+        for _, _, _, if_id, frame in packets:
+            body = struct.pack('<IIIII', if_id, frame.ts_units >> 32, frame.ts_units & 0xFFFFFFFF,
+                               frame.caplen, frame.origlen) + frame.data
+            _write_block(fh, pcapfile.EPB_TYPE, body)
+    return len(packets)
+
+
+def _idb_body(interface: pcapfile.Interface) -> bytes:
+    options = struct.pack('<HHB3x', pcapfile.OPT_IF_TSRESOL, 1, interface.tsresol)
+    if interface.tsoffset:
+        options += struct.pack('<HHq', pcapfile.OPT_IF_TSOFFSET, 8, interface.tsoffset)
+    options += struct.pack('<HH', pcapfile.OPT_END_OF_OPT, 0)
+    return struct.pack('<HHI', interface.linktype, 0, interface.snaplen) + options
+
+
+def _write_block(fh: BinaryIO, block_type: int, body: bytes):
+    body += b'\x00' * (-len(body) % 4)
+    total = len(body) + 12
+    fh.write(struct.pack('<II', block_type, total))
+    fh.write(body)
+    fh.write(struct.pack('<I', total))
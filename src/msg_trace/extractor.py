@@ -1,9 +1,23 @@
+import asyncio
 import json
 import subprocess
-from .Parser import JsonParser
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from .Parser import JsonParser, FieldsParser
+from .cache import MessageCache
+from .capinfo import CapInfo
+from .jsonstream import JsonArrayDecoder, iter_json_array
+from . import pcapfile
+from .pcapfile import Shard
+from .profiling import StageTimer, stage
 
 # FIELDS = ["frame.number", "frame.time_epoch", "gms_map", "tcap"]
 
+# bytes read from tshark's stdout at once, and the longest line of `-T fields` output
+CHUNK_SIZE = 1 << 20
+
 # https://github.com/KimiNewt/pyshark/blob/master/src/pyshark/tshark/tshark.py
 # def get_process_path(tshark_path=None, process_name="tshark"):
 #     """Finds the path of the tshark executable.
@@ -61,37 +75,42 @@ from .Parser import JsonParser
 #
 
 
-"""
-cache implementation:
-add .meta for filter information and output file for this filters.
-for ex. it will be json file
-    .meta.json:
-    [ "since": "1970-0-0"    # time string
-      "to": "12039871237868" # timestamp
-      "msisdn": "1234907918"
-    ]
- 
-  
-If executed program contain same filter then use cache file else use `TsharkExtractor`
-
-"""
-
 class TsharkExtractor:
     """Extract and process tshark messages from pcap files."""
 
-    def __init__(self, date_filter:dict , tshark_path='tshark', save_json=False, pcap_path=None):
+    def __init__(self, date_filter:dict , tshark_path='tshark', save_json=False, pcap_path=None, stream=False,
+                 cache: MessageCache = None, display_filter: str = None, timer: StageTimer = None,
+                 shard: Shard = None):
         """Initialize TsharkExtractor.
 
         Args:
-            _filter: Filter type to apply
-            filter_value: Value to filter on
+            date_filter: dict with "start" and "end" epoch timestamps
             tshark_path: Optional path to tshark executable
+            save_json: dump raw tshark JSON to `cached_<pcap name>.json`
+            pcap_path: pcap file to scan
+            stream: decode tshark output frame-by-frame while tshark is still running
+            cache: serve the window from parsed messages cached by a previous run, see `cache.py`
+            display_filter: extra tshark display filter, only `gsm_map` frames matching it are extracted
+            timer: record per-stage timings and the dump's extraction, see `profiling.py`
+            shard: extract only this part of the dump (`pcapfile.plan_shards`), it is fed to tshark's
+                stdin; frame numbers stay those of the whole dump and the cache is not used.
+                zstd dumps are fed to tshark's stdin too, decompressed on the fly
         """
         self.tshark_path = tshark_path
         self._date_filter = date_filter
-        self._parser = JsonParser()
+        self._parser = JsonParser(timer=timer)
         self._save_to_file = save_json
         self._pcap_file = pcap_path
+        # source reference put on every message, e.g. for pcap export
+        self._source = CapInfo(pcap_path) if pcap_path is not None else None
+        self._stream = stream
+        self._cache = cache
+        self._display_filter = display_filter
+        self._timer = timer
+        self._shard = shard
+        self._compressed = None
+        self._tshark_seconds = None
+        self._cached = False
 
     def scan(self):
         """
@@ -100,23 +119,389 @@ class TsharkExtractor:
         Yields:
             Message objects parsed from pcap
         """
+        started = time.perf_counter()
+        frames = 0
+        offset = self._shard.frame_offset if self._shard is not None else 0
+        for message in self._scan_cached():
+            message.meta = self._source
+            if offset and message.frame is not None:
+                message.frame += offset
+            frames += 1
+            yield message
+        if self._timer is not None:
+            self._timer.add_file(self._pcap_file, frames, time.perf_counter() - started,
+                                 self._tshark_seconds, cached=self._cached)
+
+    async def ascan(self):
+        """
+        Asynchronous `scan`.
+
+        tshark runs as an asyncio subprocess and its output is decoded as it
+        arrives, so several dumps can be extracted concurrently in one event
+        loop, see `parallel.aextract_parallel`.  tshark is only read as fast as
+        the messages are consumed: a slow consumer blocks it on a full pipe.
+
+        Yields:
+            Message objects parsed from pcap
+        """
+        started = time.perf_counter()
+        frames = 0
+        offset = self._shard.frame_offset if self._shard is not None else 0
+        async for message in self._ascan_cached():
+            message.meta = self._source
+            if offset and message.frame is not None:
+                message.frame += offset
+            frames += 1
+            yield message
+        if self._timer is not None:
+            self._timer.add_file(self._pcap_file, frames, time.perf_counter() - started,
+                                 self._tshark_seconds, cached=self._cached)
+
+    def _scan_cached(self):
+        if self._cache is None or self._display_filter or self._shard is not None:
+            # cache entries hold whole windows, not filtered subsets or parts of the dump
+            yield from self._scan()
+            return
+
         start = self._date_filter.get("start")
         end = self._date_filter.get("end")
+        with stage(self._timer, 'cache_read'):
+            cached = self._cache.get(self._pcap_file, start, end)
+        if cached is not None:
+            self._cached = True
+            yield from self._timed_iter('cache_read', cached)
+            return
 
-        # cmd = [self.tshark_path, "-r", str(pcap.absolute()), "-2", "-R", "gsm_map", "-Y", self._filter, "-T", "json"]
-        cmd = [self.tshark_path, "-r", str(self._pcap_file.absolute()), "-2","-R",
-               f"frame.time_epoch >={start} and frame.time_epoch <={end} ", "-Y", "gsm_map", "-T", "json"
-              ]
+        messages = []
+        for message in self._scan():
+            messages.append(message)
+            yield message
+        # stored only when the whole window was extracted
+        self._cache.put(self._pcap_file, start, end, messages)
+
+    async def _ascan_cached(self):
+        if self._cache is None or self._display_filter or self._shard is not None:
+            async for message in self._ascan():
+                yield message
+            return
+
+        start = self._date_filter.get("start")
+        end = self._date_filter.get("end")
+        with stage(self._timer, 'cache_read'):
+            cached = self._cache.get(self._pcap_file, start, end)
+        if cached is not None:
+            self._cached = True
+            for message in self._timed_iter('cache_read', cached):
+                yield message
+            return
 
-        tshark_command_result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        # print(f'exe time: {datetime.datetime.now() - start}')
+        messages = []
+        async for message in self._ascan():
+            messages.append(message)
+            yield message
+        self._cache.put(self._pcap_file, start, end, messages)
+
+    def _scan(self):
+        if self._stream or self._from_stdin():
+            yield from self._scan_stream()
+            return
+
+        start = time.perf_counter()
+        with stage(self._timer, 'tshark_wait'):
+            tshark_command_result = subprocess.run(self._build_cmd(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._tshark_seconds = time.perf_counter() - start
         if tshark_command_result.returncode != 0:
             raise RuntimeError(f'tshark command failed. Error: \n{tshark_command_result.stderr}')
-        stdout_json = json.loads(tshark_command_result.stdout)
+        with stage(self._timer, 'json_decode'):
+            stdout_json = json.loads(tshark_command_result.stdout)
 
         if self._save_to_file:
             with open(f'cached_{self._pcap_file.name}.json', 'w') as cache_file:
                 json.dump(stdout_json, cache_file)
 
+        parse = self._timed('parse', self._parser.parse_frame)
         for _frame in stdout_json:
-            yield self._parser.parse_frame(_frame)
+            yield parse(_frame)
+
+    def _build_cmd(self) -> list[str]:
+        # cmd = [self.tshark_path, "-r", str(pcap.absolute()), "-2", "-R", "gsm_map", "-Y", self._filter, "-T", "json"]
+        if self._from_stdin():
+            # tshark cannot make a second pass over a pipe
+            return [self.tshark_path, "-r", "-", *self._output_args()]
+        return [self.tshark_path, "-r", str(self._pcap_file.absolute()), "-2", *self._output_args()]
+
+    def _output_args(self) -> list[str]:
+        return ["-Y", self._frame_filter(), "-T", "json"]
+
+    def _frame_filter(self) -> str:
+        # The time window is part of the display filter, not a read filter (-R):
+        # tshark renumbers the frames that pass a read filter, and `frame.number`
+        # must stay the position of the frame in the dump.
+        parts = ["gsm_map"]
+        start = self._date_filter.get("start")
+        end = self._date_filter.get("end")
+        if start is not None and end is not None:
+            parts.append(f"frame.time_epoch >= {start} && frame.time_epoch <= {end}")
+        if self._display_filter:
+            parts.append(f"({self._display_filter})")
+        if self._shard is not None and self._shard.lead_in:
+            # the lead-in is dissected for context only
+            parts.append(f"frame.number > {self._shard.lead_in}")
+        return " && ".join(parts)
+
+    @contextmanager
+    def _tshark_stdout(self):
+        """
+        Run tshark under `Popen` and hand out its stdout.
+
+        The exit code is checked once the caller is done with the output; if the
+        caller stops early the process is killed.
+        """
+        # stderr goes to a temp file: an unread pipe could fill up and block tshark
+        with tempfile.TemporaryFile() as stderr:
+            start = time.perf_counter()
+            proc = subprocess.Popen(self._build_cmd(), stdin=subprocess.PIPE if self._from_stdin() else None,
+                                    stdout=subprocess.PIPE, stderr=stderr)
+            feeder = None
+            if self._from_stdin():
+                feeder = _Feeder(self._stdin_chunks(), proc.stdin)
+                feeder.start()
+            try:
+                yield proc.stdout if self._timer is None else _TimedReader(proc.stdout, self._timer)
+                returncode = proc.wait()
+                if feeder is not None:
+                    # a failed read of the dump is the reason tshark failed too
+                    feeder.join()
+                    if feeder.error is not None:
+                        raise feeder.error
+                if returncode != 0:
+                    stderr.seek(0)
+                    raise RuntimeError(f'tshark command failed. Error: \n{stderr.read()}')
+                self._tshark_seconds = time.perf_counter() - start
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                if feeder is not None:
+                    feeder.join()
+                proc.stdout.close()
+
+    @asynccontextmanager
+    async def _atshark_stdout(self):
+        """`_tshark_stdout` for asyncio: tshark's stdout as an `asyncio.StreamReader`."""
+        with tempfile.TemporaryFile() as stderr:
+            start = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(*self._build_cmd(), stdout=asyncio.subprocess.PIPE,
+                                                        stdin=asyncio.subprocess.PIPE if self._from_stdin() else None,
+                                                        stderr=stderr, limit=CHUNK_SIZE)
+            feeder = asyncio.ensure_future(self._afeed(proc.stdin)) if self._from_stdin() else None
+            try:
+                yield proc.stdout
+                returncode = await proc.wait()
+                if feeder is not None:
+                    await feeder
+                if returncode != 0:
+                    stderr.seek(0)
+                    raise RuntimeError(f'tshark command failed. Error: \n{stderr.read()}')
+                self._tshark_seconds = time.perf_counter() - start
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                if feeder is not None and not feeder.done():
+                    feeder.cancel()
+                    await asyncio.gather(feeder, return_exceptions=True)
+
+    def _from_stdin(self) -> bool:
+        """
+        tshark reads the capture from stdin: a shard, or a zstd dump that is
+        decompressed here with `zstandard`.  gzip dumps are passed by path,
+        wiretap reads them with random access (and so with -2) itself; without
+        `zstandard` zstd dumps are left to tshark as well.
+        """
+        if self._shard is not None:
+            return True
+        if self._compressed is None:
+            try:
+                kind = pcapfile.compression(self._pcap_file)
+            except (OSError, TypeError):
+                # missing file: tshark reports it
+                kind = None
+            self._compressed = kind == 'zstd' and pcapfile.zstandard is not None
+        return self._compressed
+
+    def _stdin_chunks(self):
+        """The capture fed to tshark, in chunks."""
+        if self._shard is None:
+            with pcapfile.open_capture(self._pcap_file) as stream:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        with open(self._pcap_file, 'rb') as fh:
+            for start, end in self._shard.ranges():
+                fh.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = fh.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise RuntimeError(f'{self._pcap_file}: file is shorter than when it was sharded')
+                    remaining -= len(chunk)
+                    yield chunk
+
+    async def _afeed(self, stdin):
+        """Write the shard into tshark's stdin."""
+        try:
+            for chunk in self._stdin_chunks():
+                stdin.write(chunk)
+                await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # tshark exited early, its exit code tells why
+            pass
+        finally:
+            stdin.close()
+
+    async def _ascan(self):
+        parse = self._timed('parse', self._parser.parse_frame)
+        decoder = JsonArrayDecoder()
+        async with self._atshark_stdout() as stdout:
+            with open(f'cached_{self._pcap_file.name}.json', 'wb') if self._save_to_file else nullcontext() as copy:
+                while True:
+                    chunk = await stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if copy is not None:
+                        copy.write(chunk)
+                    with stage(self._timer, 'json_decode'):
+                        frames = decoder.feed(chunk)
+                    for _frame in frames:
+                        yield parse(_frame)
+            decoder.close()
+
+    def _scan_stream(self):
+        """
+        Streaming variant of `scan`.
+
+        Every element of tshark's JSON array is parsed as soon as it is complete,
+        so peak memory is bounded by a single frame and parsing overlaps with
+        the dissection.
+        """
+        parse = self._timed('parse', self._parser.parse_frame)
+        with self._tshark_stdout() as stdout:
+            if not self._save_to_file:
+                for _frame in self._timed_iter('json_decode', iter_json_array(stdout)):
+                    yield parse(_frame)
+                return
+
+            with open(f'cached_{self._pcap_file.name}.json', 'wb') as cache_file:
+                for _frame in self._timed_iter('json_decode', iter_json_array(_Tee(stdout, cache_file))):
+                    yield parse(_frame)
+
+    def _timed(self, name: str, func):
+        return func if self._timer is None else self._timer.wrap(name, func)
+
+    def _timed_iter(self, name: str, iterable):
+        return iterable if self._timer is None else self._timer.iter(name, iterable)
+
+
+class TsharkFieldsExtractor(TsharkExtractor):
+    """
+    Field-projection backend.
+
+    Instead of the whole dissection tree tshark prints only the columns listed in
+    `FieldsParser.FIELDS`, one tab-separated line per frame, which cuts the output
+    volume and the decoding time by an order of magnitude.  Output is always
+    streamed; `save_json` and `stream` have no effect.
+    """
+
+    def __init__(self, date_filter: dict, tshark_path='tshark', save_json=False, pcap_path=None, stream=True,
+                 cache: MessageCache = None, display_filter: str = None, timer: StageTimer = None,
+                 shard: Shard = None):
+        super().__init__(date_filter, tshark_path=tshark_path, save_json=save_json, pcap_path=pcap_path,
+                         stream=stream, cache=cache, display_filter=display_filter, timer=timer, shard=shard)
+        self._parser = FieldsParser()
+
+    def _scan(self):
+        parse = self._timed('parse', self._parser.parse_line)
+        with self._tshark_stdout() as stdout:
+            for line in stdout:
+                yield parse(line.decode())
+
+    async def _ascan(self):
+        parse = self._timed('parse', self._parser.parse_line)
+        async with self._atshark_stdout() as stdout:
+            async for line in stdout:
+                yield parse(line.decode())
+
+    def _output_args(self) -> list[str]:
+        args = ["-Y", self._frame_filter(), "-T", "fields",
+                "-E", "header=n", "-E", "separator=/t", "-E", "quote=n",
+                "-E", "occurrence=a", "-E", f"aggregator={FieldsParser.AGGREGATOR}"]
+        for field in FieldsParser.FIELDS:
+            args.extend(["-e", field])
+        return args
+
+
+EXTRACTORS = {
+    'json': TsharkExtractor,
+    'fields': TsharkFieldsExtractor,
+}
+
+
+class _Feeder(threading.Thread):
+    """Writes chunks into tshark's stdin, the error of a failed read is kept in `error`."""
+
+    def __init__(self, chunks, stdin):
+        super().__init__(daemon=True)
+        self._chunks = chunks
+        self._stdin = stdin
+        self.error = None
+
+    def run(self):
+        try:
+            for chunk in self._chunks:
+                self._stdin.write(chunk)
+        except BrokenPipeError:
+            # tshark exited early, its exit code tells why
+            pass
+        except Exception as error:
+            self.error = error
+        finally:
+            try:
+                self._stdin.close()
+            except BrokenPipeError:
+                pass
+
+
+class _TimedReader:
+    """Binary reader that counts the time spent waiting for tshark output as `tshark_wait`."""
+
+    def __init__(self, source, timer: StageTimer):
+        self._source = source
+        self._timer = timer
+
+    def read1(self, size=-1) -> bytes:
+        with self._timer.stage('tshark_wait'):
+            return self._source.read1(size)
+
+    def read(self, size=-1) -> bytes:
+        with self._timer.stage('tshark_wait'):
+            return self._source.read(size)
+
+    def __iter__(self):
+        return self._timer.iter('tshark_wait', self._source)
+
+
+class _Tee:
+    """Binary reader that copies everything it reads into a second file."""
+
+    def __init__(self, source, sink):
+        self._source = source
+        self._sink = sink
+
+    def read1(self, size=-1) -> bytes:
+        chunk = self._source.read1(size)
+        self._sink.write(chunk)
+        return chunk
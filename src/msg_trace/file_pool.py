@@ -1,27 +1,115 @@
-from typing import Iterable
+"""
+Dump discovery and selection by time window.
+
+By default the dumps of the top-level folder are used.  With `recursive` the
+whole tree is searched, and folders of a date-partitioned archive
+(`<site>/YYYY/MM/DD/HH/`) whose period lies outside the `since`/`to` window
+are skipped without being listed.  A partition folder is assumed to hold the
+dumps started in its period; dumps may run `partition_slack` past its end.
+Partition periods are in `partition_tz` (UTC by default) and naive
+`since`/`to` in local time, both are compared as aware times.
+
+Dumps may be gzip or zstd compressed (`.pcap.gz`, `.pcapng.zst`, ...).
+"""
+import argparse
+import os
+import re
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Iterator, Optional
 from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from .capindex import CapInfoIndex
 from .capinfo import CapInfo
+from .profiling import StageTimer, stage
+
+CAPTURE_SUFFIXES = tuple(capture + compressed for capture in ('.pcap', '.pcapng') for compressed in ('', '.gz', '.zst'))
+PARTITION_SLACK = timedelta(hours=1)
+
+_YEAR = re.compile(r'(19[7-9]\d|2\d{3})')
+_TWO_DIGITS = re.compile(r'\d{2}')
 
 
 class FilePool:
-    def __init__(self, dump_folder: str):
+    def __init__(self, dump_folder: str, use_index: bool = True, count_frames: bool = False,
+                 timer: StageTimer = None, recursive: bool = False, since: datetime = None, to: datetime = None,
+                 partition_slack: timedelta = PARTITION_SLACK, partition_tz: Optional[tzinfo] = timezone.utc):
+        """
+        :param recursive: search subfolders too
+        :param since: with `recursive`, skip partition folders that end before this
+        :param to: with `recursive`, skip partition folders that start after this
+        :param partition_slack: how long a dump may run past the end of its partition folder
+        :param partition_tz: time zone of the partition folder names, None for local time
+        """
         self.__dump_folder = self._process_to_path(dump_folder)
+        self._count_frames = count_frames
+        self._timer = timer
+        self._recursive = recursive
+        self._since = _as_aware(since)
+        self._to = _as_aware(to)
+        self._partition_slack = partition_slack
+        self._partition_tz = partition_tz
         self._files: set[CapInfo] = set()
+        self._by_path: dict[Path, CapInfo] = {}
+        # interval index of `_files`, see `_by_time`; None after a change
+        self._sorted = None
+        # identity (size, mtime, inode) of every dump found by the last scan
+        self._seen: dict[Path, tuple] = {}
+        self._index = CapInfoIndex(self.__dump_folder) if use_index else None
         self._scan(self.__dump_folder)
 
     def __repr__(self):
         return f"{self.__dump_folder} : {len(self._files)}"
 
+    @property
+    def dump_folder(self) -> Path:
+        return self.__dump_folder
+
     def add_file(self, file_path: Path):
-        meta = CapInfo.form_info(file_path)
+        if self._index is None:
+            with stage(self._timer, 'probe', 1):
+                meta = self._probe(file_path)
+        else:
+            stat = file_path.stat()
+            meta = self._index.get(file_path, stat)
+            if meta is None or (self._count_frames and meta.frames is None):
+                with stage(self._timer, 'probe', 1):
+                    meta = self._probe(file_path)
+                self._index.put(meta, stat)
         # print(meta)
+        # a file probed again (e.g. a grown dump) replaces its former bounds
+        self._sorted = None
+        self._files.discard(self._by_path.pop(meta.filepath, None))
+        if meta.ts_start is None:
+            # no packets, nothing to extract
+            return
         self._files.add(meta)
+        self._by_path[meta.filepath] = meta
 
     # ---------- public API ----------
-    def select(self, since, to) -> Iterable[CapInfo]:
-        for meta in self._files:
-            if not (meta.ts_end < since or meta.ts_start > to):
-                yield meta
+    def rescan(self):
+        """Search the folder again: add new and changed dumps, forget removed ones, leave the others be."""
+        self._scan(self.__dump_folder)
+
+    def select(self, since, to) -> Iterator[CapInfo]:
+        """Files whose packets overlap [since, to], in chronological order (ties broken by path)."""
+        starts, max_ends, files = self._by_time()
+        # every file from `hi` on starts after `to`; of the others, walk down
+        # the subtrees whose latest end reaches `since`
+        hi = bisect_right(starts, to)
+        size = len(max_ends) // 2
+        stack = [(1, 0, size)]
+        while stack:
+            node, left, right = stack.pop()
+            if left >= hi or max_ends[node] < since:
+                continue
+            if node >= size:
+                yield files[left]
+                continue
+            middle = (left + right) // 2
+            # the right half is pushed first, so files come out in order
+            stack.append((2 * node + 1, middle, right))
+            stack.append((2 * node, left, middle))
 
     def _process_to_path(self, folder: str) -> Path:
         _folder = Path(folder)
@@ -32,10 +120,142 @@ class FilePool:
         return _folder
 
     # ---------- helpers ----------
+    def _probe(self, file_path: Path) -> CapInfo:
+        """Read time bounds natively, capinfos is used only for formats the native reader does not know."""
+        try:
+            return CapInfo.from_file(file_path, count_frames=self._count_frames)
+        except ValueError:
+            return CapInfo.form_info(file_path)
+
+    def _by_time(self) -> tuple[list, list, list[CapInfo]]:
+        """
+        Interval index of the pool: its start times, a segment tree of end
+        times and the files, sorted by start time.  Node `i` of the tree holds
+        the latest end of its leaves, file `j` is leaf `size + j`, so a window
+        costs O((k + 1) log n) for k matching files, however long some dumps
+        are.  Rebuilt on the first `select` after `add_file`.
+        """
+        if self._sorted is None:
+            files = sorted(self._files, key=lambda meta: (meta.ts_start, str(meta.filepath)))
+            size = 1
+            while size < len(files):
+                size *= 2
+            # padding leaves lie past the last start, they are never reached
+            padding = min((meta.ts_end for meta in files), default=datetime.min)
+            max_ends = [padding] * size + [meta.ts_end for meta in files] + [padding] * (size - len(files))
+            for node in range(size - 1, 0, -1):
+                max_ends[node] = max(max_ends[2 * node], max_ends[2 * node + 1])
+            self._sorted = [meta.ts_start for meta in files], max_ends, files
+        return self._sorted
+
+    def _in_window(self, start: datetime, end: datetime) -> bool:
+        start, end = _as_aware(start, self._partition_tz), _as_aware(end, self._partition_tz)
+        if self._since is not None and end + self._partition_slack <= self._since:
+            return False
+        return self._to is None or start <= self._to
+
+    def _walk(self, folder: Path, found: list[Path], skipped: list[Path]):
+        for root, dirs, files in os.walk(folder):
+            root = Path(root)
+            searched = []
+            for name in sorted(dirs):
+                if name.startswith('.'):
+                    # message cache and other bookkeeping
+                    continue
+                span = partition_span((root / name).relative_to(folder).parts)
+                if span is not None and not self._in_window(*span):
+                    skipped.append(root / name)
+                    continue
+                searched.append(name)
+            dirs[:] = searched
+            found.extend(root / name for name in files if name.endswith(CAPTURE_SUFFIXES))
+
     def _scan(self, folder: Path):
+            found, skipped = [], []
+            if self._recursive:
+                self._walk(folder, found, skipped)
+            else:
+                found = [p for p in folder.glob('*') if p.name.endswith(CAPTURE_SUFFIXES) and p.is_file()]
+            seen = {}
+            for p in found:
+                try:
+                    stat = p.stat()
+                except FileNotFoundError:
+                    # removed since it was listed
+                    continue
+                seen[p] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                if self._seen.get(p) != seen[p]:
+                    self.add_file(p)
+            for p in self._seen.keys() - seen.keys():
+                meta = self._by_path.pop(p, None)
+                if meta is not None:
+                    self._files.discard(meta)
+                    self._sorted = None
+            self._seen = seen
+
+            if self._index is not None:
+                self._index.prune(set(found), unvisited=skipped)
+                self._index.save()
+
+
+def _as_aware(time: Optional[datetime], tz: Optional[tzinfo] = None) -> Optional[datetime]:
+    """
+    `time` as an aware datetime, a naive one taken in `tz` (local time
+    without it).  None for None and for the naive extremes such as
+    `datetime.min`, which bound nothing.
+    """
+    if time is None or time.tzinfo is not None:
+        return time
+    if tz is not None:
+        return time.replace(tzinfo=tz)
+    try:
+        return time.astimezone()
+    except (OverflowError, OSError, ValueError):
+        return None
 
-            for p in folder.glob("*.pcapng"):
-                self.add_file(p)
-            for p in folder.glob("*.pcap"):
-                self.add_file(p)
 
+def partition_timezone(value: str):
+    """Time zone of `--partition-tz`: an IANA name, or `local` (None) for the local time zone."""
+    if value.lower() == 'local':
+        return None
+    if value.upper() == 'UTC':
+        return timezone.utc
+    try:
+        return ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise argparse.ArgumentTypeError(f'unknown time zone {value!r}')
+
+
+def partition_span(parts) -> Optional[tuple[datetime, datetime]]:
+    """
+    Period [start, end) of a folder of a date-partitioned archive, from its
+    path relative to the archive root, e.g. ('site', '2025', '03', '25')
+    covers that day.  None if the path has no `YYYY[/MM[/DD[/HH]]]` part.
+    The times are naive, in the time zone the archive is partitioned by.
+    """
+    fields = None
+    for part in parts:
+        if fields is None:
+            if _YEAR.fullmatch(part):
+                fields = [int(part)]
+            continue
+        if len(fields) == 4 or not _TWO_DIGITS.fullmatch(part):
+            break
+        fields.append(int(part))
+    if fields is None:
+        return None
+
+    # drop the levels that do not make a valid date, e.g. a folder named 13 below a year
+    while True:
+        try:
+            start = datetime(*fields, *[1, 1, 0][len(fields) - 1:])
+            break
+        except ValueError:
+            fields.pop()
+    if len(fields) == 1:
+        return start, start.replace(year=start.year + 1)
+    if len(fields) == 2:
+        return start, (start + timedelta(days=32)).replace(day=1)
+    if len(fields) == 3:
+        return start, start + timedelta(days=1)
+    return start, start + timedelta(hours=1)
@@ -0,0 +1,418 @@
+"""
+Follow mode: trace subscribers while traffic is being captured.
+
+Frames come from one of three sources and are dissected by a single tshark
+process whose JSON output is parsed as it is printed:
+
+    LiveSource    tshark captures from an interface itself
+    TailSource    a pcap/pcapng that is still being written (e.g. the current
+                  file of a `tshark -b` / dumpcap ring buffer) is copied into
+                  `tshark -r -` as it grows, and across its rotations
+    ReplaySource  a finished capture is written into `tshark -r -` at the pace
+                  of its own timestamps, for testing and demos
+
+Messages are fed to a `DialogueCorrelator`, so a chain is reported seconds
+after its last dialogue ends instead of after the next dump rotation.  When
+no frame arrives for a while the correlator's clock is advanced by the wall
+clock, so chains left open on a quiet link still time out.
+"""
+import argparse
+import glob
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from . import pcapfile
+from .correlator import CorrelatedChain, DialogueCorrelator
+from .extractor import TsharkExtractor
+from .jsonstream import iter_json_array
+from .logic import ASCII_REPORT_WIDTH, read_msisdn_file
+from .report import AsciiReporter, MarkdownReporter
+
+# small reads: frames are handed to the parser as soon as tshark prints them
+FOLLOW_CHUNK_SIZE = 1 << 14
+# seconds without a message after which idle chains are expired
+FOLLOW_TICK = 1.0
+# file names of a dumpcap / `tshark -b` ring buffer: <prefix>_<number>_<YYYYmmddHHMMSS><suffix>
+_RING_NAME = re.compile(r'(?P<prefix>.+)_(?P<number>\d{5,})_\d{14}(?P<suffix>\..+)')
+
+
+class LiveSource:
+    """Capture from a network interface."""
+
+    def __init__(self, interface: str, capture_filter: str = None):
+        self.interface = interface
+        self.capture_filter = capture_filter
+
+    def tshark_args(self) -> list[str]:
+        args = ["-i", self.interface]
+        if self.capture_filter:
+            args.extend(["-f", self.capture_filter])
+        return args
+
+    # tshark reads the interface itself, nothing to pump
+    pump = None
+
+    def stop(self):
+        pass
+
+
+class TailSource:
+    """
+    Copy a growing capture file into tshark's stdin.
+
+    Rotations are followed: when the file is replaced under its name (a new
+    inode), truncated below what was read, or, for a file of a ring buffer,
+    when the next file of the ring appears, the rest of the old file is copied
+    and the new one continues the stream.  A pcapng file starts a new section;
+    of a classic pcap only the records are copied, and its header must match
+    the first file's.
+    """
+
+    def __init__(self, path: Path, poll_interval: float = 0.5, idle_timeout: Optional[float] = None):
+        """
+        :param path: pcap/pcapng file being written
+        :param poll_interval: seconds between checks for new data
+        :param idle_timeout: stop after this many seconds without growth, None follows forever
+        """
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self._stop = threading.Event()
+
+    def tshark_args(self) -> list[str]:
+        return ["-r", "-"]
+
+    def pump(self, sink: BinaryIO):
+        idle_since = time.monotonic()
+        path = self.path
+        fh = open(path, 'rb')
+        try:
+            first = self._read_header(fh)
+            if first is None:
+                return
+            sink.write(first)
+            while not self._stop.is_set():
+                chunk = fh.read(1 << 16)
+                if chunk:
+                    sink.write(chunk)
+                    sink.flush()
+                    idle_since = time.monotonic()
+                    continue
+                rotated = self._rotated(path, fh)
+                if rotated is not None:
+                    # whatever was written to the old file up to the rotation
+                    sink.write(fh.read())
+                    fh.close()
+                    path, fh = rotated, open(rotated, 'rb')
+                    header = self._read_header(fh)
+                    if header is None:
+                        return
+                    self._continue_stream(sink, first, header, path)
+                    idle_since = time.monotonic()
+                    continue
+                if self.idle_timeout is not None and time.monotonic() - idle_since >= self.idle_timeout:
+                    return
+                self._stop.wait(self.poll_interval)
+        finally:
+            fh.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def _read_header(self, fh: BinaryIO) -> Optional[bytes]:
+        """
+        Leading bytes of a capture that tell its format: the file header of a
+        classic pcap, the block type of a pcapng.  None if stopped first.
+        """
+        data, wanted = b'', 4
+        while not self._stop.is_set():
+            chunk = fh.read(wanted - len(data))
+            data += chunk
+            if wanted == 4 and data in pcapfile.PCAP_MAGIC:
+                wanted = pcapfile.PCAP_HEADER_LEN
+                continue
+            if len(data) == wanted:
+                return data
+            if not chunk:
+                self._stop.wait(self.poll_interval)
+        return None
+
+    @staticmethod
+    def _continue_stream(sink: BinaryIO, first: bytes, header: bytes, path: Path):
+        if (header[:4] in pcapfile.PCAP_MAGIC) != (first[:4] in pcapfile.PCAP_MAGIC):
+            raise RuntimeError(f'{path}: capture format changed, cannot continue the stream')
+        if header[:4] not in pcapfile.PCAP_MAGIC:
+            # a new pcapng section
+            sink.write(header)
+        elif header[:4] != first[:4] or header[20:] != first[20:]:
+            raise RuntimeError(f'{path}: byte order, resolution or link type changed, cannot continue the stream')
+
+    @staticmethod
+    def _rotated(path: Path, fh: BinaryIO) -> Optional[Path]:
+        """The file the capture continues in, None while `path` is still the current file."""
+        stat = os.fstat(fh.fileno())
+        if fh.tell() > stat.st_size:
+            # truncated and written again from the start
+            return path
+        try:
+            if os.stat(path).st_ino != stat.st_ino:
+                return path
+        except FileNotFoundError:
+            # renamed away, the ring may tell where the capture went on
+            pass
+        return _next_in_ring(path)
+
+
+def _next_in_ring(path: Path) -> Optional[Path]:
+    """The next existing file of the ring buffer `path` belongs to, if any."""
+    match = _RING_NAME.fullmatch(path.name)
+    if match is None:
+        return None
+    later = []
+    for other in path.parent.glob(f'{glob.escape(match["prefix"])}_*{glob.escape(match["suffix"])}'):
+        other_match = _RING_NAME.fullmatch(other.name)
+        if (other_match is not None and other_match["prefix"] == match["prefix"]
+                and other_match["suffix"] == match["suffix"]
+                and int(other_match["number"]) > int(match["number"])):
+            later.append((int(other_match["number"]), other))
+    return min(later)[1] if later else None
+
+
+class ReplaySource:
+    """Write a finished capture into tshark's stdin at the pace it was captured."""
+
+    def __init__(self, path: Path, speed: float = 1.0):
+        """
+        :param path: pcap/pcapng file to replay
+        :param speed: 2.0 replays twice as fast as captured, 0 writes as fast as possible
+        """
+        self.path = Path(path)
+        self.speed = speed
+        self._stop = threading.Event()
+
+    def tshark_args(self) -> list[str]:
+        return ["-r", "-"]
+
+    def pump(self, sink: BinaryIO):
+        started = first_ts = None
+        for ts, record in pcapfile.iter_records(self.path):
+            if self._stop.is_set():
+                return
+            if ts is not None and self.speed > 0:
+                if first_ts is None:
+                    started, first_ts = time.monotonic(), ts
+                delay = started + (ts - first_ts) / self.speed - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    return
+            sink.write(record)
+            if ts is not None:
+                sink.flush()
+
+    def stop(self):
+        self._stop.set()
+
+
+class FollowExtractor(TsharkExtractor):
+    """
+    `TsharkExtractor` over an open-ended source.
+
+    tshark runs single-pass (`-l`, no `-2`/`-R`: two-pass dissection needs the
+    whole file) and every frame is parsed as soon as tshark flushes it.
+    """
+
+    def __init__(self, source, tshark_path='tshark', display_filter: str = None):
+        super().__init__(date_filter={}, tshark_path=tshark_path, stream=True, display_filter=display_filter)
+        self._source = source
+
+    def scan(self):
+        with self._tshark_stdout() as stdout:
+            for _frame in iter_json_array(stdout, chunk_size=FOLLOW_CHUNK_SIZE):
+                yield self._parser.parse_frame(_frame)
+
+    def _build_cmd(self) -> list[str]:
+        return [self.tshark_path, "-l", *self._source.tshark_args(), *self._output_args()]
+
+    @contextmanager
+    def _tshark_stdout(self):
+        pump = self._source.pump
+        with tempfile.TemporaryFile() as stderr:
+            proc = subprocess.Popen(self._build_cmd(), stdout=subprocess.PIPE, stderr=stderr,
+                                    stdin=subprocess.PIPE if pump else subprocess.DEVNULL)
+            feeder, errors = None, []
+            if pump:
+                feeder = threading.Thread(target=self._feed, args=(pump, proc.stdin, errors), daemon=True)
+                feeder.start()
+            try:
+                yield proc.stdout
+                if feeder is not None:
+                    feeder.join()
+                if errors:
+                    raise errors[0]
+                if proc.wait() != 0:
+                    stderr.seek(0)
+                    raise RuntimeError(f'tshark command failed. Error: \n{stderr.read()}')
+            finally:
+                self._source.stop()
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                if feeder is not None:
+                    feeder.join()
+                proc.stdout.close()
+
+    @staticmethod
+    def _feed(pump, stdin: BinaryIO, errors: list):
+        try:
+            pump(stdin)
+        except (BrokenPipeError, ValueError):
+            # tshark is gone, the scan reports its exit status
+            pass
+        except Exception as error:
+            errors.append(error)
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+
+def _ticking(iterable: Iterable, tick: float) -> Iterator:
+    """
+    Items of `iterable`, read in a thread; None whenever nothing arrived for
+    `tick` seconds.  An exception of the iterable is raised here.
+    """
+    items = queue.Queue(maxsize=1024)
+    closed = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not closed.is_set():
+            try:
+                items.put(item, timeout=tick)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+            else:
+                put(end)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        while True:
+            try:
+                item = items.get(timeout=tick)
+            except queue.Empty:
+                yield None
+                continue
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        closed.set()
+
+
+def follow(source, msisdns: Optional[Iterable[str]] = None, ttl: float = 10.0,
+           tshark_path='tshark', tick: float = FOLLOW_TICK) -> Iterator[CorrelatedChain]:
+    """Chains of the watched subscribers, yielded as soon as the correlator completes them."""
+    return correlate_live(FollowExtractor(source, tshark_path=tshark_path).scan(), msisdns, ttl=ttl, tick=tick,
+                          stop=source.stop)
+
+
+def correlate_live(messages: Iterable, msisdns: Optional[Iterable[str]] = None, ttl: float = 10.0,
+                   tick: float = FOLLOW_TICK, stop=None) -> Iterator[CorrelatedChain]:
+    """
+    `correlate` for a message stream that may pause: after `tick` seconds
+    without a message the capture clock is advanced by the wall clock time
+    since the last one, and chains idle for `ttl` are emitted.
+
+    :param stop: called when the consumer stops early, e.g. `source.stop`
+    """
+    correlator = DialogueCorrelator(msisdns, ttl)
+    last_us = seen = None
+    try:
+        for msg in _ticking(messages, tick):
+            if msg is None:
+                if last_us is not None:
+                    yield from correlator.flush(last_us + int((time.monotonic() - seen) * 1_000_000))
+                continue
+            if last_us is None or msg.ts_us >= last_us:
+                last_us, seen = msg.ts_us, time.monotonic()
+            yield from correlator.feed(msg)
+        yield from correlator.flush()
+    finally:
+        if stop is not None:
+            stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='msg_trace follow',
+                                     description="trace subscribers in live traffic")
+    sources = parser.add_mutually_exclusive_group(required=True)
+    sources.add_argument('-i', '--interface', help="capture from this interface")
+    sources.add_argument('--tail', help="follow a capture file that is still being written")
+    sources.add_argument('--replay', help="replay a capture file at its original pace")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="with --replay: replay speed factor, 0 = as fast as possible")
+    parser.add_argument('--idle-timeout', type=float,
+                        help="with --tail: stop after this many seconds without new data")
+    parser.add_argument('--capture-filter', help="with --interface: BPF capture filter, e.g. 'sctp'")
+    filters = parser.add_mutually_exclusive_group()
+    filters.add_argument('--msisdn', help="subscriber to watch")
+    filters.add_argument('--msisdn-file', help="file with one msisdn per line")
+    parser.add_argument('--ttl', type=float, default=10.0,
+                        help="seconds a chain may stay idle before it is reported")
+    parser.add_argument('-r', '--render', default='ascii', choices=['ascii', 'md'])
+    parser.add_argument('--tshark', default='tshark', help="path to the tshark executable")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.interface:
+        source = LiveSource(args.interface, args.capture_filter)
+    elif args.tail:
+        source = TailSource(Path(args.tail), idle_timeout=args.idle_timeout)
+    else:
+        source = ReplaySource(Path(args.replay), speed=args.speed)
+
+    if args.msisdn_file:
+        msisdns = read_msisdn_file(args.msisdn_file)
+    else:
+        msisdns = [args.msisdn] if args.msisdn else None
+
+    reporter = AsciiReporter(total_width=ASCII_REPORT_WIDTH) if args.render == 'ascii' else MarkdownReporter()
+    try:
+        for chain in follow(source, msisdns, ttl=args.ttl, tshark_path=args.tshark):
+            status = '' if chain.complete else ' (timed out)'
+            print(f'{chain.msisdn}: {len(chain.messages)} messages{status}')
+            print(reporter.render(chain.messages), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import codecs
+import json
+from typing import IO, Iterator
+
+
+class JsonArrayDecoder:
+    """
+    Incremental decoder for the top-level JSON array printed by `tshark -T json`.
+
+    Bytes are pushed with `feed` as they arrive from the pipe, every complete
+    element of the array is returned immediately, and only the tail of an
+    unfinished element is kept in the buffer.  Memory therefore depends on the
+    size of a single frame, not on the size of the dump.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._started = False
+        self._finished = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, chunk: bytes) -> list:
+        """Consume a chunk of raw output and return the elements completed by it."""
+        if self._finished:
+            return []
+        buf = self._buf + self._utf8.decode(chunk)
+        items = []
+        pos = 0
+        end = len(buf)
+
+        while True:
+            # skip whitespace and separators between elements
+            while pos < end and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= end:
+                break
+
+            if not self._started:
+                if buf[pos] != '[':
+                    raise ValueError(f'expected JSON array, got {buf[pos:pos + 20]!r}')
+                self._started = True
+                pos += 1
+                continue
+
+            if buf[pos] == ']':
+                self._finished = True
+                pos = end
+                break
+
+            try:
+                item, pos = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # the element is not complete yet, wait for more data
+                break
+            items.append(item)
+
+        self._buf = buf[pos:]
+        return items
+
+    def close(self):
+        """Check that the input ended on a complete array."""
+        tail = (self._buf + self._utf8.decode(b'', final=True)).strip()
+        if not self._started and not tail:
+            # tshark prints nothing at all when no frame matched
+            return
+        if not self._finished or tail:
+            raise ValueError(f'truncated JSON array, unparsed tail: {tail[:80]!r}')
+
+
+def iter_json_array(stream: IO[bytes], chunk_size: int = 1 << 20) -> Iterator:
+    """Yield elements of a JSON array read from a binary stream as soon as they are complete."""
+    decoder = JsonArrayDecoder()
+    read = getattr(stream, 'read1', stream.read)
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        yield from decoder.feed(chunk)
+    decoder.close()
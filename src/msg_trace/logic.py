@@ -1,12 +1,30 @@
 import argparse
 import os
+import re
+import sys
 from datetime import datetime
-from .extractor import TsharkExtractor
-from .file_pool import FilePool
+from pathlib import Path
+from . import analyzer, msgstore
+from .cache import MessageCache
+from .colstore import ColumnarMessageStore
+from .correlator import correlate
+from .export import export_chain
+from .extractor import EXTRACTORS
+from .file_pool import FilePool, partition_timezone
+from .parallel import aextract_parallel, extract_parallel, iter_async
+from .profiling import StageTimer, stage
+from .targeted import TargetedExtractor
+from .watcher import MessageArchive
+from .sqlindex import SqliteMessageStore
 from .report import AsciiReporter, MarkdownReporter, PlantUMLReporter
 
 ASCII_REPORT_WIDTH = 80
 
+STORES = {
+    'objects': msgstore.MessageStore,
+    'columnar': ColumnarMessageStore,
+}
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -14,14 +32,86 @@ def parse_args():
     parser.add_argument('--to',help="filter dump files younger than this date", required=True)
     filters = parser.add_mutually_exclusive_group(required=True)
     filters.add_argument('--msisdn', help="select msisdn as filter and its value")
+    filters.add_argument('--msisdn-file',
+                         help="file with one msisdn per line: every chain is built from a single extraction")
+    filters.add_argument('--imsi', help="select imsi as filter and its value: the chain is traced back from the IMSI")
     parser.add_argument('--dump_folder', default='.', help='path to folder containing dumps')
+    parser.add_argument('--recursive', action='store_true',
+                        help="also search subfolders; date folders (YYYY/MM/DD/HH) outside --since/--to are skipped")
+    parser.add_argument('--partition-tz', default='UTC', type=partition_timezone,
+                        help="with --recursive: time zone of the date folders, e.g. UTC (default), "
+                             "Europe/Moscow or local")
     parser.add_argument('-r','--render',help="select render type between ASCII and markdown", required=True, choices=['ascii','md'])
-    # filters.add_argument('--imsi', help="select imsi as filter and its value")
+    parser.add_argument('--backend', default='json', choices=['json', 'fields'],
+                        help="tshark output used for extraction: full JSON trees or projected fields only")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of dump files extracted at once in worker processes")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="split every large dump into this many parts extracted by different -j workers")
+    parser.add_argument('--asyncio', action='store_true',
+                        help="run the -j tshark processes from an asyncio event loop in this process, no worker processes")
+    parser.add_argument('--targeted', action='store_true',
+                        help="ask tshark only for frames linked to the subscriber (msisdn -> tid -> imsi -> tid)")
+    parser.add_argument('--store', default='objects', choices=list(STORES),
+                        help="in-memory message store: Message objects or columnar arrays (less memory)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always run tshark, do not read or write the parsed message cache")
+    parser.add_argument('--archive', action='store_true',
+                        help="read messages from the archive kept by `watch` instead of running tshark")
+    parser.add_argument('--db',
+                        help="answer from a SQLite index built by `index` instead of extracting the dumps")
+    parser.add_argument('--correlate', action='store_true',
+                        help="correlate dialogues while extracting instead of loading all messages into a store")
+    parser.add_argument('--ttl', type=float, default=30.0,
+                        help="with --correlate: seconds a subscriber's chain may stay idle before it is closed")
+    parser.add_argument('--export-pcap', metavar='FILE',
+                        help="also write the frames of the traced chain into this pcapng file")
+    parser.add_argument('--output-dir', default='./reports',
+                        help="where --msisdn-file writes a report per subscriber")
+    parser.add_argument('--profile', nargs='?', const='profile.json', metavar='FILE',
+                        help="time every stage and write a JSON summary (default file: profile.json)")
+    parser.add_argument('--profile-parse', metavar='FILE',
+                        help="record the parse stage with cProfile and write the pstats dump to FILE")
 
     # test data;
     # a = ['--dump_folder', '/Users/nikoleontiev/svyazcom/dump/p2p', '--msisdn', '79509995586']
     # return parser.parse_args(a)
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.targeted and not args.msisdn:
+        parser.error('--targeted traces a single --msisdn')
+    if args.targeted and args.archive:
+        parser.error('--archive already holds every message, --targeted has nothing to do')
+    if args.export_pcap and args.msisdn_file:
+        parser.error('--export-pcap exports the chain of a single --msisdn')
+    if args.db and (args.targeted or args.archive):
+        parser.error('--db answers from the index, it cannot be combined with --targeted or --archive')
+    if args.targeted and args.correlate:
+        parser.error('--correlate needs messages in capture order, which --targeted does not produce')
+    if args.imsi and args.correlate:
+        parser.error('--correlate follows chains from their msisdn, use --imsi without it')
+    if args.asyncio and (args.targeted or args.archive):
+        parser.error('--asyncio drives the extraction of whole dumps, not --targeted or --archive')
+    if args.shards > 1 and (args.jobs < 2 or args.asyncio or args.targeted or args.archive):
+        parser.error('--shards splits dumps between -j worker processes, use it with -j > 1 and without'
+                     ' --asyncio, --targeted or --archive')
+    if args.profile_parse and args.jobs > 1 and not args.asyncio:
+        parser.error('--profile-parse records parsing in this process, use it with -j 1')
+    return args
+
+
+def read_msisdn_file(path) -> list[str]:
+    """Numbers from a file with one msisdn per line; blank lines and # comments are skipped."""
+    msisdns = []
+    with open(path) as fh:
+        for line_no, line in enumerate(fh, 1):
+            value = line.split('#', 1)[0].strip()
+            if not value:
+                continue
+            if not re.fullmatch(r'\d+', value):
+                print(f'[WARNING] {path}:{line_no}: skipping invalid msisdn {value!r}')
+                continue
+            msisdns.append(value)
+    return msisdns
 
 
 def get_terminal_size():
@@ -40,41 +130,171 @@ def render_report(chain, render_type):
 
     elif render_type == 'uml':
         report_generator = PlantUMLReporter()
-        print(report_generator.render(chain))
     else:
         print(f'Unknown render type: {render_type}')
+        return
+    print(report_generator.render(chain))
+
+
+def write_reports(chains: dict, render_type: str, output_dir):
+    """Render every chain of a bulk run into <output_dir>/<msisdn>.txt|.md."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if render_type == 'md':
+        report_generator, suffix = MarkdownReporter(), 'md'
+    else:
+        report_generator, suffix = AsciiReporter(total_width=ASCII_REPORT_WIDTH), 'txt'
+
+    for msisdn, chain in chains.items():
+        with open(output_dir / f'{msisdn}.{suffix}', 'w') as fh:
+            fh.write(report_generator.render(chain))
+    found = sum(1 for chain in chains.values() if chain)
+    print(f'{len(chains)} subscribers traced, {found} with messages, reports in {output_dir}')
+
+
+def export_report(chain, out_path):
+    count = export_chain(sorted(chain, key=lambda msg: msg.ts_us), Path(out_path))
+    print(f'{count} frames exported to {out_path}')
+
+
+def iter_messages(args, fp: FilePool, since: datetime, to: datetime, tshark_filter: dict,
+                  timer: StageTimer = None):
+    """Messages of all selected dumps; files are processed in chronological order."""
+    if args.archive:
+        messages = MessageArchive(fp.dump_folder).messages(since, to)
+        yield from timer.iter('archive_read', messages) if timer else messages
+        return
+
+    files = list(fp.select(since=since, to=to))
+    if args.targeted:
+        start = datetime.now()
+        extractor = TargetedExtractor([file.filepath for file in files], tshark_filter, args.msisdn,
+                                      backend=args.backend, jobs=args.jobs)
+        # phases run tshark in threads, timed as a whole
+        yield from timer.iter('targeted', extractor.scan()) if timer else extractor.scan()
+        print(f'elapsed time for targeted extraction of {len(files)} files: {datetime.now() - start}')
+    elif args.asyncio:
+        start = datetime.now()
+        yield from iter_async(aextract_parallel(files, tshark_filter,
+                                                backend=args.backend, jobs=args.jobs,
+                                                use_cache=not args.no_cache, timer=timer))
+        print(f'elapsed time for {len(files)} files: {datetime.now() - start}')
+    elif args.jobs > 1:
+        start = datetime.now()
+        for _, messages in extract_parallel(files, tshark_filter,
+                                            backend=args.backend, jobs=args.jobs,
+                                            use_cache=not args.no_cache, timer=timer, shards=args.shards):
+            yield from messages
+        # dumps are extracted concurrently, only the total time is meaningful
+        print(f'elapsed time for {len(files)} files: {datetime.now() - start}')
+    else:
+        for file in files:
+            start = datetime.now()
+            extractor = EXTRACTORS[args.backend](date_filter=tshark_filter,
+                                                 pcap_path=file.filepath,
+                                                 save_json=False,
+                                                 stream=True,
+                                                 cache=None if args.no_cache else MessageCache(),
+                                                 timer=timer)
+
+            yield from extractor.scan()
+
+            print(f'elapsed time for {file.filepath.name}: {datetime.now() - start}')
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'follow':
+        # follow mode has its own arguments, see follow.py
+        from .follow import main as follow_main
+        return follow_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        from .watcher import main as watch_main
+        return watch_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'index':
+        from .sqlindex import main as index_main
+        return index_main(sys.argv[2:])
+
     args = parse_args()
-    store = msgstore.MessageStore()
-    if args.dump_folder:
-        fp = FilePool(args.dump_folder)
-    else:
-        raise ValueError('dump_folder must be specified')
+    if not (args.profile or args.profile_parse):
+        return trace(args)
 
+    timer = StageTimer(profile_stage='parse' if args.profile_parse else None)
+    try:
+        trace(args, timer)
+    finally:
+        timer.print_summary()
+        if args.profile:
+            timer.write(args.profile)
+            print(f'profile written to {args.profile}')
+        if args.profile_parse:
+            timer.dump_profile(args.profile_parse)
+            print(f'parse stage cProfile written to {args.profile_parse}')
+
+
+def trace(args, timer: StageTimer = None):
+    """Build and report the chains requested by the command line arguments."""
     since = datetime.strptime(args.since, "%Y-%m-%d") if args.since else datetime.fromtimestamp(0)
     to = datetime.strptime(args.to, "%Y-%m-%d") if args.to else datetime.now()
 
     tshark_filter = {"start": since.timestamp(), "end":to.timestamp()}
 
+    msisdns = read_msisdn_file(args.msisdn_file) if args.msisdn_file else None
+
     print(f'{since=}, {to=}')
-    for file in fp.select(since=since, to=to):
-        start = datetime.now()
-        extractor = TsharkExtractor(date_filter=tshark_filter,
-                                    pcap_path=file.filepath,
-                                    save_json=False)
+    if args.db:
+        # the index already holds every message, queries go to the database
+        # and no dump is probed
+        store = SqliteMessageStore(args.db, since, to)
+        messages = store.iter_sorted()
+    else:
+        if args.dump_folder:
+            fp = FilePool(args.dump_folder, timer=timer, recursive=args.recursive, since=since, to=to,
+                          partition_tz=args.partition_tz)
+        else:
+            raise ValueError('dump_folder must be specified')
+        store = STORES[args.store]()
+        messages = iter_messages(args, fp, since, to, tshark_filter, timer)
+
+    if args.correlate:
+        chains = {msisdn: [] for msisdn in (msisdns or [args.msisdn])}
+        correlated_chains = correlate(messages, chains, ttl=args.ttl)
+        for correlated in timer.iter('correlate', correlated_chains) if timer else correlated_chains:
+            chains[correlated.msisdn].extend(correlated.messages)
+        with stage(timer, 'render'):
+            if msisdns is not None:
+                write_reports(chains, args.render, args.output_dir)
+            else:
+                render_report(chains[args.msisdn], args.render)
+        if args.export_pcap and msisdns is None:
+            with stage(timer, 'export'):
+                export_report(chains[args.msisdn], args.export_pcap)
+        return
 
-        for frame in extractor.scan():
-            store.add(frame)
+    if not args.db:
+        add = store.add if timer is None else timer.wrap('store_add', store.add)
+        for message in messages:
+            add(message)
 
-        print(f'elapsed time for {file.filepath.name}: {datetime.now() - start}')
+    if msisdns is not None:
+        with stage(timer, 'chain_build', len(msisdns)):
+            chains = analyzer.build_chains(store, msisdns)
+        with stage(timer, 'render', len(chains)):
+            write_reports(chains, args.render, args.output_dir)
+        return
 
-    message_chain = analyzer.MessageChain(store, args.msisdn)
-    message_chain.build()
-    chain = message_chain.get_chain()
+    with stage(timer, 'chain_build', 1):
+        if args.imsi:
+            message_chain = analyzer.ImsiMessageChain(store, args.imsi)
+        else:
+            message_chain = analyzer.MessageChain(store, args.msisdn)
+        message_chain.build()
+        chain = message_chain.get_chain()
 
-    render_report(chain, args.render)
+    with stage(timer, 'render', 1):
+        render_report(chain, args.render)
+    if args.export_pcap:
+        with stage(timer, 'export'):
+            export_report(chain, args.export_pcap)
 
 
 if __name__ == '__main__':
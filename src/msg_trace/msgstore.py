@@ -1,7 +1,10 @@
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Iterator
-from .models import Message, MsgType
+from .models import Message, MsgType, datetime_to_us
 
 @dataclass()
 class _Bucket:
@@ -18,10 +21,19 @@ class MessageStore:
         self._by_msisdn = defaultdict(list)
         self._by_opcode = defaultdict(list)
         self._by_imsi   = defaultdict(list)
+        # indexes of _all ordered by time; kept up to date while messages
+        # arrive in time order, rebuilt lazily on the next query otherwise
+        self._time_order = array('q')
+        self._time_order_valid = True
 
     def add(self, msg: Message):
         idx = len(self._all)
         self._all.append(msg)
+        if self._time_order_valid:
+            if not self._time_order or self._all[self._time_order[-1]].ts_us <= msg.ts_us:
+                self._time_order.append(idx)
+            else:
+                self._time_order_valid = False
         if msg.tid:               self._by_tid[msg.tid].append(idx)
         if msg.msisdn:            self._by_msisdn[msg.msisdn].append(idx)
         if msg.imsi:              self._by_imsi[msg.imsi].append(idx)
@@ -43,5 +55,38 @@ class MessageStore:
     def filter_all(self) -> Iterator[Message]:
        yield from self._all
 
-    def sort_by_datetime(self):
-        return sorted(self._all, key=lambda msg: msg.datetime)
+    def sort_by_datetime(self) -> list[Message]:
+        return list(self.iter_sorted())
+
+    def iter_sorted(self) -> Iterator[Message]:
+        """All messages in time order, without re-sorting the store."""
+        for i in self._ordered():
+            yield self._all[i]
+
+    def between(self, since: datetime | int, to: datetime | int) -> list[Message]:
+        """
+        Messages with since <= time <= to, in time order.
+
+        Bounds are datetimes or epoch microseconds; the lookup is a bisect over
+        the time index.
+        """
+        order = self._ordered()
+        key = self._ts_of
+        lo = bisect_left(order, _as_us(since), key=key)
+        hi = bisect_right(order, _as_us(to), lo=lo, key=key)
+        return [self._all[i] for i in order[lo:hi]]
+
+    # ---------- helpers ----------
+    def _ts_of(self, idx: int) -> int:
+        return self._all[idx].ts_us
+
+    def _ordered(self) -> array:
+        if not self._time_order_valid:
+            # Timsort is close to linear on the mostly ordered input of dumps
+            self._time_order = array('q', sorted(range(len(self._all)), key=self._ts_of))
+            self._time_order_valid = True
+        return self._time_order
+
+
+def _as_us(value: datetime | int) -> int:
+    return datetime_to_us(value) if isinstance(value, datetime) else value
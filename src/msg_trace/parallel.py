@@ -0,0 +1,270 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+from . import pcapfile
+from .cache import MessageCache
+from .capinfo import CapInfo
+from .extractor import EXTRACTORS
+from .models import Message
+from .profiling import StageTimer
+
+# messages handed from a producer to the consumer at once
+BATCH_SIZE = 256
+# dumps are not split into shards smaller than this
+MIN_SHARD_BYTES = 64 << 20
+# seconds of capture before a shard dissected again for the dialogues open at the cut
+SHARD_LEAD_IN = 30.0
+
+
+def extract_file(pcap_path: Path, date_filter: dict, backend: str = 'json', use_cache: bool = False,
+                 shard: pcapfile.Shard = None) -> list[Message]:
+    """
+    Run extraction and parsing of a single pcap file, or of one shard of it.
+
+    Executed in a worker process, so it takes only picklable arguments and
+    returns the parsed messages as a list.
+    """
+    extractor = EXTRACTORS[backend](date_filter=date_filter,
+                                    pcap_path=pcap_path,
+                                    save_json=False,
+                                    stream=True,
+                                    cache=MessageCache() if use_cache else None,
+                                    shard=shard)
+    return list(extractor.scan())
+
+
+def extract_file_profiled(pcap_path: Path, date_filter: dict, backend: str = 'json',
+                          use_cache: bool = False, shard: pcapfile.Shard = None) -> tuple[list[Message], dict]:
+    """`extract_file` with a `StageTimer`, returns the messages and the timer's summary."""
+    timer = StageTimer()
+    extractor = EXTRACTORS[backend](date_filter=date_filter,
+                                    pcap_path=pcap_path,
+                                    save_json=False,
+                                    stream=True,
+                                    cache=MessageCache() if use_cache else None,
+                                    timer=timer,
+                                    shard=shard)
+    return list(extractor.scan()), timer.summary()
+
+
+def plan_file(info: CapInfo, shards: int) -> list[Optional[pcapfile.Shard]]:
+    """
+    Shards a dump is extracted in, `[None]` when it is extracted whole.
+
+    Dumps are split only into shards of at least `MIN_SHARD_BYTES`, and formats
+    the native reader does not know (e.g. compressed dumps) are never split.
+    """
+    if shards < 2:
+        return [None]
+    count = min(shards, info.filepath.stat().st_size // MIN_SHARD_BYTES)
+    if count < 2:
+        return [None]
+    try:
+        planned = pcapfile.plan_shards(info.filepath, count, lead_in=SHARD_LEAD_IN)
+    except ValueError:
+        return [None]
+    return planned if len(planned) > 1 else [None]
+
+
+def extract_parallel(files: Iterable[CapInfo], date_filter: dict, backend: str = 'json', jobs: int = 1,
+                     max_in_flight: int = None, use_cache: bool = False, timer: StageTimer = None,
+                     shards: int = 1) -> Iterator[tuple[CapInfo, list[Message]]]:
+    """
+    Extract several pcap files at once in a process pool.
+
+    Files are processed in chronological order (ties broken by path) and results
+    are yielded in that same order whatever order the workers finish in, so the
+    resulting `MessageStore` does not depend on scheduling.  At most
+    `max_in_flight` files (2 * jobs by default) are submitted or waiting to be
+    consumed, which bounds the memory held by finished but unconsumed results.
+
+    With `shards` > 1 large dumps are also split into shards (`plan_file`) that
+    are extracted by different workers, so a single huge dump keeps all of them
+    busy.  A shard is yielded as a part of its file, shards in frame order,
+    and every message keeps the frame number it has in the whole dump.  Each
+    shard is preceded by `SHARD_LEAD_IN` seconds of capture that tshark
+    dissects but does not print, so dialogues open at a cut are decoded as if
+    the dump was read whole.  Sharded dumps are not served from or stored in
+    the message cache.
+
+    :param files: CapInfo objects to extract, e.g. `FilePool.select(...)`
+    :param date_filter: dict with "start" and "end" epoch timestamps
+    :param backend: key of `EXTRACTORS`
+    :param jobs: number of worker processes
+    :param max_in_flight: upper bound of submitted but not yet consumed files
+    :param use_cache: serve and store windows through `MessageCache`
+    :param timer: collects the stage timings taken in the workers
+    :param shards: number of shards a large dump is split into
+    :return: iterator of (CapInfo, messages) pairs, a file may come in several parts
+    """
+    if jobs < 1:
+        raise ValueError(f'jobs must be positive, got {jobs}')
+    max_in_flight = max_in_flight or 2 * jobs
+    ordered = sorted(files, key=lambda info: (info.ts_start, str(info.filepath)))
+    # shards are planned lazily, when the first one of a dump is submitted
+    parts = ((info, shard) for info in ordered for shard in plan_file(info, shards))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        in_flight = deque()
+
+        def submit_next() -> bool:
+            info, shard = next(parts, (None, None))
+            if info is None:
+                return False
+            func = extract_file if timer is None else extract_file_profiled
+            in_flight.append((info, pool.submit(func, info.filepath, date_filter, backend, use_cache, shard)))
+            return True
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        try:
+            while in_flight:
+                info, future = in_flight.popleft()
+                messages = future.result()
+                if timer is not None:
+                    messages, summary = messages
+                    timer.merge(summary)
+                for message in messages:
+                    # the worker's copy of the source has no time bounds
+                    message.meta = info
+                submit_next()
+                yield info, messages
+        finally:
+            # consumer stopped early: drop what has not started yet
+            for _, future in in_flight:
+                future.cancel()
+
+
+async def aextract_parallel(files: Iterable[CapInfo], date_filter: dict, backend: str = 'json', jobs: int = 1,
+                            max_in_flight: int = None, max_queued: int = 8192, use_cache: bool = False,
+                            timer: StageTimer = None) -> AsyncIterator[Message]:
+    """
+    Extract several pcap files at once with asyncio, in this process.
+
+    Every file is read by a producer task running `TsharkExtractor.ascan`; a
+    semaphore lets at most `jobs` of them run tshark at the same time.  Each
+    producer hands its messages over through a bounded queue, so when the
+    consumer falls behind the producers wait, stop reading and tshark blocks on
+    its pipe instead of the messages piling up in memory.
+
+    As in `extract_parallel`, files are processed in chronological order (ties
+    broken by path) and messages are yielded file after file in that order, and
+    at most `max_in_flight` files (2 * jobs by default) are started ahead of the
+    consumer.  Parsing runs in the event loop, so this pays off when tshark is
+    the bottleneck.
+
+    :param files: CapInfo objects to extract, e.g. `FilePool.select(...)`
+    :param date_filter: dict with "start" and "end" epoch timestamps
+    :param backend: key of `EXTRACTORS`
+    :param jobs: number of tshark processes run at once
+    :param max_in_flight: upper bound of started but not yet consumed files
+    :param max_queued: messages a producer may have waiting for the consumer
+    :param use_cache: serve and store windows through `MessageCache`
+    :param timer: stage timings; time the consumer waits for messages counts as `tshark_wait`
+    :return: async iterator of messages, their `meta` set to the file's CapInfo
+    """
+    if jobs < 1:
+        raise ValueError(f'jobs must be positive, got {jobs}')
+    max_in_flight = max(max_in_flight or 2 * jobs, jobs)
+    queue_size = max(1, max_queued // BATCH_SIZE)
+    ordered = iter(sorted(files, key=lambda info: (info.ts_start, str(info.filepath))))
+    semaphore = asyncio.Semaphore(jobs)
+    in_flight = deque()
+
+    def start_next() -> bool:
+        info = next(ordered, None)
+        if info is None:
+            return False
+        extractor = EXTRACTORS[backend](date_filter=date_filter,
+                                        pcap_path=info.filepath,
+                                        save_json=False,
+                                        stream=True,
+                                        cache=MessageCache() if use_cache else None,
+                                        timer=timer)
+        queue = asyncio.Queue(maxsize=queue_size)
+        in_flight.append((queue, asyncio.ensure_future(_produce(info, extractor, semaphore, queue))))
+        return True
+
+    while len(in_flight) < max_in_flight and start_next():
+        pass
+
+    try:
+        while in_flight:
+            queue, task = in_flight[0]
+            while True:
+                if timer is None:
+                    batch = await queue.get()
+                else:
+                    timer.start('tshark_wait')
+                    try:
+                        batch = await queue.get()
+                    finally:
+                        timer.stop()
+                if batch is None:
+                    break
+                for message in batch:
+                    yield message
+            in_flight.popleft()
+            # re-raises the error of a failed extraction
+            await task
+            start_next()
+    finally:
+        # consumer stopped early or an extraction failed: kill the remaining tshark processes
+        for _, task in in_flight:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True)
+
+
+async def _produce(info: CapInfo, extractor, semaphore: asyncio.Semaphore, queue: asyncio.Queue):
+    """Feed the messages of one file into `queue` in batches, `None` marks the end."""
+    try:
+        async with semaphore:
+            messages = extractor.ascan()
+            try:
+                batch = []
+                async for message in messages:
+                    # the extractor's copy of the source has no time bounds
+                    message.meta = info
+                    batch.append(message)
+                    if len(batch) >= BATCH_SIZE:
+                        await queue.put(batch)
+                        batch = []
+            finally:
+                await messages.aclose()
+        if batch:
+            await queue.put(batch)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        await queue.put(None)
+        raise
+    await queue.put(None)
+
+
+def iter_async(aiterable: AsyncIterable) -> Iterator:
+    """
+    Items of an async iterable for synchronous code.
+
+    The iterable is driven by an event loop of its own; when the caller stops
+    early it is closed, which stops whatever it still runs.
+    """
+    loop = asyncio.new_event_loop()
+    iterator = aiterable.__aiter__()
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        try:
+            if hasattr(iterator, 'aclose'):
+                loop.run_until_complete(iterator.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
@@ -0,0 +1,592 @@
+"""
+Native reader of pcap/pcapng capture files.
+
+Only block and record headers are looked at, payloads are skipped, so the
+first and last packet timestamps of a dump can be found without capinfos or
+any other part of a Wireshark install.  The same walk splits a dump into
+shards that tshark can read on their own, see `plan_shards`.
+
+gzip and zstd compressed dumps are read front to back through a
+decompressing stream (`open_capture`), never decompressed to disk.  zstd
+needs the `zstandard` package.
+"""
+import gzip
+import mmap
+import struct
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+try:
+    import zstandard
+except ImportError:
+    # zstd dumps are then left to capinfos and tshark
+    zstandard = None
+
+# classic pcap magic -> (byte order, fraction of a second in ts_usec/ts_nsec field)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAP_HEADER_LEN = 24
+PCAP_RECORD_LEN = 16
+
+# pcapng block types
+SHB_TYPE = 0x0A0D0D0A
+IDB_TYPE = 0x00000001
+PB_TYPE  = 0x00000002  # obsolete Packet Block
+SPB_TYPE = 0x00000003
+EPB_TYPE = 0x00000006
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# IDB options
+OPT_END_OF_OPT = 0
+OPT_IF_TSRESOL = 9
+OPT_IF_TSOFFSET = 14
+
+# compressed dumps
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# a tail candidate of a classic pcap is accepted only if it is not older than
+# the first packet and not newer than this many seconds after it
+MAX_CAPTURE_SPAN = 366 * 24 * 3600
+
+
+class Frame(NamedTuple):
+    """A packet record as stored in the capture, see `read_frames`."""
+    number: int        # 1-based position in the file, tshark's frame.number
+    ts: float          # epoch seconds
+    ts_units: int      # raw timestamp in units of the interface's resolution
+    interface: int     # index of the interface within the file (across pcapng sections)
+    caplen: int
+    origlen: int
+    data: bytes
+
+
+class Interface(NamedTuple):
+    """Link description of the packets of an interface."""
+    linktype: int
+    snaplen: int
+    tsresol: int       # raw if_tsresol option value: 6 = µs, 9 = ns, 0x80|n = 2^-n
+    tsoffset: int      # seconds added to every timestamp
+
+
+class Shard(NamedTuple):
+    """
+    Part of a capture that is a valid capture by itself, see `plan_shards`.
+
+    Its bytes are the `header` ranges followed by the records from `start` to
+    `end`.  The first `lead_in` records precede the shard's own records and are
+    there for context only; the first own record is frame `first_frame` of the
+    whole file.
+    """
+    header: tuple[tuple[int, int], ...]
+    start: int
+    end: int
+    first_frame: int
+    lead_in: int
+
+    def ranges(self) -> list[tuple[int, int]]:
+        """Byte ranges to copy, in order."""
+        return [*self.header, (self.start, self.end)]
+
+    @property
+    def frame_offset(self) -> int:
+        """Added to a frame number within the shard to get the frame number in the file."""
+        return self.first_frame - 1 - self.lead_in
+
+
+class PcapBounds(NamedTuple):
+    """Epoch timestamps (seconds) of the first and last packet, frames is None unless counted."""
+    frames: Optional[int]
+    ts_start: Optional[float]
+    ts_end: Optional[float]
+
+
+def read_bounds(pcap_path, count_frames: bool = False) -> PcapBounds:
+    """
+    Find first and last packet timestamps of a pcap or pcapng file.
+
+    By default the last packet is located from the end of the file: pcapng
+    blocks carry a trailing length, and for classic pcap the tail is searched
+    for a record that ends exactly at EOF.  With `count_frames=True` (or if
+    the fast path is inconclusive, e.g. the file is still being written) all
+    record headers are walked, which also yields the number of frames.
+
+    :raises ValueError: the file is neither pcap nor pcapng
+    """
+    path = Path(pcap_path)
+    if compression(path) is not None:
+        # no way to jump to the tail, every record is walked
+        with open_capture(path) as stream:
+            reader = _stream_reader(stream, path)
+            return reader.bounds(count_frames=True) if reader is not None else PcapBounds(0, None, None)
+    with open(path, 'rb') as fh:
+        if path.stat().st_size == 0:
+            return PcapBounds(0, None, None)
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic = mm[:4]
+            if magic in PCAP_MAGIC:
+                return _PcapReader(mm).bounds(count_frames)
+            if len(mm) >= 4 and struct.unpack_from('<I', mm)[0] == SHB_TYPE:
+                return _PcapngReader(mm).bounds(count_frames)
+            raise ValueError(f'{path}: unknown capture file format (magic {magic.hex()})')
+
+
+def iter_records(pcap_path) -> Iterator[tuple[Optional[float], bytes]]:
+    """
+    Raw records of a pcap or pcapng file with their epoch timestamps.
+
+    Writing all records out in order reproduces the file.  File headers and
+    pcapng blocks without a timestamp (SHB, IDB, statistics...) come with None.
+    A truncated record at the end of a file still being written is not returned.
+
+    :raises ValueError: the file is neither pcap nor pcapng
+    """
+    path = Path(pcap_path)
+    if path.stat().st_size == 0:
+        return
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic = mm[:4]
+        if magic in PCAP_MAGIC:
+            yield None, mm[:PCAP_HEADER_LEN]
+            for offset, end, ts in _PcapReader(mm).records():
+                yield ts, mm[offset:end]
+        elif len(mm) >= 4 and struct.unpack_from('<I', mm)[0] == SHB_TYPE:
+            reader = _PcapngReader(mm)
+            for offset, block_len, block_type in reader.blocks():
+                ts = reader._packet_ts(offset, block_type) if block_type in (EPB_TYPE, PB_TYPE) else None
+                yield ts, mm[offset:offset + block_len]
+        else:
+            raise ValueError(f'{path}: unknown capture file format (magic {magic.hex()})')
+
+
+def compression(pcap_path) -> Optional[str]:
+    """'gzip' or 'zstd' for a compressed dump, None otherwise (by magic, not by name)."""
+    with open(pcap_path, 'rb') as fh:
+        magic = fh.read(4)
+    if magic[:2] == GZIP_MAGIC:
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+def open_capture(pcap_path) -> BinaryIO:
+    """
+    Binary stream of the capture in a dump, decompressed on the fly.
+
+    :raises ValueError: zstd dump and `zstandard` is not installed
+    """
+    kind = compression(pcap_path)
+    if kind == 'gzip':
+        return gzip.open(pcap_path, 'rb')
+    if kind == 'zstd':
+        if zstandard is None:
+            raise ValueError(f'{pcap_path}: zstd compressed, reading it needs the zstandard package')
+        return zstandard.ZstdDecompressor().stream_reader(open(pcap_path, 'rb'), closefd=True)
+    return open(pcap_path, 'rb')
+
+
+def plan_shards(pcap_path, count: int, lead_in: float = 30.0) -> list[Shard]:
+    """
+    Split a capture into at most `count` shards of about the same size.
+
+    Shards are cut at record boundaries and together hold every record once.
+    Each one starts with the records of the `lead_in` seconds of capture before
+    its own first record, so that tshark has seen the beginning of dialogues
+    that were open at the cut.  For pcapng files the header of a shard is the
+    SHB of its section and the IDBs that precede its first record.  Only record
+    headers are walked.
+
+    :raises ValueError: the file is neither pcap nor pcapng
+    """
+    path = Path(pcap_path)
+    size = path.stat().st_size
+    if size == 0:
+        return []
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic = mm[:4]
+        if magic in PCAP_MAGIC:
+            header = ((0, PCAP_HEADER_LEN),)
+            packets = ((offset, end, ts, header) for offset, end, ts in _PcapReader(mm).records())
+        elif len(mm) >= 4 and struct.unpack_from('<I', mm)[0] == SHB_TYPE:
+            packets = _PcapngReader(mm).packets()
+        else:
+            raise ValueError(f'{path}: unknown capture file format (magic {magic.hex()})')
+        return _split(packets, size, count, lead_in)
+
+
+def _split(packets, size: int, count: int, lead_in: float) -> list[Shard]:
+    shards = []
+    # (offset, ts, header) of the packets of the last `lead_in` seconds
+    window = deque()
+    current = None  # [header, start, first_frame, lead_in] of the open shard
+    boundary = 0
+    last_end = 0
+    last_ts = None
+    for number, (offset, end, ts, header) in enumerate(packets, 1):
+        # packets without a timestamp (SPB) count as taken with the one before
+        ts = last_ts if ts is None else ts
+        if ts is not None:
+            while window and (window[0][1] is None or window[0][1] < ts - lead_in):
+                window.popleft()
+        if offset >= boundary:
+            if current is not None:
+                shards.append(Shard(current[0], current[1], offset, current[2], current[3]))
+            start, first_header = (window[0][0], window[0][2]) if window else (offset, header)
+            current = [first_header, start, number, len(window)]
+            while boundary <= offset:
+                boundary += size / count
+        window.append((offset, ts, header))
+        last_end, last_ts = end, ts
+    if current is not None:
+        shards.append(Shard(current[0], current[1], last_end, current[2], current[3]))
+    return shards
+
+
+def read_frames(pcap_path, numbers) -> tuple[list[Interface], list[Frame]]:
+    """
+    Packets with the given frame numbers and the interfaces they refer to.
+
+    Only record headers are walked, and only up to the highest wanted frame,
+    so picking a few frames out of a large dump is cheap.
+
+    :raises ValueError: the file is neither pcap nor pcapng
+    """
+    wanted = set(numbers)
+    if not wanted:
+        return [], []
+    path = Path(pcap_path)
+    if compression(path) is not None:
+        with open_capture(path) as stream:
+            reader = _stream_reader(stream, path)
+            return reader.frames(wanted) if reader is not None else ([], [])
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic = mm[:4]
+        if magic in PCAP_MAGIC:
+            return _PcapReader(mm).frames(wanted)
+        if len(mm) >= 4 and struct.unpack_from('<I', mm)[0] == SHB_TYPE:
+            return _PcapngReader(mm).frames(wanted)
+        raise ValueError(f'{path}: unknown capture file format (magic {magic.hex()})')
+
+
+def _stream_reader(stream: BinaryIO, path: Path):
+    """Reader walking a capture from a stream, None if the capture is empty."""
+    magic = _read_exact(stream, 4)
+    if not magic:
+        return None
+    if magic in PCAP_MAGIC:
+        return _PcapStreamReader(magic + _read_exact(stream, PCAP_HEADER_LEN - 4), stream)
+    if len(magic) == 4 and struct.unpack('<I', magic)[0] == SHB_TYPE:
+        return _PcapngStreamReader(stream, magic)
+    raise ValueError(f'{path}: unknown capture file format (magic {magic.hex()})')
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    """Up to `size` bytes, fewer only at the end of the stream."""
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+class _PcapReader:
+    def __init__(self, buf):
+        self._buf = buf
+        self._order, self._scale = PCAP_MAGIC[bytes(buf[:4])]
+        self._record = struct.Struct(self._order + 'IIII')
+        self._snaplen = struct.unpack_from(self._order + 'I', buf, 16)[0]
+
+    def bounds(self, count_frames: bool) -> PcapBounds:
+        first = self._record_at(PCAP_HEADER_LEN)
+        if first is None:
+            return PcapBounds(0, None, None)
+        if not count_frames:
+            last = self._last_from_tail(first)
+            if last is not None:
+                return PcapBounds(None, first, last)
+        return self._walk()
+
+    def _record_at(self, offset: int) -> Optional[float]:
+        if offset + PCAP_RECORD_LEN > len(self._buf):
+            return None
+        sec, frac, _, _ = self._record.unpack_from(self._buf, offset)
+        return sec + frac * self._scale
+
+    def records(self) -> Iterator[tuple[int, int, float]]:
+        """Start offset, end offset and timestamp of every complete record."""
+        buf, size, unpack_from = self._buf, len(self._buf), self._record.unpack_from
+        offset = PCAP_HEADER_LEN
+        while offset + PCAP_RECORD_LEN <= size:
+            sec, frac, incl_len, _ = unpack_from(buf, offset)
+            end = offset + PCAP_RECORD_LEN + incl_len
+            if end > size:
+                # truncated record of a capture that is still being written
+                break
+            yield offset, end, sec + frac * self._scale
+            offset = end
+
+    def frames(self, wanted: set[int]) -> tuple[list[Interface], list[Frame]]:
+        linktype = struct.unpack_from(self._order + 'I', self._buf, 20)[0]
+        interface = Interface(linktype & 0x0FFFFFFF, self._snaplen, 9 if self._scale < 1e-6 else 6, 0)
+        units = round(1 / self._scale)
+        last = max(wanted)
+        found = []
+        for number, (offset, end, ts) in enumerate(self.records(), 1):
+            if number in wanted:
+                sec, frac, incl_len, orig_len = self._record.unpack_from(self._buf, offset)
+                found.append(Frame(number, ts, sec * units + frac, 0, incl_len, orig_len,
+                                   bytes(self._buf[offset + PCAP_RECORD_LEN:end])))
+            if number >= last:
+                break
+        return [interface], found
+
+    def _walk(self) -> PcapBounds:
+        frames = 0
+        first = last = None
+        for _, _, last in self.records():
+            if first is None:
+                first = last
+            frames += 1
+        return PcapBounds(frames, first, last)
+
+    def _last_from_tail(self, first_ts: float) -> Optional[float]:
+        """Search backwards for a record header whose data ends exactly at EOF."""
+        size = len(self._buf)
+        max_frac = 1 / self._scale
+        lowest = max(PCAP_HEADER_LEN, size - PCAP_RECORD_LEN - min(self._snaplen or 0xFFFF, 1 << 18))
+        for offset in range(size - PCAP_RECORD_LEN, lowest - 1, -1):
+            sec, frac, incl_len, orig_len = self._record.unpack_from(self._buf, offset)
+            if offset + PCAP_RECORD_LEN + incl_len != size:
+                continue
+            if frac >= max_frac or orig_len < incl_len:
+                continue
+            ts = sec + frac * self._scale
+            if first_ts <= ts <= first_ts + MAX_CAPTURE_SPAN:
+                return ts
+        return None
+
+
+class _PcapStreamReader(_PcapReader):
+    """`_PcapReader` over a stream: `_buf` holds the file header, then one record at a time."""
+
+    def __init__(self, header: bytes, stream: BinaryIO):
+        super().__init__(header)
+        self._stream = stream
+
+    def bounds(self, count_frames: bool) -> PcapBounds:
+        return self._walk()
+
+    def records(self) -> Iterator[tuple[int, int, float]]:
+        while True:
+            head = _read_exact(self._stream, PCAP_RECORD_LEN)
+            if len(head) < PCAP_RECORD_LEN:
+                break
+            sec, frac, incl_len, _ = self._record.unpack(head)
+            data = _read_exact(self._stream, incl_len)
+            if len(data) < incl_len:
+                break
+            self._buf = head + data
+            yield 0, len(self._buf), sec + frac * self._scale
+
+
+class _PcapngReader:
+    def __init__(self, buf):
+        self._buf = buf
+        self._order = '<'
+        # (tsresol, tsoffset) of every interface of the current section
+        self._interfaces: list[tuple[float, int]] = []
+        # every interface of the file and the file-wide index of those of the current section
+        self._all_interfaces: list[Interface] = []
+        self._section_interfaces: list[int] = []
+
+    def bounds(self, count_frames: bool) -> PcapBounds:
+        if count_frames:
+            return self._walk(stop_at_first=False)
+
+        head = self._walk(stop_at_first=True)
+        if head.ts_start is None:
+            return PcapBounds(0, None, None)
+        last = self._last_from_tail()
+        if last is None:
+            return self._walk(stop_at_first=False)
+        return PcapBounds(None, head.ts_start, last)
+
+    def blocks(self) -> Iterator[tuple[int, int, int]]:
+        """Offset, length and type of every complete block; section and interface state follows along."""
+        size = len(self._buf)
+        offset = 0
+        while offset + 12 <= size:
+            # byte order of a section is known only after its SHB is read
+            if struct.unpack_from('<I', self._buf, offset)[0] == SHB_TYPE:
+                self._read_shb(offset)
+            block_type, block_len = self._block_header(offset)
+            if block_len < 12 or offset + block_len > size:
+                break
+            if block_type == IDB_TYPE:
+                self._read_idb(offset, block_len)
+            yield offset, block_len, block_type
+            offset += block_len
+
+    def packets(self) -> Iterator[tuple[int, int, Optional[float], tuple[tuple[int, int], ...]]]:
+        """
+        Start offset, end offset and timestamp of every packet block, with the
+        ranges of the SHB and IDBs that a file starting at this packet needs.
+        """
+        header = ()
+        for offset, block_len, block_type in self.blocks():
+            if block_type == SHB_TYPE:
+                header = ((offset, offset + block_len),)
+            elif block_type == IDB_TYPE:
+                header += ((offset, offset + block_len),)
+            elif block_type in (EPB_TYPE, PB_TYPE, SPB_TYPE):
+                yield offset, offset + block_len, self._packet_ts(offset, block_type), header
+
+    def frames(self, wanted: set[int]) -> tuple[list[Interface], list[Frame]]:
+        last = max(wanted)
+        found = []
+        number = 0
+        for offset, block_len, block_type in self.blocks():
+            if block_type not in (EPB_TYPE, PB_TYPE, SPB_TYPE):
+                continue
+            number += 1
+            if number in wanted:
+                found.append(self._frame_at(number, offset, block_len, block_type))
+            if number >= last:
+                break
+        return list(self._all_interfaces), found
+
+    def _frame_at(self, number: int, offset: int, block_len: int, block_type: int) -> Frame:
+        order = self._order
+        if block_type == SPB_TYPE:
+            # no timestamp, always the first interface
+            (origlen,) = struct.unpack_from(order + 'I', self._buf, offset + 8)
+            caplen = min(origlen, block_len - 16)
+            return Frame(number, 0.0, 0, self._section_interfaces[0], caplen, origlen,
+                         bytes(self._buf[offset + 12:offset + 12 + caplen]))
+        if block_type == EPB_TYPE:
+            if_id, ts_high, ts_low, caplen, origlen = struct.unpack_from(order + 'IIIII', self._buf, offset + 8)
+        else:
+            if_id, _, ts_high, ts_low, caplen, origlen = struct.unpack_from(order + 'HHIIII', self._buf, offset + 8)
+        return Frame(number, self._packet_ts(offset, block_type) or 0.0, (ts_high << 32) | ts_low,
+                     self._section_interfaces[if_id], caplen, origlen,
+                     bytes(self._buf[offset + 28:offset + 28 + caplen]))
+
+    def _walk(self, stop_at_first: bool) -> PcapBounds:
+        frames = 0
+        first = last = None
+        for offset, _, block_type in self.blocks():
+            if block_type in (EPB_TYPE, PB_TYPE, SPB_TYPE):
+                frames += 1
+                ts = self._packet_ts(offset, block_type)
+                if ts is not None:
+                    last = ts
+                    if first is None:
+                        first = ts
+                        if stop_at_first:
+                            break
+        return PcapBounds(frames, first, last)
+
+    def _last_from_tail(self) -> Optional[float]:
+        """
+        Walk blocks backwards using the trailing length of every block.
+
+        Interfaces are those of the first section; files made of several
+        sections (e.g. concatenated captures) should be read with `count_frames`.
+        """
+        buf, end = self._buf, len(self._buf)
+        while end >= 12:
+            block_len = struct.unpack_from(self._order + 'I', buf, end - 4)[0]
+            offset = end - block_len
+            if block_len < 12 or offset < 0:
+                return None
+            block_type, leading_len = self._block_header(offset)
+            if leading_len != block_len or block_type == SHB_TYPE:
+                # corrupted tail or another section with its own interfaces
+                return None
+            if block_type in (EPB_TYPE, PB_TYPE):
+                return self._packet_ts(offset, block_type)
+            end = offset
+        return None
+
+    def _block_header(self, offset: int) -> tuple[int, int]:
+        return struct.unpack_from(self._order + 'II', self._buf, offset)
+
+    def _read_shb(self, offset: int):
+        magic = struct.unpack_from('<I', self._buf, offset + 8)[0]
+        self._order = '<' if magic == BYTE_ORDER_MAGIC else '>'
+        self._interfaces = []
+        self._section_interfaces = []
+
+    def _read_idb(self, offset: int, block_len: int):
+        linktype, _, snaplen = struct.unpack_from(self._order + 'HHI', self._buf, offset + 8)
+        raw_tsresol = 6
+        tsresol, tsoffset = 1e-6, 0
+        opt = offset + 16
+        opt_end = offset + block_len - 4
+        while opt + 4 <= opt_end:
+            code, length = struct.unpack_from(self._order + 'HH', self._buf, opt)
+            if code == OPT_END_OF_OPT:
+                break
+            value = opt + 4
+            if code == OPT_IF_TSRESOL and length >= 1:
+                raw = raw_tsresol = self._buf[value]
+                tsresol = 2.0 ** -(raw & 0x7F) if raw & 0x80 else 10.0 ** -raw
+            elif code == OPT_IF_TSOFFSET and length >= 8:
+                tsoffset = struct.unpack_from(self._order + 'q', self._buf, value)[0]
+            opt = value + ((length + 3) & ~3)
+        self._interfaces.append((tsresol, tsoffset))
+        self._section_interfaces.append(len(self._all_interfaces))
+        self._all_interfaces.append(Interface(linktype, snaplen, raw_tsresol, tsoffset))
+
+    def _packet_ts(self, offset: int, block_type: int) -> Optional[float]:
+        if block_type == SPB_TYPE:
+            # Simple Packet Blocks have no timestamp
+            return None
+        if block_type == EPB_TYPE:
+            if_id, ts_high, ts_low = struct.unpack_from(self._order + 'III', self._buf, offset + 8)
+        else:
+            if_id, _, ts_high, ts_low = struct.unpack_from(self._order + 'HHII', self._buf, offset + 8)
+        if if_id >= len(self._interfaces):
+            return None
+        tsresol, tsoffset = self._interfaces[if_id]
+        return ((ts_high << 32) | ts_low) * tsresol + tsoffset
+
+
+class _PcapngStreamReader(_PcapngReader):
+    """`_PcapngReader` over a stream: `_buf` holds the current block, always at offset 0."""
+
+    def __init__(self, stream: BinaryIO, head: bytes = b''):
+        super().__init__(b'')
+        self._stream = stream
+        self._head = head
+
+    def bounds(self, count_frames: bool) -> PcapBounds:
+        return self._walk(stop_at_first=False)
+
+    def blocks(self) -> Iterator[tuple[int, int, int]]:
+        while True:
+            head = self._head + _read_exact(self._stream, 12 - len(self._head))
+            self._head = b''
+            if len(head) < 12:
+                break
+            self._buf = head
+            if struct.unpack_from('<I', head)[0] == SHB_TYPE:
+                self._read_shb(0)
+            block_type, block_len = self._block_header(0)
+            if block_len < 12:
+                break
+            body = _read_exact(self._stream, block_len - 12)
+            if len(body) < block_len - 12:
+                break
+            self._buf = head + body
+            if block_type == IDB_TYPE:
+                self._read_idb(0, block_len)
+            yield 0, block_len, block_type
@@ -0,0 +1,190 @@
+"""
+Per-stage timing of a run, enabled with `--profile`.
+
+A `StageTimer` is handed to the components the way a `MessageCache` is
+(`TsharkExtractor(timer=...)`, `FilePool(timer=...)`, ...).  Stages nest and
+time is exclusive: while tshark output is awaited inside the JSON decoder,
+that time counts for `tshark_wait`, not for `json_decode`.  Stages:
+
+    probe          reading dump time bounds (native reader or capinfos)
+    tshark_wait    blocked on tshark output, i.e. dissection not overlapped
+    json_decode    decoding tshark JSON / fields output into frames
+    parse          JsonParser / FieldsParser
+    parse_fallback frames JsonParser's fast path leaves to its generic path
+                   (items = number of fallbacks)
+    cache_read     messages served from the parsed message cache
+    store_add      MessageStore.add and index maintenance
+    chain_build    MessageChain.build / build_chains
+    render         reporters
+
+The summary also lists every extracted dump (frames, tshark run time, frames
+per second) and the peak RSS of this process and of tshark.  The parse stage
+can additionally be recorded with cProfile.
+"""
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is then left out
+    resource = None
+
+PROFILE_VERSION = 1
+
+
+class StageTimer:
+    """Exclusive wall time, call and item counts per stage, plus per-file extraction records."""
+
+    def __init__(self, profile_stage: Optional[str] = None):
+        """
+        :param profile_stage: stage recorded with cProfile, e.g. 'parse'
+        """
+        self._stages: dict[str, list] = {}  # name -> [seconds, calls, items]
+        self._stack: list[list] = []        # [name, resumed at]
+        self._files: list[dict] = []
+        self._started = time.perf_counter()
+        self._profile_stage = profile_stage
+        self._profiler = cProfile.Profile() if profile_stage else None
+
+    # ---------- recording ----------
+    def start(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            self._charge(self._stack[-1], now)
+        self._stack.append([name, now])
+        if name == self._profile_stage:
+            self._profiler.enable()
+
+    def stop(self, items: int = 0):
+        now = time.perf_counter()
+        top = self._stack.pop()
+        if top[0] == self._profile_stage:
+            self._profiler.disable()
+        self._charge(top, now)
+        entry = self._stages[top[0]]
+        entry[1] += 1
+        entry[2] += items
+        if self._stack:
+            self._stack[-1][1] = now
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(items)
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """`func` timed as one item of the stage on every call."""
+        def timed(*args, **kwargs):
+            self.start(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stop(1)
+        return timed
+
+    def iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Items of `iterable`, the time spent producing each one counted for the stage."""
+        iterator = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stop()
+                return
+            except BaseException:
+                self.stop()
+                raise
+            self.stop(1)
+            yield item
+
+    def add_file(self, path: Path, frames: int, seconds: float, tshark_seconds: Optional[float] = None,
+                 cached: bool = False):
+        """Record the extraction of one dump."""
+        self._files.append({"path": str(path),
+                            "frames": frames,
+                            "seconds": round(seconds, 6),
+                            "tshark_seconds": None if tshark_seconds is None else round(tshark_seconds, 6),
+                            "frames_per_second": round(frames / seconds, 1) if seconds else None,
+                            "cached": cached})
+
+    def merge(self, summary: dict):
+        """Add the stages and files of a summary taken in a worker process."""
+        for name, stats in summary["stages"].items():
+            entry = self._stages.setdefault(name, [0.0, 0, 0])
+            entry[0] += stats["seconds"]
+            entry[1] += stats["calls"]
+            entry[2] += stats["items"]
+        self._files.extend(summary["files"])
+
+    # ---------- output ----------
+    def summary(self) -> dict:
+        stages = {}
+        for name, (seconds, calls, items) in self._stages.items():
+            stages[name] = {"seconds": round(seconds, 6),
+                            "calls": calls,
+                            "items": items,
+                            "items_per_second": round(items / seconds, 1) if items and seconds else None}
+        return {"version": PROFILE_VERSION,
+                "wall_seconds": round(time.perf_counter() - self._started, 6),
+                "stages": stages,
+                "files": list(self._files),
+                **resource_usage()}
+
+    def write(self, path: Path):
+        with open(path, 'w') as fh:
+            json.dump(self.summary(), fh, indent=2)
+
+    def dump_profile(self, path: Path):
+        """Write the cProfile statistics of the profiled stage (pstats format)."""
+        self._profiler.dump_stats(path)
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f'{"stage":<14} {"seconds":>10} {"calls":>10} {"items/s":>12}')
+        for name, stats in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            rate = f'{stats["items_per_second"]:.0f}' if stats["items_per_second"] else '-'
+            print(f'{name:<14} {stats["seconds"]:>10.3f} {stats["calls"]:>10} {rate:>12}')
+        print(f'wall time {summary["wall_seconds"]:.3f} s, peak RSS {_mib(summary.get("peak_rss_bytes"))},'
+              f' tshark peak RSS {_mib(summary.get("peak_children_rss_bytes"))}')
+
+    # ---------- helpers ----------
+    def _charge(self, frame: list, now: float):
+        entry = self._stages.get(frame[0])
+        if entry is None:
+            entry = self._stages[frame[0]] = [0.0, 0, 0]
+        entry[0] += now - frame[1]
+
+
+def stage(timer: Optional[StageTimer], name: str, items: int = 0):
+    """`timer.stage(...)`, or a no-op context when profiling is off."""
+    return timer.stage(name, items) if timer is not None else nullcontext()
+
+
+def resource_usage() -> dict:
+    """
+    Peak RSS of this process and of its largest finished child (tshark) in
+    bytes, and the CPU time of all finished children.
+    """
+    if resource is None:
+        return {}
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"peak_rss_bytes": own.ru_maxrss * scale,
+            "peak_children_rss_bytes": children.ru_maxrss * scale,
+            "children_cpu_seconds": round(children.ru_utime + children.ru_stime, 3)}
+
+
+def _mib(value: Optional[int]) -> str:
+    return '-' if value is None else f'{value / (1 << 20):.0f} MiB'
@@ -1,7 +1,8 @@
 import os
+from functools import lru_cache
 from typing import Iterable, List
 from datetime import datetime
-from .models import Message, MsgType
+from .models import Message, MsgType, us_to_datetime
 
 
 class Reporter:
@@ -17,6 +18,11 @@ class Reporter:
     def _fmt_time(cls, ts: datetime) -> str:
         return ts.strftime("%d/%m %H:%M:%S")
 
+    @classmethod
+    def _fmt_ts(cls, ts_us: int) -> str:
+        """`_fmt_time` of an epoch-microsecond timestamp (UTC); the datetime is built here, at render time."""
+        return _fmt_second(ts_us // 1_000_000)
+
     @classmethod
     def _chain_is_empty(cls, chain):
         """
@@ -38,6 +44,12 @@ class Reporter:
 
 
 
+@lru_cache(maxsize=4096)
+def _fmt_second(second: int) -> str:
+    # messages of a chain mostly share their second, strftime runs once for them
+    return Reporter._fmt_time(us_to_datetime(second * 1_000_000))
+
+
 class AsciiReporter(Reporter):
     """
     Class responsible for generating ASCII-formatted reports of message chains.
@@ -95,7 +107,7 @@ class AsciiReporter(Reporter):
                 lines.append(f"│ OPC: {msg.opc:<{self.total_width - dpc_len - opc_len }} DPC: {msg.dpc:} │")
 
             time_line = (
-                f"{left_border} {self._fmt_time(msg.time):<{self.total_width - 4}} "
+                f"{left_border} {self._fmt_ts(msg.ts_us):<{self.total_width - 4}} "
                 f"{right_border}"
             )
             lines.append(time_line)
@@ -187,13 +199,13 @@ class MarkdownReporter(Reporter):
             match msg.opcode:
                 case MsgType.SRI | MsgType.MO_Forward_SM:
                     lines.append(f"_{msg.opc} ->>+ _{msg.dpc}: ")
-                    lines[-1] += f"{self._fmt_time(msg.time)}<br>tid = {msg.tid}<br>{msg.opcode.name}<br>MSISDN = {msg.msisdn}"
+                    lines[-1] += f"{self._fmt_ts(msg.ts_us)}<br>tid = {msg.tid}<br>{msg.opcode.name}<br>MSISDN = {msg.msisdn}"
                 case MsgType.MT_Forward_SM | MsgType.ResultLast:
                     lines.append(f"_{msg.opc} ->>- _{msg.dpc}: ")
-                    lines[-1] += f"{self._fmt_time(msg.time)}<br>tid = {msg.tid}<br>{msg.opcode.name}<br>IMSI = {msg.imsi}"
+                    lines[-1] += f"{self._fmt_ts(msg.ts_us)}<br>tid = {msg.tid}<br>{msg.opcode.name}<br>IMSI = {msg.imsi}"
                 case MsgType.Error:
                     lines.append(f"_{msg.opc} ->>- _{msg.dpc}:")
-                    lines[-1] += f"{self._fmt_time(msg.time)}<br>tid = {msg.tid}<br>{msg.opcode.name}<br>ErrorCode = {msg.imsi}"
+                    lines[-1] += f"{self._fmt_ts(msg.ts_us)}<br>tid = {msg.tid}<br>{msg.opcode.name}<br>ErrorCode = {msg.imsi}"
                 case _:
                     lines.append(f"note over _{msg.opc}, _{msg.dpc}: {msg=}")
 
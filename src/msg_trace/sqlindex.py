@@ -0,0 +1,316 @@
+"""
+Persistent SQLite index of the whole dump archive.
+
+`python -m msg_trace index` extracts every dump once and stores one row per
+message; `SqliteMessageStore` answers the `MessageStore` queries from that
+database, so `MessageChain` runs against months of dumps without tshark:
+
+    files    (id, path, size, mtime_ns, inode)
+    messages (ts_us, file_id, frame, tcap_state, opcode, tid, opc, dpc, msisdn, imsi)
+
+msisdn, imsi, tid, opcode and ts_us are indexed; a dump that changed since it
+was indexed is re-indexed with the next `index` run.  A dump modified within
+the last `settle` seconds (e.g. the file a capture still writes to) is left
+for a later run, and the rows of a dump that left the folder are deleted.  The schema version is
+kept in `PRAGMA user_version`: an index written by an older version is
+dropped on open and rebuilt by `index`, a newer one is refused.
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone, tzinfo
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .capinfo import CapInfo
+from .file_pool import FilePool, partition_timezone
+from .models import Message, MsgType, TCAPState, datetime_to_us
+from .parallel import extract_parallel
+
+INDEX_DB_NAME = '.msg_trace_index.sqlite'
+# 2: frame numbers are positions in the dump (time window in -Y, not -R)
+SCHEMA_VERSION = 2
+
+_OPCODES = {member.value: member for member in MsgType}
+_STATES = {member.value: member for member in TCAPState}
+
+# a dump is always indexed whole
+_WHOLE_FILE = {"start": 0, "end": 4102444800}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id       INTEGER PRIMARY KEY,
+    path     TEXT NOT NULL UNIQUE,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode    INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    ts_us      INTEGER NOT NULL,
+    file_id    INTEGER REFERENCES files(id),
+    frame      INTEGER,
+    tcap_state INTEGER,
+    opcode     INTEGER,
+    tid        TEXT,
+    opc        TEXT,
+    dpc        TEXT,
+    msisdn     TEXT,
+    imsi       TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_msisdn ON messages(msisdn) WHERE msisdn IS NOT NULL;
+CREATE INDEX IF NOT EXISTS messages_imsi   ON messages(imsi)   WHERE imsi IS NOT NULL;
+CREATE INDEX IF NOT EXISTS messages_tid    ON messages(tid)    WHERE tid IS NOT NULL;
+CREATE INDEX IF NOT EXISTS messages_opcode ON messages(opcode);
+CREATE INDEX IF NOT EXISTS messages_ts     ON messages(ts_us);
+CREATE INDEX IF NOT EXISTS messages_file   ON messages(file_id);
+"""
+
+_COLUMNS = "ts_us, frame, tcap_state, opcode, tid, opc, dpc, msisdn, imsi"
+
+
+class SqliteMessageStore:
+    """
+    `MessageStore` query surface over the SQLite index.
+
+    Lookups return `Message` objects in insertion order, like `MessageStore`.
+    With `since`/`to` every query is limited to that time window.
+    """
+
+    def __init__(self, db_path: Path, since: datetime | int = None, to: datetime | int = None):
+        self._db_path = Path(db_path)
+        self._conn = sqlite3.connect(self._db_path)
+        # WAL: readers are not blocked while `index` appends a dump
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f'{self._db_path}: unsupported index schema version {version}')
+        if 0 < version < SCHEMA_VERSION:
+            # rows of an older version are not what this one would extract:
+            # the index is rebuilt rather than answering from them
+            print(f'[WARNING] {self._db_path}: index schema version {version} is outdated, '
+                  f'dropping it (run `msg_trace index` again)')
+            self._conn.executescript("DROP TABLE IF EXISTS messages; DROP TABLE IF EXISTS files;")
+            version = 0
+        self._conn.executescript(_SCHEMA)
+        if version == 0:
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self._window = ""
+        self._window_args: tuple = ()
+        conditions, args = [], []
+        if since is not None:
+            conditions.append("ts_us >= ?")
+            args.append(_as_us(since))
+        if to is not None:
+            conditions.append("ts_us <= ?")
+            args.append(_as_us(to))
+        if conditions:
+            self._window = " AND " + " AND ".join(conditions)
+            self._window_args = tuple(args)
+        self._sources: dict[int, CapInfo] = {}
+
+    def __len__(self):
+        return self._conn.execute(f"SELECT count(*) FROM messages WHERE 1{self._window}",
+                                  self._window_args).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    # ---------- indexing ----------
+    def add(self, msg: Message):
+        with self._conn:
+            self._conn.execute(f"INSERT INTO messages (file_id, {_COLUMNS}) VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               self._to_row(msg))
+
+    def is_current(self, file_path: Path, stat: os.stat_result = None) -> bool:
+        """True if the dump is indexed and has not changed since."""
+        stat = stat or Path(file_path).stat()
+        row = self._conn.execute("SELECT size, mtime_ns, inode FROM files WHERE path = ?",
+                                 (self._key(file_path),)).fetchone()
+        return row is not None and list(row) == self._identity(stat)
+
+    def index_file(self, file_path: Path, messages: Iterable[Message], stat: os.stat_result = None) -> int:
+        """Replace the rows of a dump with its messages in one transaction, return their number."""
+        stat = stat or Path(file_path).stat()
+        key = self._key(file_path)
+        with self._conn:
+            row = self._conn.execute("SELECT id FROM files WHERE path = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM messages WHERE file_id = ?", (row[0],))
+                self._conn.execute("UPDATE files SET size = ?, mtime_ns = ?, inode = ? WHERE id = ?",
+                                   (*self._identity(stat), row[0]))
+                file_id = row[0]
+            else:
+                file_id = self._conn.execute("INSERT INTO files (path, size, mtime_ns, inode) VALUES (?, ?, ?, ?)",
+                                             (key, *self._identity(stat))).lastrowid
+            cursor = self._conn.executemany(
+                f"INSERT INTO messages (file_id, {_COLUMNS}) VALUES ({file_id}, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._to_row(msg) for msg in messages))
+        return cursor.rowcount
+
+    def prune(self, existing: Iterable[Path]) -> int:
+        """Delete the rows of the dumps that are not among `existing`, return how many dumps were dropped."""
+        keep = {self._key(p) for p in existing}
+        gone = [(file_id,) for file_id, path in self._conn.execute("SELECT id, path FROM files") if path not in keep]
+        with self._conn:
+            self._conn.executemany("DELETE FROM messages WHERE file_id = ?", gone)
+            self._conn.executemany("DELETE FROM files WHERE id = ?", gone)
+        for (file_id,) in gone:
+            self._sources.pop(file_id, None)
+        return len(gone)
+
+    # ---------- queries ----------
+    def by_tid(self, tid: str) -> list[Message]:
+        return self._where("tid = ?", tid) if tid else []
+
+    def by_msisdn(self, num: str) -> list[Message]:
+        return self._where("msisdn = ?", num) if num else []
+
+    def by_imsi(self, imsi: str) -> list[Message]:
+        return self._where("imsi = ?", imsi) if imsi else []
+
+    def by_opcode(self, opcode: MsgType) -> list[Message]:
+        return self._where("opcode = ?", opcode.value)
+
+    def filter_all(self) -> Iterator[Message]:
+        yield from self._query(f"WHERE 1{self._window} ORDER BY rowid", self._window_args)
+
+    def iter_sorted(self) -> Iterator[Message]:
+        yield from self._query(f"WHERE 1{self._window} ORDER BY ts_us, rowid", self._window_args)
+
+    def sort_by_datetime(self) -> list[Message]:
+        return list(self.iter_sorted())
+
+    def between(self, since: datetime | int, to: datetime | int) -> list[Message]:
+        return list(self._query(f"WHERE ts_us BETWEEN ? AND ?{self._window} ORDER BY ts_us, rowid",
+                                (_as_us(since), _as_us(to), *self._window_args)))
+
+    # ---------- helpers ----------
+    def _where(self, condition: str, value) -> list[Message]:
+        return list(self._query(f"WHERE {condition}{self._window} ORDER BY rowid", (value, *self._window_args)))
+
+    def _query(self, clause: str, args: tuple) -> Iterator[Message]:
+        for file_id, ts_us, frame, state, opcode, tid, opc, dpc, msisdn, imsi in self._conn.execute(
+                f"SELECT file_id, {_COLUMNS} FROM messages {clause}", args):
+            yield Message(ts_us=ts_us,
+                          frame=frame,
+                          meta=self._source(file_id),
+                          tcap_state=_STATES[state] if state is not None else None,
+                          tid=tid,
+                          opcode=_OPCODES[opcode] if opcode is not None else None,
+                          opc=opc,
+                          dpc=dpc,
+                          msisdn=msisdn,
+                          imsi=imsi)
+
+    def _source(self, file_id: int) -> CapInfo | None:
+        if file_id is None:
+            return None
+        source = self._sources.get(file_id)
+        if source is None:
+            path = self._conn.execute("SELECT path FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+            # relative paths are relative to the folder of the database
+            source = self._sources[file_id] = CapInfo(self._db_path.parent / path)
+        return source
+
+    @staticmethod
+    def _to_row(msg: Message) -> tuple:
+        return (msg.ts_us,
+                msg.frame,
+                msg.tcap_state.value if msg.tcap_state is not None else None,
+                msg.opcode.value if msg.opcode is not None else None,
+                msg.tid,
+                None if msg.opc is None else str(msg.opc),
+                None if msg.dpc is None else str(msg.dpc),
+                msg.msisdn,
+                msg.imsi)
+
+    def _key(self, file_path: Path) -> str:
+        file_path = Path(file_path)
+        try:
+            return str(file_path.relative_to(self._db_path.parent))
+        except ValueError:
+            return str(file_path.absolute())
+
+    @staticmethod
+    def _identity(stat: os.stat_result) -> list[int]:
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def _as_us(value: datetime | int) -> int:
+    return datetime_to_us(value) if isinstance(value, datetime) else value
+
+
+def build_index(dump_folder: Path, db_path: Path = None, backend: str = 'json', jobs: int = 1,
+                settle: float = 60.0, recursive: bool = False, partition_tz: tzinfo = timezone.utc) -> int:
+    """
+    Index every dump of the folder that is new or changed, return the number of indexed dumps.
+
+    :param settle: seconds a dump must stay unmodified before it is indexed
+    :param recursive: index the dumps of subfolders too
+    :param partition_tz: time zone of partition folder names, see `FilePool`
+    """
+    dump_folder = Path(dump_folder)
+    store = SqliteMessageStore(db_path or dump_folder / INDEX_DB_NAME)
+    try:
+        # identity of a dump as it was before extraction
+        todo: dict[CapInfo, os.stat_result] = {}
+        now_ns = time.time_ns()
+        pool = FilePool(dump_folder, recursive=recursive, partition_tz=partition_tz)
+        dumps = list(pool.select(since=datetime.min, to=datetime.max))
+        dropped = store.prune(info.filepath for info in dumps)
+        if dropped:
+            print(f'dropped {dropped} dumps that are no longer in {dump_folder}')
+        for info in dumps:
+            stat = info.filepath.stat()
+            if store.is_current(info.filepath, stat):
+                continue
+            if now_ns - stat.st_mtime_ns < settle * 1e9:
+                print(f'skipped {info.filepath.name}: still being written')
+                continue
+            todo[info] = stat
+
+        indexed = 0
+        for info, messages in extract_parallel(todo, _WHOLE_FILE, backend=backend, jobs=jobs):
+            stat = todo[info]
+            if SqliteMessageStore._identity(info.filepath.stat()) != SqliteMessageStore._identity(stat):
+                # written to while it was extracted, the rows would not match the recorded identity
+                print(f'skipped {info.filepath.name}: changed while it was indexed')
+                continue
+            count = store.index_file(info.filepath, messages, stat)
+            indexed += 1
+            print(f'indexed {info.filepath.name}: {count} messages')
+        return indexed
+    finally:
+        store.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='msg_trace index',
+                                     description="extract every dump once into a SQLite subscriber index")
+    parser.add_argument('--dump_folder', default='.', help='path to folder containing dumps')
+    parser.add_argument('--db', help=f"index database (default: <dump_folder>/{INDEX_DB_NAME})")
+    parser.add_argument('--settle', type=float, default=60.0,
+                        help="seconds a dump must stay unmodified before it is indexed")
+    parser.add_argument('--recursive', action='store_true',
+                        help="also search subfolders, e.g. a date-partitioned archive (YYYY/MM/DD/HH)")
+    parser.add_argument('--partition-tz', default='UTC', type=partition_timezone,
+                        help="with --recursive: time zone of the date folders, e.g. UTC (default), "
+                             "Europe/Moscow or local")
+    parser.add_argument('--backend', default='json', choices=['json', 'fields'])
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    dump_folder = Path(args.dump_folder).expanduser()
+    indexed = build_index(dump_folder, Path(args.db) if args.db else None, backend=args.backend, jobs=args.jobs,
+                          settle=args.settle, recursive=args.recursive, partition_tz=args.partition_tz)
+    print(f'{indexed} dumps indexed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Synthetic tshark JSON frames for benchmarks and tests.
+
+`generate_frames` yields frames shaped like the `-T json` output of tshark
+for SMS traffic over M3UA/TCAP/GSM MAP, in capture order and with
+interleaved dialogues.  Every subscriber activity is one of
+
+    MT  SRI -> ResultLast (IMSI) -> Forward_SM to the IMSI -> ResultLast
+        or SRI -> ResultLast (IMSI) -> MT_Forward_SM to the IMSI -> ResultLast
+        or SRI -> returnError
+    MO  MO_Forward_SM -> ResultLast
+
+Deliveries mostly use the MAP v2 Forward_SM encoding (opcode 46, SM-RP-DA =
+IMSI), which is what `JsonParser` links to the SRI result by IMSI; a share of
+`mt_v3_ratio` uses the MAP v3 MT_Forward_SM encoding (opcode 44), which it
+parses but does not link.  Output is fully determined by the seed.
+"""
+import heapq
+import itertools
+import random
+from typing import Iterator, Optional
+
+BASE_TS_US = 1_711_354_583_000_000
+
+DISTRIBUTIONS = ('uniform', 'zipf')
+
+# (opc, dpc) pairs of a few SMSC/HLR/MSC links
+_LINKS = [(1201, 3301), (1201, 3302), (1202, 3301), (1202, 3303), (1203, 3304)]
+_ERRORS = ('27', '1', '6', '31', '32')  # AbsentSubscriber, UnknownSubscriber, ...
+
+
+def generate_frames(count: int, subscribers: int = 10_000, distribution: str = 'uniform',
+                    mo_ratio: float = 0.3, error_ratio: float = 0.05, mt_v3_ratio: float = 0.2,
+                    rate: float = 500.0, seed: int = 0) -> Iterator[dict]:
+    """
+    Yield `count` frames of synthetic SMS signalling.
+
+    :param subscribers: number of distinct MSISDN/IMSI pairs
+    :param distribution: 'uniform', or 'zipf' where a few subscribers get most of the traffic
+    :param mo_ratio: share of activities that are mobile-originated
+    :param error_ratio: share of SRIs answered with returnError
+    :param mt_v3_ratio: share of deliveries sent as MAP v3 MT_Forward_SM
+    :param rate: activities started per second of capture time
+    :param seed: random seed
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f'unknown subscriber distribution {distribution!r}')
+    rng = random.Random(seed)
+    pick = _subscriber_picker(rng, subscribers, distribution)
+    tids = _tid_sequence()
+    pending: list = []   # heap of (ts_us, seq, frame layers)
+    seq = itertools.count()
+    now_us = BASE_TS_US
+    number = 0
+
+    while number < count:
+        now_us += max(1, int(rng.expovariate(rate) * 1_000_000))
+        subscriber = pick()
+        if rng.random() < mo_ratio:
+            frames = _mo_activity(rng, subscriber, tids, now_us)
+        else:
+            frames = _mt_activity(rng, subscriber, tids, now_us, error_ratio, mt_v3_ratio)
+        for ts_us, layers in frames:
+            heapq.heappush(pending, (ts_us, next(seq), layers))
+
+        while pending and pending[0][0] <= now_us and number < count:
+            ts_us, _, layers = heapq.heappop(pending)
+            number += 1
+            yield _frame(number, ts_us, layers)
+    # activities started last may be cut off, like at the end of a real dump
+
+
+def subscriber_msisdn(index: int) -> str:
+    return f'7999{index:07d}'
+
+
+def subscriber_imsi(index: int) -> str:
+    return f'25099{index:010d}'
+
+
+# ---------- helpers ----------
+def _subscriber_picker(rng: random.Random, subscribers: int, distribution: str):
+    if distribution == 'uniform':
+        return lambda: rng.randrange(subscribers)
+    weights = list(itertools.accumulate(1.0 / rank for rank in range(1, subscribers + 1)))
+    population = range(subscribers)
+    return lambda: rng.choices(population, cum_weights=weights)[0]
+
+
+def _tid_sequence() -> Iterator[str]:
+    for n in itertools.count(1):
+        # spread consecutive dialogues over the 32-bit tid space
+        value = (n * 2654435761) & 0xFFFFFFFF
+        yield ':'.join(f'{b:02x}' for b in value.to_bytes(4, 'big'))
+
+
+def _mt_activity(rng, subscriber, tids, ts_us, error_ratio, mt_v3_ratio) -> list:
+    opc, dpc = rng.choice(_LINKS)
+    msisdn, imsi = subscriber_msisdn(subscriber), subscriber_imsi(subscriber)
+    tid = next(tids)
+    sri_rtt = rng.randint(2_000, 40_000)
+    frames = [(ts_us, _layers(opc, dpc, 'begin', tid, _sri_invoke(msisdn)))]
+    if rng.random() < error_ratio:
+        frames.append((ts_us + sri_rtt, _layers(dpc, opc, 'end', tid, _return_error(rng.choice(_ERRORS)))))
+        return frames
+    frames.append((ts_us + sri_rtt, _layers(dpc, opc, 'end', tid, _sri_result(imsi))))
+
+    fsm_tid = next(tids)
+    fsm_ts = ts_us + sri_rtt + rng.randint(1_000, 20_000)
+    invoke = _mt_forward_sm_invoke(imsi) if rng.random() < mt_v3_ratio else _forward_sm_invoke(imsi)
+    frames.append((fsm_ts, _layers(opc, dpc, 'begin', fsm_tid, invoke, _sms_deliver())))
+    frames.append((fsm_ts + rng.randint(50_000, 2_000_000),
+                   _layers(dpc, opc, 'end', fsm_tid, _empty_result())))
+    return frames
+
+
+def _mo_activity(rng, subscriber, tids, ts_us) -> list:
+    dpc, opc = rng.choice(_LINKS)
+    tid = next(tids)
+    destination = subscriber_msisdn(subscriber)
+    return [(ts_us, _layers(opc, dpc, 'begin', tid, _forward_sm_invoke(None), _sms_submit(destination))),
+            (ts_us + rng.randint(5_000, 200_000), _layers(dpc, opc, 'end', tid, _empty_result()))]
+
+
+def _frame(number: int, ts_us: int, layers: dict) -> dict:
+    seconds, micros = divmod(ts_us, 1_000_000)
+    frame = {"frame.time_epoch": f"{seconds}.{micros:06d}000", "frame.number": str(number)}
+    return {"_index": "packets", "_type": "doc", "_score": None,
+            "_source": {"layers": {"frame": frame, **layers}}}
+
+
+def _layers(opc: int, dpc: int, state: str, tid: str, component: dict, sms: Optional[dict] = None) -> dict:
+    layers = {
+        "m3ua": {f"Protocol data: OPC {opc}, DPC {dpc}": {
+            "m3ua.protocol_data_opc": str(opc),
+            "m3ua.protocol_data_dpc": str(dpc),
+            "m3ua.protocol_data_si": "3",
+        }},
+        "tcap": {f"tcap.{state}_element": {"tcap.tid": tid}},
+        "gsm_map": {"gsm_map.old.Component_tree": component},
+    }
+    if sms is not None:
+        layers["gsm_sms"] = sms
+    return layers
+
+
+def _invoke(opcode: int, **fields) -> dict:
+    return {"gsm_old.invoke_element": {
+        "gsm_old.invokeID": "1",
+        "gsm_old.opCode": "0",
+        "gsm_old.opCode_tree": {"gsm_old.localValue": str(opcode)},
+        **fields,
+    }}
+
+
+def _sri_invoke(msisdn: str) -> dict:
+    return _invoke(45, **{
+        "gsm_map.sm.msisdn": f"91{msisdn}",
+        "gsm_map.sm.msisdn_tree": {"e164.msisdn": msisdn},
+        "gsm_map.sm.sm_RP_PRI": "1",
+    })
+
+
+def _forward_sm_invoke(imsi: Optional[str]) -> dict:
+    if imsi is not None:
+        return _invoke(46, **{"gsm_old.sm_RP_DA": "0",
+                              "gsm_old.sm_RP_DA_tree": {"e212.imsi": imsi}})
+    return _invoke(46, **{"gsm_old.sm_RP_DA": "4",
+                          "gsm_old.sm_RP_DA_tree": {"gsm_old.serviceCentreAddressDA": "917900000001"}})
+
+
+def _mt_forward_sm_invoke(imsi: str) -> dict:
+    return _invoke(44, **{"gsm_map.sm.sm_RP_DA": "0",
+                          "gsm_map.sm.sm_RP_DA_tree": {"e212.imsi": imsi},
+                          "gsm_map.sm.moreMessagesToSend": "0"})
+
+
+def _sri_result(imsi: str) -> dict:
+    return {"gsm_old.returnResultLast_element": {
+        "gsm_old.invokeID": "1",
+        "gsm_old.resultretres_element": {
+            "gsm_old.opCode": "0",
+            "gsm_old.opCode_tree": {"gsm_old.localValue": "45"},
+            "e212.imsi": imsi,
+        },
+    }}
+
+
+def _empty_result() -> dict:
+    return {"gsm_old.returnResultLast_element": {"gsm_old.invokeID": "1"}}
+
+
+def _return_error(code: str) -> dict:
+    return {"gsm_old.returnError_element": {
+        "gsm_old.invokeID": "1",
+        "gsm_old.errorCode": "0",
+        "gsm_old.errorCode_tree": {"gsm_old.localValue": code},
+    }}
+
+
+# TPDU fields in the order tshark prints them
+def _sms_deliver() -> dict:
+    return {"gsm_sms.tp-rp": "0", "gsm_sms.tp-udhi": "0", "gsm_sms.tp-sri": "0", "gsm_sms.tp-lp": "0",
+            "gsm_sms.tp-mms": "1", "gsm_sms.tp-mti": "0",
+            "TP-Originating-Address - (79000000001)": {"gsm_sms.tp-oa": "79000000001"},
+            "gsm_sms.tp-pid": "0", "gsm_sms.tp-dcs": "0", "gsm_sms.tp-udl": "12"}
+
+
+def _sms_submit(destination: str) -> dict:
+    return {"gsm_sms.tp-rp": "0", "gsm_sms.tp-udhi": "0", "gsm_sms.tp-srr": "0", "gsm_sms.tp-vpf": "2",
+            "gsm_sms.tp-rd": "0", "gsm_sms.tp-mti": "1", "gsm_sms.tp-mr": "17",
+            f"TP-Destination-Address - ({destination})": {"gsm_sms.tp-da": destination},
+            "gsm_sms.tp-pid": "0", "gsm_sms.tp-dcs": "0", "gsm_sms.tp-vp": "167", "gsm_sms.tp-udl": "12"}
@@ -0,0 +1,120 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .extractor import EXTRACTORS
+from .models import FilterField, Message, MsgType
+
+_TID_RE = re.compile(r'[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2})*')
+_DIGITS_RE = re.compile(r'\d+')
+
+
+def _in_set(field: FilterField, values: Iterable[str], quoted: bool) -> str:
+    values = [f'"{v}"' if quoted else v for v in values]
+    return f"{field.value} in {{{', '.join(values)}}}"
+
+
+class TargetedExtractor:
+    """
+    Subscriber-targeted extraction over a set of dump files.
+
+    Instead of parsing every `gsm_map` frame of the window, tshark is asked
+    only for the frames `MessageChain.build` will look at, in phases that
+    follow the same links:
+
+    1. frames with the MSISDN (SRI msisdn, MO_Forward_SM TP-DA) -> their TIDs
+    2. frames with those TIDs -> SRI responses carrying the IMSI
+    3. frames with those IMSIs -> Forward_SM / MT_Forward_SM and their TIDs
+    4. frames with those TIDs -> Forward_SM responses
+
+    Every phase runs over all files, so a dialogue split by dump rotation is
+    still followed.  A display filter holds at most `chunk_size` TIDs or
+    IMSIs; a frame matched again by a later phase (a request carries the TID
+    its response is searched by) is dropped by its file and frame number, so
+    no message is returned twice.
+    """
+
+    def __init__(self, pcap_paths: Iterable[Path], date_filter: dict, msisdn: str, backend: str = 'json',
+                 jobs: int = 1, chunk_size: int = 200):
+        """
+        :param pcap_paths: dump files to scan
+        :param date_filter: dict with "start" and "end" epoch timestamps
+        :param msisdn: subscriber to trace
+        :param backend: key of `EXTRACTORS`
+        :param jobs: number of tshark processes run at once within a phase
+        :param chunk_size: max number of TIDs/IMSIs in a single display filter
+        """
+        if not _DIGITS_RE.fullmatch(msisdn):
+            raise ValueError(f'msisdn must contain digits only, got {msisdn!r}')
+        self._pcap_paths = list(pcap_paths)
+        self._date_filter = date_filter
+        self._msisdn = msisdn
+        self._backend = backend
+        self._jobs = jobs
+        self._chunk_size = chunk_size
+        self._seen_frames: set[tuple[Path, int]] = set()
+
+    # ---------- public API ----------
+    def scan(self) -> Iterator[Message]:
+        self._seen_frames = set()
+
+        # phase 1: the subscriber's own requests
+        msisdn_filter = (f'{FilterField.MSISDN.value} == "{self._msisdn}" || '
+                         f'{FilterField.TP_DA.value} == "{self._msisdn}"')
+        requests = self._run_phase([msisdn_filter])
+        yield from requests
+        request_tids = {m.tid for m in requests if m.opcode in (MsgType.SRI, MsgType.MO_Forward_SM)}
+
+        # phase 2: responses to them, SRI results carry the IMSI
+        responses = self._run_phase(self._tid_filters(request_tids))
+        yield from responses
+        imsis = {m.imsi for m in responses if m.opcode == MsgType.ResultLast and m.imsi}
+
+        # phase 3: delivery attempts to those IMSIs
+        deliveries = self._run_phase(self._imsi_filters(imsis))
+        yield from deliveries
+        delivery_tids = {m.tid for m in deliveries
+                         if m.opcode in (MsgType.Forward_SM, MsgType.MT_Forward_SM)} - request_tids
+
+        # phase 4: responses to the deliveries
+        yield from self._run_phase(self._tid_filters(delivery_tids))
+
+    # ---------- helpers ----------
+    def _tid_filters(self, tids: set[str]) -> list[str]:
+        tids = sorted(t for t in tids if t and _TID_RE.fullmatch(t))
+        return [_in_set(FilterField.TCAP_TID, tids[i:i + self._chunk_size], quoted=False)
+                for i in range(0, len(tids), self._chunk_size)]
+
+    def _imsi_filters(self, imsis: set[str]) -> list[str]:
+        imsis = sorted(i for i in imsis if _DIGITS_RE.fullmatch(i))
+        return [_in_set(FilterField.IMSI, imsis[i:i + self._chunk_size], quoted=True)
+                for i in range(0, len(imsis), self._chunk_size)]
+
+    def _run_phase(self, filters: list[str]) -> list[Message]:
+        messages = []
+        for display_filter in filters:
+            with ThreadPoolExecutor(max_workers=self._jobs) as pool:
+                # map keeps file order, so the result is deterministic
+                file_messages = pool.map(lambda p: self._extract(p, display_filter), self._pcap_paths)
+                for pcap_path, extracted in zip(self._pcap_paths, file_messages):
+                    messages.extend(self._unseen(pcap_path, extracted))
+        return messages
+
+    def _unseen(self, pcap_path: Path, messages: list[Message]) -> Iterator[Message]:
+        """Messages whose frame no earlier filter returned; frames without a number are kept."""
+        for message in messages:
+            if message.frame is not None:
+                key = pcap_path, message.frame
+                if key in self._seen_frames:
+                    continue
+                self._seen_frames.add(key)
+            yield message
+
+    def _extract(self, pcap_path: Path, display_filter: str) -> list[Message]:
+        extractor = EXTRACTORS[self._backend](date_filter=self._date_filter,
+                                              pcap_path=pcap_path,
+                                              save_json=False,
+                                              stream=True,
+                                              display_filter=display_filter)
+        return list(extractor.scan())
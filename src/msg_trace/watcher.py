@@ -0,0 +1,305 @@
+"""
+Watch-folder ingestion into a persistent, pre-parsed message archive.
+
+`FolderWatcher` polls the dump folder and extracts every dump that is new or
+has changed since it was last ingested, once the dump has stopped growing.
+Parsed messages are appended to the archive in the binary segment format of
+`cache.py`:
+
+    <dump folder>/.msg_trace_archive/
+        messages.msgs     one segment per ingested dump, append-only
+        checkpoint.json   what the segments are, written after every segment
+
+    checkpoint.json:
+    { "version": 2,
+      "segments": "messages.msgs",      # current messages file
+      "size": 123456,                   # committed length of the messages file
+      "files": {"<path relative to folder>": {"identity": [size, mtime_ns, inode],
+                                               "offset": 4096, "length": 20480, "count": 812}} }
+
+Bytes of the messages file past the committed size (a segment whose
+checkpoint was never written, e.g. after a crash) are cut off on the next
+start.  A dump that is rewritten is ingested again and its old segment is no
+longer referenced by the checkpoint.  Once unreferenced segments take more
+than half of the file, `compact` copies the referenced ones into a new
+messages file and switches the checkpoint over to it.  An archive of an
+older version is discarded and the dumps are ingested again.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone, tzinfo
+from pathlib import Path
+from typing import Iterator
+
+from .cache import read_messages, skip_messages, write_messages
+from .capinfo import CapInfo
+from .file_pool import FilePool, partition_timezone
+from .models import Message, datetime_to_us
+from .parallel import extract_parallel
+
+ARCHIVE_DIR_NAME = '.msg_trace_archive'
+# 2: segments number frames within the dump (cache.py MTC3)
+ARCHIVE_VERSION = 2
+
+# share of the messages file unreferenced segments may take before it is compacted
+COMPACT_GARBAGE_RATIO = 0.5
+
+# a dump is always extracted whole
+_WHOLE_FILE = {"start": 0, "end": 4102444800}
+
+
+class MessageArchive:
+    """Append-only store of parsed messages of a dump folder."""
+
+    def __init__(self, dump_folder: Path, archive_dir: Path = None):
+        self._folder = Path(dump_folder)
+        self._dir = Path(archive_dir) if archive_dir else self._folder / ARCHIVE_DIR_NAME
+        self._messages_path = self._dir / 'messages.msgs'
+        self._checkpoint_path = self._dir / 'checkpoint.json'
+        self._size = 0
+        self._files: dict[str, dict] = {}
+        self._load_checkpoint()
+
+    def __len__(self):
+        """Number of messages of the current segments."""
+        return sum(entry["count"] for entry in self._files.values())
+
+    # ---------- public API ----------
+    def is_current(self, file_path: Path, stat: os.stat_result = None) -> bool:
+        """True if the dump was ingested and has not changed since."""
+        entry = self._files.get(self._key(file_path))
+        return entry is not None and entry["identity"] == self._identity(stat or Path(file_path).stat())
+
+    def append(self, file_path: Path, messages: list[Message], stat: os.stat_result = None):
+        """Store the messages of a dump as a new segment and commit it to the checkpoint."""
+        identity = self._identity(stat or Path(file_path).stat())
+        self._dir.mkdir(parents=True, exist_ok=True)
+        with open(self._messages_path, 'ab') as fh:
+            offset = fh.tell()
+            count = write_messages(fh, messages)
+            fh.flush()
+            os.fsync(fh.fileno())
+            size = fh.tell()
+
+        self._files[self._key(file_path)] = {"identity": identity, "offset": offset, "length": size - offset,
+                                             "count": count}
+        self._size = size
+        self._save_checkpoint()
+
+    def compact(self, garbage_ratio: float = COMPACT_GARBAGE_RATIO) -> int:
+        """
+        Copy the referenced segments into a new messages file once unreferenced
+        ones take more than `garbage_ratio` of it, return the number of bytes freed.
+        """
+        if not self._size:
+            return 0
+        with open(self._messages_path, 'rb') as src:
+            garbage = self._size - sum(self._length(src, entry) for entry in self._files.values())
+            if garbage <= self._size * garbage_ratio:
+                return 0
+            new_path = self._dir / f'messages.{time.time_ns()}.msgs'
+            files = {}
+            with open(new_path, 'wb') as dst:
+                for key, entry in sorted(self._files.items(), key=lambda item: item[1]["offset"]):
+                    src.seek(entry["offset"])
+                    files[key] = {**entry, "offset": dst.tell()}
+                    dst.write(src.read(entry["length"]))
+                dst.flush()
+                os.fsync(dst.fileno())
+                size = dst.tell()
+
+        # the checkpoint switches to the new file at once, the old one is removed after
+        self._messages_path, self._files, self._size = new_path, files, size
+        self._save_checkpoint()
+        for path in self._dir.glob('messages*.msgs'):
+            if path != self._messages_path:
+                path.unlink(missing_ok=True)
+        return garbage
+
+    def messages(self, since: datetime | int = None, to: datetime | int = None) -> Iterator[Message]:
+        """Messages of all current segments, dump by dump in the order they were ingested."""
+        since = datetime_to_us(since) if isinstance(since, datetime) else since
+        to = datetime_to_us(to) if isinstance(to, datetime) else to
+        if not self._files:
+            return
+        with open(self._messages_path, 'rb') as fh:
+            for key, entry in sorted(self._files.items(), key=lambda item: item[1]["offset"]):
+                source = CapInfo(self._folder / key)
+                fh.seek(entry["offset"])
+                for msg in read_messages(fh) or []:
+                    if (since is None or msg.ts_us >= since) and (to is None or msg.ts_us <= to):
+                        msg.meta = source
+                        yield msg
+
+    # ---------- helpers ----------
+    def _load_checkpoint(self):
+        try:
+            with open(self._checkpoint_path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            data = None
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f'unreadable archive checkpoint {self._checkpoint_path}: {e}')
+
+        if data is not None and data.get("version", 0) < ARCHIVE_VERSION:
+            print(f'[WARNING] archive {self._dir} has outdated version {data.get("version")}, discarding it')
+            self._messages_path.unlink(missing_ok=True)
+            data = None
+        if data is not None:
+            if data.get("version") != ARCHIVE_VERSION:
+                raise RuntimeError(f'archive {self._dir} has unsupported version {data.get("version")}')
+            self._messages_path = self._dir / data.get("segments", self._messages_path.name)
+            self._size = data["size"]
+            self._files = data["files"]
+
+        # drop a segment written after the last checkpoint
+        try:
+            if self._messages_path.stat().st_size > self._size:
+                print(f'[WARNING] discarding uncommitted tail of {self._messages_path}')
+                os.truncate(self._messages_path, self._size)
+        except FileNotFoundError:
+            if self._size:
+                raise RuntimeError(f'archive checkpoint refers to missing {self._messages_path}')
+
+    def _save_checkpoint(self):
+        tmp_path = self._checkpoint_path.with_name(self._checkpoint_path.name + '.tmp')
+        with open(tmp_path, 'w') as fh:
+            json.dump({"version": ARCHIVE_VERSION, "segments": self._messages_path.name, "size": self._size,
+                       "files": self._files}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self._checkpoint_path)
+
+    def _key(self, file_path: Path) -> str:
+        file_path = Path(file_path)
+        try:
+            return str(file_path.relative_to(self._folder))
+        except ValueError:
+            return str(file_path.absolute())
+
+    @staticmethod
+    def _length(fh, entry: dict) -> int:
+        """Byte length of a segment, measured once for checkpoints written without it."""
+        if "length" not in entry:
+            fh.seek(entry["offset"])
+            skip_messages(fh)
+            entry["length"] = fh.tell() - entry["offset"]
+        return entry["length"]
+
+    @staticmethod
+    def _identity(stat: os.stat_result) -> list[int]:
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class FolderWatcher:
+    """
+    Poll a dump folder and ingest new or changed dumps into a `MessageArchive`.
+
+    A dump is ingested once it has settled: it was not modified for `settle`
+    seconds or it looked the same (size, mtime, inode) on two consecutive
+    polls.  The file the capture is still writing to is left alone until it
+    is rotated.  The folder is searched again on every poll, but only new and
+    changed dumps are probed; the archive is compacted after ingestion when
+    rewritten dumps left enough unreferenced segments behind.
+    """
+
+    def __init__(self, dump_folder: Path, archive: MessageArchive = None, backend: str = 'json', jobs: int = 1,
+                 settle: float = 60.0, recursive: bool = False, partition_tz: tzinfo = timezone.utc):
+        """
+        :param recursive: watch the dumps of subfolders too
+        :param partition_tz: time zone of partition folder names, see `FilePool`
+        """
+        self._folder = Path(dump_folder)
+        # created on the first poll, searched again by the next ones
+        self._pool: FilePool = None
+        self._recursive = recursive
+        self._partition_tz = partition_tz
+        self._archive = archive or MessageArchive(self._folder)
+        self._backend = backend
+        self._jobs = jobs
+        self._settle = settle
+        # dumps that were not settled on the previous poll -> identity seen then
+        self._pending: dict[Path, list[int]] = {}
+
+    @property
+    def archive(self) -> MessageArchive:
+        return self._archive
+
+    def poll(self) -> list[Path]:
+        """Ingest dumps that are new or changed and have settled, return their paths."""
+        ready = {}
+        pending = {}
+        now_ns = time.time_ns()
+        if self._pool is None:
+            self._pool = FilePool(self._folder, recursive=self._recursive, partition_tz=self._partition_tz)
+        else:
+            self._pool.rescan()
+        for info in self._pool.select(since=datetime.min, to=datetime.max):
+            stat = info.filepath.stat()
+            if self._archive.is_current(info.filepath, stat):
+                continue
+            identity = MessageArchive._identity(stat)
+            settled = now_ns - stat.st_mtime_ns >= self._settle * 1e9
+            if settled or self._pending.get(info.filepath) == identity:
+                ready[info] = identity
+            else:
+                pending[info.filepath] = identity
+
+        ingested = []
+        for info, messages in extract_parallel(ready, _WHOLE_FILE, backend=self._backend, jobs=self._jobs):
+            stat = info.filepath.stat()
+            if MessageArchive._identity(stat) != ready[info]:
+                # written to while it was extracted, wait for it to settle again
+                pending[info.filepath] = MessageArchive._identity(stat)
+                continue
+            self._archive.append(info.filepath, messages, stat)
+            ingested.append(info.filepath)
+            print(f'ingested {info.filepath.name}: {len(messages)} messages')
+        self._pending = pending
+        freed = self._archive.compact()
+        if freed:
+            print(f'compacted the archive: {freed} bytes of replaced segments freed')
+        return ingested
+
+    def run(self, interval: float = 30.0, once: bool = False):
+        """Poll every `interval` seconds until interrupted, or a single time with `once`."""
+        while True:
+            self.poll()
+            if once:
+                return
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='msg_trace watch',
+                                     description="keep the message archive of a dump folder up to date")
+    parser.add_argument('--dump_folder', default='.', help='path to folder containing dumps')
+    parser.add_argument('--interval', type=float, default=30.0, help="seconds between polls")
+    parser.add_argument('--settle', type=float, default=60.0,
+                        help="seconds a dump must stay unmodified before it is ingested")
+    parser.add_argument('--once', action='store_true', help="ingest what is there and exit")
+    parser.add_argument('--recursive', action='store_true',
+                        help="also search subfolders, e.g. a date-partitioned archive (YYYY/MM/DD/HH)")
+    parser.add_argument('--partition-tz', default='UTC', type=partition_timezone,
+                        help="with --recursive: time zone of the date folders, e.g. UTC (default), "
+                             "Europe/Moscow or local")
+    parser.add_argument('--backend', default='json', choices=['json', 'fields'])
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    watcher = FolderWatcher(Path(args.dump_folder).expanduser(), backend=args.backend, jobs=args.jobs,
+                            settle=args.settle, recursive=args.recursive, partition_tz=args.partition_tz)
+    watcher.run(interval=args.interval, once=args.once)
+    print(f'archive holds {len(watcher.archive)} messages')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+
+from msg_trace.analyzer import ImsiMessageChain, MessageChain, build_chains
+from msg_trace.models import Message, MsgType, TCAPState
+from msg_trace.msgstore import MessageStore
+
+BASE = 1711354583_000000
+IMSI = "250990000000001"
+
+
+def make_store() -> MessageStore:
+    store = MessageStore()
+    for msg in [
+        # two subscribers served by the same IMSI delivery dialogue
+        Message(ts_us=BASE + 1, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.SRI, msisdn="79990000001"),
+        Message(ts_us=BASE + 2, tcap_state=TCAPState.Begin, tid="02", opcode=MsgType.SRI, msisdn="79990000002"),
+        Message(ts_us=BASE + 3, tcap_state=TCAPState.End, tid="01", opcode=MsgType.ResultLast, imsi=IMSI),
+        Message(ts_us=BASE + 4, tcap_state=TCAPState.End, tid="02", opcode=MsgType.ResultLast, imsi=IMSI),
+        Message(ts_us=BASE + 5, tcap_state=TCAPState.Begin, tid="10", opcode=MsgType.MT_Forward_SM, imsi=IMSI),
+        Message(ts_us=BASE + 6, tcap_state=TCAPState.End, tid="10", opcode=MsgType.ResultLast),
+    ]:
+        store.add(msg)
+    return store
+
+
+class TestBuildChains(unittest.TestCase):
+    def test_same_chains_as_single_runs(self):
+        store = make_store()
+        msisdns = ["79990000001", "79990000002", "79990000003"]
+        chains = build_chains(store, msisdns)
+
+        self.assertEqual(msisdns, list(chains))
+        for msisdn in msisdns:
+            chain = MessageChain(store, msisdn)
+            chain.build()
+            self.assertEqual(chain.get_chain(), chains[msisdn])
+        self.assertEqual([], chains["79990000003"])
+
+    def test_lookups_are_shared(self):
+        store = make_store()
+        with patch.object(store, 'by_imsi', wraps=store.by_imsi) as by_imsi, \
+                patch.object(store, 'by_tid', wraps=store.by_tid) as by_tid:
+            build_chains(store, ["79990000001", "79990000002", "79990000001"])
+
+        self.assertEqual(1, by_imsi.call_count)
+        self.assertEqual(sorted({"01", "02", "10"}), sorted(c.args[0] for c in by_tid.call_args_list))
+
+
+class TestImsiMessageChain(unittest.TestCase):
+    def test_walks_back_to_originating_requests(self):
+        store = make_store()
+        chain = ImsiMessageChain(store, IMSI)
+        chain.build()
+
+        # both subscribers reached the IMSI, so their SRIs belong to its chain
+        expected = [msg for msg in store.filter_all() if msg.opcode != MsgType.MT_Forward_SM]
+        self.assertEqual(sorted(expected, key=lambda msg: msg.ts_us), chain.get_chain())
+
+    def test_same_messages_as_msisdn_chain(self):
+        store = MessageStore()
+        for msg in make_store().filter_all():
+            if msg.tid != "02":
+                store.add(msg)
+        by_msisdn = MessageChain(store, "79990000001")
+        by_msisdn.build()
+        by_imsi = ImsiMessageChain(store, IMSI)
+        by_imsi.build()
+
+        self.assertEqual(by_msisdn.get_chain(), by_imsi.get_chain())
+
+    def test_no_store_scan(self):
+        store = make_store()
+        with patch.object(store, 'filter_all') as filter_all, patch.object(store, 'iter_sorted') as iter_sorted:
+            ImsiMessageChain(store, IMSI).build()
+        filter_all.assert_not_called()
+        iter_sorted.assert_not_called()
+
+    def test_unknown_imsi(self):
+        chain = ImsiMessageChain(make_store(), "250990000000009")
+        chain.build()
+        self.assertEqual([], chain.get_chain())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from msg_trace.cache import MessageCache, read_messages, write_messages
+from msg_trace.models import Message, MsgType, TCAPState, epoch_to_us
+from tests.test_pcapfile import pcap_bytes
+
+START = 1711354583.0
+
+
+def make_message(offset: float, **fields) -> Message:
+    return Message(ts_us=epoch_to_us(START + offset), **fields)
+
+
+class TestMessageCodec(unittest.TestCase):
+    def test_round_trip(self):
+        messages = [
+            make_message(0.123456, tcap_state=TCAPState.Begin, tid="2f:7a:c6:22", opcode=MsgType.SRI,
+                         opc="14685", dpc="10521", msisdn="79999999999"),
+            make_message(1.5, tcap_state=TCAPState.End, tid="2f:7a:c6:22", opcode=MsgType.ResultLast,
+                         opc="10521", dpc="14685", imsi="250991234567890"),
+            make_message(2, opcode=None),
+        ]
+        fh = io.BytesIO()
+        self.assertEqual(3, write_messages(fh, messages))
+
+        fh.seek(0)
+        self.assertEqual(messages, read_messages(fh))
+        self.assertIsNone(read_messages(fh))
+
+    def test_truncated_segment_raises(self):
+        fh = io.BytesIO()
+        write_messages(fh, [make_message(0, tid="00:00:00:01")])
+
+        with self.assertRaises(ValueError):
+            read_messages(io.BytesIO(fh.getvalue()[:-3]))
+
+    def test_outdated_segment_is_not_read(self):
+        fh = io.BytesIO()
+        write_messages(fh, [make_message(0, frame=7)])
+
+        # same records, numbered among the frames that passed -R
+        with self.assertRaises(ValueError):
+            read_messages(io.BytesIO(b'MTC2' + fh.getvalue()[4:]))
+
+
+class TestMessageCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.pcap = self.folder / "dump.pcap"
+        # packets from START to START + 100
+        self.pcap.write_bytes(pcap_bytes([START, START + 100]))
+        self.cache = MessageCache()
+        self.messages = [make_message(i * 10, tid=f"00:00:00:{i:02x}") for i in range(11)]
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_miss_on_empty_cache(self):
+        self.assertIsNone(self.cache.get(self.pcap, START, START + 100))
+
+    def test_inner_window_is_filtered_from_cache(self):
+        self.cache.put(self.pcap, START + 10, START + 80, self.messages[1:9])
+
+        result = self.cache.get(self.pcap, START + 20, START + 40)
+
+        self.assertEqual(self.messages[2:5], result)
+        self.assertIsNone(self.cache.get(self.pcap, START, START + 40))
+
+    def test_window_over_whole_file_serves_any_window(self):
+        self.cache.put(self.pcap, START - 1000, START + 1000, self.messages)
+
+        self.assertEqual(self.messages, self.cache.get(self.pcap, START - 5000, START + 5000))
+
+    def test_rewritten_file_invalidates_entry(self):
+        self.cache.put(self.pcap, START, START + 100, self.messages)
+        self.pcap.write_bytes(pcap_bytes([START, START + 50, START + 100]))
+
+        self.assertIsNone(self.cache.get(self.pcap, START, START + 100))
+        self.assertEqual([], list((self.folder / ".msg_trace_cache").iterdir()))
+
+    def test_entry_of_older_version_is_dropped(self):
+        self.cache.put(self.pcap, START, START + 100, self.messages)
+        [meta_path] = (self.folder / ".msg_trace_cache").glob("*.meta.json")
+        meta = json.loads(meta_path.read_text())
+        del meta["version"]
+        meta_path.write_text(json.dumps(meta))
+
+        self.assertIsNone(self.cache.get(self.pcap, START, START + 100))
+        self.assertEqual([], list((self.folder / ".msg_trace_cache").iterdir()))
+
+
+if __name__ == "__main__":
+    unittest.main()
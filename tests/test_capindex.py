@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from msg_trace.capindex import CapInfoIndex, INDEX_FILE_NAME
+from msg_trace.capinfo import CapInfo
+
+
+class TestCapInfoIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.pcap = self.folder / "sample.pcap"
+        self.pcap.write_bytes(b"\x00" * 64)
+
+        self.info = CapInfo(self.pcap)
+        self.info.frames = 10
+        self.info.ts_start = datetime(2025, 3, 25, 8, 0, 0)
+        self.info.ts_end = datetime(2025, 3, 25, 9, 0, 0)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_round_trip_through_file(self):
+        index = CapInfoIndex(self.folder)
+        index.put(self.info)
+        index.save()
+        self.assertTrue((self.folder / INDEX_FILE_NAME).exists())
+
+        cached = CapInfoIndex(self.folder).get(self.pcap)
+
+        self.assertIsNotNone(cached)
+        self.assertEqual(10, cached.frames)
+        self.assertEqual(self.info.ts_start, cached.ts_start)
+        self.assertEqual(self.info.ts_end, cached.ts_end)
+        self.assertEqual(self.pcap, cached.filepath)
+
+    def test_rewritten_file_is_invalidated(self):
+        index = CapInfoIndex(self.folder)
+        index.put(self.info)
+
+        self.pcap.write_bytes(b"\x00" * 128)
+
+        self.assertIsNone(index.get(self.pcap))
+
+    def test_touched_file_is_invalidated(self):
+        index = CapInfoIndex(self.folder)
+        index.put(self.info)
+
+        stat = self.pcap.stat()
+        os.utime(self.pcap, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        self.assertIsNone(index.get(self.pcap))
+
+    def test_prune_drops_vanished_files(self):
+        index = CapInfoIndex(self.folder)
+        index.put(self.info)
+        index.prune(set())
+
+        self.assertEqual(0, len(index))
+
+    def test_corrupted_index_is_ignored(self):
+        (self.folder / INDEX_FILE_NAME).write_text("{not json")
+
+        index = CapInfoIndex(self.folder)
+
+        self.assertEqual(0, len(index))
+
+
+if __name__ == "__main__":
+    unittest.main()
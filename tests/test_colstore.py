@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+
+from msg_trace import colstore
+from msg_trace.colstore import ColumnarMessageStore
+from msg_trace.models import Message, MsgType, TCAPState
+from msg_trace.msgstore import MessageStore
+
+BASE = 1711354583_000000
+
+
+def sample_messages() -> list[Message]:
+    return [
+        Message(ts_us=BASE + 3, tcap_state=TCAPState.Begin, tid="aa", opcode=MsgType.SRI,
+                opc="100", dpc="200", msisdn="79990000001"),
+        Message(ts_us=BASE + 1, tcap_state=TCAPState.End, tid="aa", opcode=MsgType.ResultLast,
+                opc="200", dpc="100", imsi="250990000000001"),
+        Message(ts_us=BASE + 2, tcap_state=TCAPState.Begin, tid="bb", opcode=MsgType.MT_Forward_SM,
+                opc="100", dpc="300", imsi="250990000000001"),
+        Message(ts_us=BASE + 5, tcap_state=TCAPState.Begin, tid="cc", opcode=MsgType.SRI,
+                opc="100", dpc="200", msisdn="79990000002"),
+        Message(ts_us=BASE + 4, opcode=None),
+    ]
+
+
+class TestColumnarMessageStore(unittest.TestCase):
+    def setUp(self):
+        self.messages = sample_messages()
+        self.store = ColumnarMessageStore()
+        self.store.extend(self.messages)
+        self.reference = MessageStore()
+        for msg in self.messages:
+            self.reference.add(msg)
+
+    def test_same_api_results_as_message_store(self):
+        self.assertEqual(self.reference.by_tid("aa"), self.store.by_tid("aa"))
+        self.assertEqual(self.reference.by_msisdn("79990000002"), self.store.by_msisdn("79990000002"))
+        self.assertEqual(self.reference.by_imsi("250990000000001"), self.store.by_imsi("250990000000001"))
+        self.assertEqual(self.reference.by_opcode(MsgType.SRI), self.store.by_opcode(MsgType.SRI))
+        self.assertEqual(list(self.reference.filter_all()), list(self.store.filter_all()))
+
+    def test_unknown_values_return_empty(self):
+        self.assertEqual([], self.store.by_tid("zz"))
+        self.assertEqual([], self.store.select(opc="999"))
+
+    def test_select_time_range_and_opc(self):
+        result = self.store.select(since=BASE + 2, to=BASE + 5, opcode=MsgType.SRI, opc="100")
+        self.assertEqual([self.messages[0], self.messages[3]], result)
+
+    def test_select_without_numpy(self):
+        with patch.object(colstore, "np", None):
+            result = self.store.select(since=BASE + 2, to=BASE + 4, tcap_state=TCAPState.Begin)
+        self.assertEqual([self.messages[0], self.messages[2]], result)
+
+    def test_sort_by_datetime(self):
+        result = self.store.sort_by_datetime()
+        self.assertEqual(sorted(self.messages, key=lambda m: m.ts_us), result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+from msg_trace.analyzer import MessageChain
+from msg_trace.correlator import DialogueCorrelator, correlate
+from msg_trace.models import Message, MsgType, TCAPState
+from msg_trace.msgstore import MessageStore
+
+SEC = 1_000_000
+BASE = 1711354583 * SEC
+MSISDN = "79990000001"
+IMSI = "250990000000001"
+
+
+def traffic() -> list[Message]:
+    return [
+        Message(ts_us=BASE, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.SRI, msisdn=MSISDN),
+        Message(ts_us=BASE + 1, tcap_state=TCAPState.Begin, tid="99", opcode=MsgType.SRI, msisdn="79990000009"),
+        Message(ts_us=BASE + SEC, tcap_state=TCAPState.End, tid="01", opcode=MsgType.ResultLast, imsi=IMSI),
+        Message(ts_us=BASE + 2 * SEC, tcap_state=TCAPState.Begin, tid="10", opcode=MsgType.MT_Forward_SM, imsi=IMSI),
+        Message(ts_us=BASE + 3 * SEC, tcap_state=TCAPState.End, tid="10", opcode=MsgType.ResultLast),
+    ]
+
+
+class TestDialogueCorrelator(unittest.TestCase):
+    def test_same_chain_as_message_chain(self):
+        messages = traffic()
+        store = MessageStore()
+        for msg in messages:
+            store.add(msg)
+        chain = MessageChain(store, MSISDN)
+        chain.build()
+
+        chains = list(correlate(messages, [MSISDN]))
+        self.assertEqual(1, len(chains))
+        self.assertEqual(chain.get_chain(), chains[0].messages)
+        self.assertTrue(chains[0].complete)
+
+    def test_chain_without_imsi_is_emitted_on_response(self):
+        correlator = DialogueCorrelator()
+        self.assertEqual([], correlator.feed(Message(ts_us=BASE, tcap_state=TCAPState.Begin, tid="20",
+                                                     opcode=MsgType.MO_Forward_SM, msisdn=MSISDN)))
+        done = correlator.feed(Message(ts_us=BASE + 1, tcap_state=TCAPState.End, tid="20",
+                                       opcode=MsgType.ResultLast))
+        self.assertEqual([MSISDN], [c.msisdn for c in done])
+        self.assertEqual(0, len(correlator))
+
+    def test_chain_is_emitted_when_delivery_ends(self):
+        correlator = DialogueCorrelator(ttl=60)
+        done = []
+        for msg in traffic():
+            done.extend(correlator.feed(msg))
+        # the delivery to the IMSI ended, no later message is needed
+        self.assertEqual([MSISDN], [c.msisdn for c in done])
+        self.assertTrue(done[0].complete)
+        self.assertEqual([MsgType.SRI, MsgType.ResultLast, MsgType.ResultLast],
+                         [msg.opcode for msg in done[0].messages])
+
+    def test_flush_at_capture_time_expires_idle_chains(self):
+        correlator = DialogueCorrelator(ttl=5)
+        correlator.feed(Message(ts_us=BASE, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.SRI, msisdn=MSISDN))
+        correlator.feed(Message(ts_us=BASE + 3 * SEC, tcap_state=TCAPState.End, tid="01",
+                                opcode=MsgType.ResultLast, imsi=IMSI))
+        # waiting for a delivery to the IMSI, which never comes
+        self.assertEqual([], correlator.flush(BASE + 8 * SEC))
+        done = correlator.flush(BASE + 9 * SEC)
+        self.assertEqual([MSISDN], [c.msisdn for c in done])
+        self.assertFalse(done[0].complete)
+        self.assertEqual([], correlator.flush())
+
+    def test_pending_chains_are_incomplete_at_end_of_input(self):
+        sri = Message(ts_us=BASE, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.SRI, msisdn=MSISDN)
+        [chain] = correlate([sri])
+        self.assertEqual([sri], chain.messages)
+        self.assertFalse(chain.complete)
+
+    def test_mo_errors_as_message_chain(self):
+        messages = [
+            Message(ts_us=BASE, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.MO_Forward_SM, msisdn=MSISDN),
+            Message(ts_us=BASE + SEC, tcap_state=TCAPState.End, tid="01", opcode=MsgType.Error),
+        ]
+        store = MessageStore()
+        for msg in messages:
+            store.add(msg)
+        chain = MessageChain(store, MSISDN)
+        chain.build()
+
+        correlator = DialogueCorrelator()
+        done = [c for msg in messages for c in correlator.feed(msg)]
+        # the error ends the dialogue, the chain does not wait for the end of input
+        self.assertEqual([MSISDN], [c.msisdn for c in done])
+        self.assertEqual(chain.get_chain(), done[0].messages)
+        self.assertEqual([MsgType.MO_Forward_SM, MsgType.Error], [msg.opcode for msg in done[0].messages])
+        self.assertTrue(done[0].complete)
+
+    def test_idle_dialogue_is_evicted_after_ttl(self):
+        correlator = DialogueCorrelator(ttl=5)
+        correlator.feed(Message(ts_us=BASE, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.SRI, msisdn=MSISDN))
+        self.assertEqual([], correlator.feed(Message(ts_us=BASE + 5 * SEC, tid="77")))
+        done = correlator.feed(Message(ts_us=BASE + 6 * SEC, tid="77"))
+        self.assertEqual(1, len(done))
+        self.assertFalse(done[0].complete)
+        self.assertEqual(0, len(correlator))
+        # a late response no longer belongs to anything
+        self.assertEqual([], correlator.feed(Message(ts_us=BASE + 7 * SEC, tcap_state=TCAPState.End, tid="01",
+                                                     opcode=MsgType.ResultLast, imsi=IMSI)))
+        self.assertEqual([], correlator.flush())
+
+    def test_other_subscribers_are_ignored(self):
+        correlator = DialogueCorrelator(msisdns=[MSISDN])
+        done = []
+        for msg in traffic():
+            done.extend(correlator.feed(msg))
+        done.extend(correlator.flush())
+        self.assertEqual([MSISDN], [c.msisdn for c in done])
+
+
+if __name__ == '__main__':
+    unittest.main()
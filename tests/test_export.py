@@ -0,0 +1,101 @@
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace.capinfo import CapInfo
+from msg_trace.export import export_chain
+from msg_trace.extractor import TsharkExtractor
+from msg_trace import pcapfile
+from msg_trace.models import Message
+from msg_trace.pcapfile import Shard, iter_records, read_bounds, read_frames
+from tests.test_pcapfile import pcap_bytes, pcapng_bytes
+
+PCAP_TS = [1711354583.0, 1711354585.0, 1711354587.0]
+PCAPNG_TS = [1711354584.0, 1711354586.0]
+
+
+class TestExportChain(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.pcap = self.folder / 'a.pcap'
+        self.pcap.write_bytes(pcap_bytes(PCAP_TS, payload=b'A' * 40))
+        self.pcapng = self.folder / 'b.pcapng'
+        self.pcapng.write_bytes(pcapng_bytes(PCAPNG_TS, order='>', tsresol=9, payload=b'B' * 40))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_read_frames_picks_numbers(self):
+        interfaces, frames = read_frames(self.pcap, {3, 1})
+        self.assertEqual(1, len(interfaces))
+        self.assertEqual([1, 3], [frame.number for frame in frames])
+        self.assertAlmostEqual(PCAP_TS[2], frames[1].ts, places=5)
+
+    def test_chain_is_merged_in_time_order(self):
+        pcap, pcapng = CapInfo(self.pcap), CapInfo(self.pcapng)
+        chain = [Message(ts_us=0, meta=pcap, frame=3),
+                 Message(ts_us=0, meta=pcapng, frame=1),
+                 Message(ts_us=0, meta=pcap, frame=1),
+                 Message(ts_us=0, meta=pcap, frame=1),   # two messages of one frame
+                 Message(ts_us=0, frame=7)]               # no source, skipped
+        out = self.folder / 'chain.pcapng'
+        self.assertEqual(3, export_chain(chain, out))
+
+        # EPB: data is followed by the trailing block length
+        payloads = [record[-44:-4] for ts, record in iter_records(out) if ts is not None]
+        self.assertEqual([b'A' * 40, b'B' * 40, b'A' * 40], payloads)
+        bounds = read_bounds(out, count_frames=True)
+        self.assertEqual(3, bounds.frames)
+        self.assertAlmostEqual(PCAP_TS[0], bounds.ts_start, places=5)
+        self.assertAlmostEqual(PCAP_TS[2], bounds.ts_end, places=5)
+
+    def test_missing_dump_is_skipped(self):
+        chain = [Message(ts_us=0, meta=CapInfo(self.folder / 'gone.pcap'), frame=3),
+                 Message(ts_us=0, meta=CapInfo(self.pcap), frame=2)]
+        out = self.folder / 'chain.pcapng'
+        with patch('builtins.print') as warn:
+            self.assertEqual(1, export_chain(chain, out))
+        self.assertIn('gone.pcap', warn.call_args[0][0])
+        self.assertEqual(1, read_bounds(out, count_frames=True).frames)
+
+
+class TestFrameNumbers(unittest.TestCase):
+    def test_time_window_is_not_a_read_filter(self):
+        # tshark renumbers frames passing -R, frame.number must stay absolute
+        extractor = TsharkExtractor({"start": 1, "end": 2}, pcap_path=Path('dump.pcap'))
+        cmd = extractor._build_cmd()
+        self.assertNotIn("-R", cmd)
+        self.assertIn("frame.time_epoch >= 1 && frame.time_epoch <= 2", cmd[cmd.index("-Y") + 1])
+
+    def test_shard_is_read_in_one_pass(self):
+        shard = Shard(header=((0, 24),), start=24, end=48, first_frame=1, lead_in=0)
+        extractor = TsharkExtractor({"start": 1, "end": 2}, pcap_path=Path('dump.pcap'), shard=shard)
+        cmd = extractor._build_cmd()
+        self.assertEqual("-", cmd[cmd.index("-r") + 1])
+        self.assertNotIn("-2", cmd)
+        self.assertIn("-2", TsharkExtractor({"start": 1, "end": 2}, pcap_path=Path('dump.pcap'))._build_cmd())
+
+    def test_compressed_dumps(self):
+        with tempfile.TemporaryDirectory() as folder:
+            gz = Path(folder) / 'dump.pcap.gz'
+            gz.write_bytes(gzip.compress(pcap_bytes(PCAP_TS)))
+            zst = Path(folder) / 'dump.pcap.zst'
+            zst.write_bytes(b'\x28\xb5\x2f\xfd' + bytes(20))
+
+            # gzip: tshark opens the file itself, with random access
+            cmd = TsharkExtractor({"start": 1, "end": 2}, pcap_path=gz)._build_cmd()
+            self.assertEqual(str(gz.absolute()), cmd[cmd.index("-r") + 1])
+            self.assertIn("-2", cmd)
+
+            # zstd is decompressed here and piped, in one pass
+            with patch.object(pcapfile, 'zstandard', object()):
+                cmd = TsharkExtractor({"start": 1, "end": 2}, pcap_path=zst)._build_cmd()
+            self.assertEqual("-", cmd[cmd.index("-r") + 1])
+            self.assertNotIn("-2", cmd)
+
+
+if __name__ == '__main__':
+    unittest.main()
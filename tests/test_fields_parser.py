@@ -0,0 +1,124 @@
+import json
+import unittest
+
+from msg_trace.Parser import JsonParser, FieldsParser, ProjectedField
+from msg_trace.models import MsgType, TCAPState
+
+TIME_EPOCH = "1711354583.123456"
+OPC, DPC = "14685", "10521"
+
+
+def json_frame(tcap: dict, component: dict, sms: dict = None) -> dict:
+    layers = {
+        "frame": {"frame.time_epoch": TIME_EPOCH},
+        "m3ua": {f"Protocol data: OPC {OPC}, DPC {DPC}": {"m3ua.protocol_data_opc": OPC,
+                                                         "m3ua.protocol_data_dpc": DPC}},
+        "tcap": tcap,
+        "gsm_map": {"gsm_map.old.Component_tree": component},
+    }
+    if sms is not None:
+        layers["gsm_sms"] = sms
+    return {"_source": {"layers": layers}}
+
+
+def fields_row(**values) -> list[str]:
+    values.setdefault("TIME_EPOCH", TIME_EPOCH)
+    values.setdefault("OPC", OPC)
+    values.setdefault("DPC", DPC)
+    return [values.get(field.name, "") for field in ProjectedField]
+
+
+class TestFieldsParser(unittest.TestCase):
+    def setUp(self):
+        self.json_parser = JsonParser()
+        self.fields_parser = FieldsParser()
+
+    def assertSameMessage(self, frame, row):
+        expected = self.json_parser.parse_frame(frame)
+        result = self.fields_parser.parse_row(row)
+        self.assertEqual(expected, result)
+        return result
+
+    def test_sri_invoke(self):
+        frame = json_frame({"tcap.begin_element": {"tcap.tid": "2f:7a:c6:22"}},
+                           {"gsm_old.invoke_element": {
+                               "gsm_old.opCode_tree": {"gsm_old.localValue": "45"},
+                               "gsm_map.sm.msisdn_tree": {"e164.msisdn": "79999999999"}}})
+        row = fields_row(TCAP_OTID="2f7ac622", TCAP_TID="2f:7a:c6:22", COMPONENT="1",
+                         LOCAL_VALUE="45", MSISDN="79999999999")
+
+        msg = self.assertSameMessage(frame, row)
+        self.assertEqual(MsgType.SRI, msg.opcode)
+        self.assertEqual(TCAPState.Begin, msg.tcap_state)
+
+    def test_repeated_msisdn_matches_json(self):
+        # tshark prints a repeated field as a duplicate JSON key, json keeps the last one
+        invoke = json.loads('{"gsm_old.opCode_tree": {"gsm_old.localValue": "45"}, "gsm_map.sm.msisdn_tree": '
+                            '{"e164.msisdn": "79990000001", "e164.msisdn": "79999999999"}}')
+        frame = json_frame({"tcap.begin_element": {"tcap.tid": "2f:7a:c6:22"}}, {"gsm_old.invoke_element": invoke})
+        row = fields_row(TCAP_OTID="2f7ac622", TCAP_TID="2f:7a:c6:22", COMPONENT="1",
+                         LOCAL_VALUE="45", MSISDN="79990000001,79999999999")
+
+        msg = self.assertSameMessage(frame, row)
+        self.assertEqual("79999999999", msg.msisdn)
+
+    def test_sri_result_with_imsi(self):
+        frame = json_frame({"tcap.end_element": {"tcap.tid": "2f:7a:c6:22"}},
+                           {"gsm_old.returnResultLast_element": {
+                               "gsm_old.invokeID": "1",
+                               "gsm_old.resultretres_element": {"gsm_old.opCode": "0",
+                                                                "e212.imsi": "250991234567890"}}})
+        row = fields_row(TCAP_DTID="2f7ac622", TCAP_TID="2f:7a:c6:22", COMPONENT="2",
+                         LOCAL_VALUE="45", RESULT_OPCODE="0", IMSI="250991234567890")
+
+        msg = self.assertSameMessage(frame, row)
+        self.assertEqual("250991234567890", msg.imsi)
+
+    def test_return_error(self):
+        frame = json_frame({"tcap.end_element": {"tcap.tid": "2f:7a:c6:22"}},
+                           {"gsm_old.returnError_element": {
+                               "gsm_old.errorCode_tree": {"gsm_old.localValue": "1"}}})
+        row = fields_row(TCAP_DTID="2f7ac622", TCAP_TID="2f:7a:c6:22", COMPONENT="3", LOCAL_VALUE="1")
+
+        msg = self.assertSameMessage(frame, row)
+        self.assertEqual(MsgType.Error, msg.opcode)
+        self.assertEqual("UnknownSubscriber", msg.imsi)
+
+    def test_mt_forward_sm_continue_takes_last_tid(self):
+        frame = json_frame({"tcap.continue_element": {"tcap.tid": "00:00:00:02"}},
+                           {"gsm_old.invoke_element": {
+                               "gsm_old.opCode_tree": {"gsm_old.localValue": "44"}}})
+        row = fields_row(TCAP_OTID="00000001", TCAP_DTID="00000002", TCAP_TID="00:00:00:01,00:00:00:02",
+                         COMPONENT="1", LOCAL_VALUE="44")
+
+        msg = self.assertSameMessage(frame, row)
+        self.assertEqual(TCAPState.Continue, msg.tcap_state)
+        self.assertEqual("00:00:00:02", msg.tid)
+
+    def test_mo_forward_sm_msisdn_from_tp_da(self):
+        frame = json_frame({"tcap.begin_element": {"tcap.tid": "00:49:00:44"}},
+                           {"gsm_old.invoke_element": {
+                               "gsm_old.opCode_tree": {"gsm_old.localValue": "46"},
+                               "gsm_old.sm_RP_DA": "4"}},
+                           sms={"gsm_sms.tp-mti": "1",
+                                "TP-Destination-Address - (79999999999)": {"gsm_sms.tp-da": "79999999999"}})
+        row = fields_row(TCAP_OTID="00490044", TCAP_TID="00:49:00:44", COMPONENT="1", LOCAL_VALUE="46",
+                         OLD_RP_DA="4", TP_MTI="1", TP_DA="79999999999")
+
+        msg = self.assertSameMessage(frame, row)
+        self.assertEqual("79999999999", msg.msisdn)
+
+    def test_parse_line_splits_tabs(self):
+        row = fields_row(TCAP_DTID="2f7ac622", TCAP_TID="2f:7a:c6:22")
+        msg = self.fields_parser.parse_line("\t".join(row) + "\n")
+
+        self.assertEqual(MsgType.ResultLast, msg.opcode)
+        self.assertEqual(OPC, msg.opc)
+
+    def test_missing_tcap_raises_runtime_error(self):
+        with self.assertRaises(RuntimeError):
+            self.fields_parser.parse_row(fields_row())
+
+
+if __name__ == "__main__":
+    unittest.main()
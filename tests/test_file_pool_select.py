@@ -0,0 +1,197 @@
+import gzip
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace.capindex import CapInfoIndex
+from msg_trace.capinfo import CapInfo
+from msg_trace.file_pool import FilePool, partition_span
+from tests.test_pcapfile import pcap_bytes
+
+BASE = datetime(2025, 3, 25)
+
+
+def capinfo(name: str, start: int, end: int) -> CapInfo:
+    """CapInfo of a dump spanning [start, end] minutes after BASE."""
+    info = CapInfo(name)
+    info.ts_start = BASE + timedelta(minutes=start)
+    info.ts_end = BASE + timedelta(minutes=end)
+    return info
+
+
+class _Recorder(list):
+    """List recording the indexes read from it."""
+
+    def __init__(self, items, reads: list):
+        super().__init__(items)
+        self.reads = reads
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return super().__getitem__(index)
+
+
+class TestSelect(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.pool = FilePool(self._tmp.name, use_index=False)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def brute_force(self, since, to) -> list[CapInfo]:
+        found = [meta for meta in self.pool._files if not (meta.ts_end < since or meta.ts_start > to)]
+        return sorted(found, key=lambda meta: (meta.ts_start, str(meta.filepath)))
+
+    def test_matches_full_scan_in_chronological_order(self):
+        rng = random.Random(5)
+        # rotated dumps of 15 minutes, plus a few long and overlapping captures
+        files = [capinfo(f'rot{i:04}.pcap', 15 * i, 15 * i + 14) for i in range(400)]
+        files += [capinfo(f'long{i}.pcap', rng.randrange(6000), rng.randrange(6000) + 600) for i in range(10)]
+        rng.shuffle(files)
+        self.pool._files = set(files)
+
+        for _ in range(200):
+            since = BASE + timedelta(minutes=rng.randrange(-100, 6200))
+            to = since + timedelta(minutes=rng.randrange(0, 300))
+            self.assertEqual(self.brute_force(since, to), list(self.pool.select(since, to)))
+
+    def add(self, meta: CapInfo):
+        with patch.object(FilePool, '_probe', lambda pool, file_path: meta):
+            self.pool.add_file(meta.filepath)
+
+    def test_index_follows_added_files(self):
+        first = capinfo('a.pcap', 0, 10)
+        self.add(first)
+        self.assertEqual([first], list(self.pool.select(BASE, BASE + timedelta(hours=1))))
+
+        earlier = capinfo('b.pcap', -20, -5)
+        self.add(earlier)
+        self.assertEqual([earlier, first], list(self.pool.select(BASE - timedelta(hours=1), BASE)))
+
+    def test_probed_again_replaces_bounds(self):
+        self.add(capinfo('a.pcap', 0, 10))
+        self.assertEqual([], list(self.pool.select(BASE + timedelta(minutes=30), BASE + timedelta(hours=1))))
+
+        # the dump grew in place, same path and as many files
+        grown = capinfo('a.pcap', 0, 60)
+        self.add(grown)
+        self.assertEqual([grown], list(self.pool.select(BASE + timedelta(minutes=30), BASE + timedelta(hours=1))))
+        self.assertEqual([grown], list(self.pool.select(BASE, BASE)))
+
+    def test_long_early_file_does_not_widen_the_search(self):
+        self.pool._files = {capinfo(f'rot{i:04}.pcap', i, i) for i in range(1, 1024)} | {capinfo('long.pcap', 0, 5000)}
+        starts, max_ends, files = self.pool._by_time()
+        visited = []
+        with patch.object(self.pool, '_by_time', return_value=(starts, _Recorder(max_ends, visited), files)):
+            found = list(self.pool.select(BASE + timedelta(minutes=2000), BASE + timedelta(minutes=2000)))
+        self.assertEqual(['long.pcap'], [meta.filepath.name for meta in found])
+        # one path down the tree, not every file before the window
+        self.assertLess(len(visited), 40)
+
+    def test_rescan_follows_the_folder(self):
+        folder = Path(self._tmp.name)
+        (folder / 'a.pcap').write_bytes(pcap_bytes([BASE.timestamp() + 60]))
+        (folder / 'b.pcap').write_bytes(pcap_bytes([BASE.timestamp() + 120]))
+        pool = FilePool(folder, use_index=False)
+        window = BASE - timedelta(days=1), BASE + timedelta(days=1)
+
+        (folder / 'a.pcap').unlink()
+        (folder / 'b.pcap').write_bytes(pcap_bytes([BASE.timestamp() + 120, BASE.timestamp() + 180]))
+        (folder / 'c.pcap').write_bytes(pcap_bytes([BASE.timestamp() + 240]))
+        with patch.object(FilePool, '_probe', side_effect=FilePool._probe, autospec=True) as probe:
+            pool.rescan()
+            self.assertEqual(['b.pcap', 'c.pcap'], sorted(call.args[1].name for call in probe.call_args_list))
+            pool.rescan()
+            self.assertEqual(2, probe.call_count)
+        self.assertEqual(['b.pcap', 'c.pcap'], [meta.filepath.name for meta in pool.select(*window)])
+        self.assertEqual(BASE + timedelta(minutes=3), next(pool.select(*window)).ts_end)
+
+    def test_files_probed_from_folder(self):
+        folder = Path(self._tmp.name)
+        (folder / 'empty.pcap').write_bytes(b'')
+        pool = FilePool(folder, use_index=False)
+        # a dump without packets is not selectable
+        self.assertEqual([], list(pool.select(datetime.min, datetime.max)))
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        # site/YYYY/MM/DD/HH archive, every hour holds a dump of its first minutes
+        self.dumps = {}
+        for hour in (datetime(2025, 3, 24, 23), datetime(2025, 3, 25, 8), datetime(2025, 3, 25, 9),
+                     datetime(2025, 4, 1, 0)):
+            folder = self.folder / 'site' / hour.strftime('%Y/%m/%d/%H')
+            folder.mkdir(parents=True)
+            path = folder / f'{hour:%H}.pcap.gz'
+            path.write_bytes(gzip.compress(pcap_bytes([hour.timestamp() + 60, hour.timestamp() + 120])))
+            self.dumps[hour] = path
+        (self.folder / 'top.pcap').write_bytes(pcap_bytes([datetime(2025, 3, 25, 8, 30).timestamp()]))
+        (self.folder / 'notes.txt').write_text('not a dump')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def pool(self, **kwargs) -> FilePool:
+        probed = []
+        probe = FilePool._probe
+
+        def record(pool, file_path):
+            probed.append(file_path)
+            return probe(pool, file_path)
+
+        # the folders above are named in local time
+        kwargs.setdefault('partition_tz', None)
+        with patch.object(FilePool, '_probe', record):
+            pool = FilePool(self.folder, use_index=False, recursive=True, **kwargs)
+        pool.probed = probed
+        return pool
+
+    def test_recursive_finds_compressed_dumps(self):
+        pool = self.pool()
+        self.assertEqual(5, len(pool._files))
+        names = [meta.filepath.name for meta in pool.select(datetime(2025, 3, 25, 8), datetime(2025, 3, 25, 9, 30))]
+        self.assertEqual(['08.pcap.gz', 'top.pcap', '09.pcap.gz'], names)
+
+    def test_partitions_outside_window_are_not_visited(self):
+        pool = self.pool(since=datetime(2025, 3, 25, 9, 30), to=datetime(2025, 3, 25, 12))
+        # 08 may still run into the window, 23 of the day before and April are skipped
+        self.assertEqual({self.dumps[datetime(2025, 3, 25, 8)], self.dumps[datetime(2025, 3, 25, 9)],
+                          self.folder / 'top.pcap'}, set(pool.probed))
+
+    def test_partitions_are_compared_in_their_time_zone(self):
+        # 09:30-10:00 at UTC+3 is 06:30-07:00 UTC
+        east = timezone(timedelta(hours=3))
+        window = dict(since=datetime(2025, 3, 25, 9, 30, tzinfo=east), to=datetime(2025, 3, 25, 10, tzinfo=east))
+        morning = {self.dumps[datetime(2025, 3, 25, 8)], self.dumps[datetime(2025, 3, 25, 9)]}
+
+        # UTC folders: 08 and 09 start after the window
+        self.assertFalse(morning & set(self.pool(partition_tz=timezone.utc, **window).probed))
+        # folders at UTC+3: 08 is 05:00-06:00 UTC and may run into the window, 09 overlaps it
+        self.assertEqual(morning, morning & set(self.pool(partition_tz=east, **window).probed))
+
+    def test_index_keeps_entries_of_skipped_partitions(self):
+        FilePool(self.folder, recursive=True)
+        FilePool(self.folder, recursive=True, since=datetime(2025, 3, 25), to=datetime(2025, 3, 26))
+        self.assertEqual(5, len(CapInfoIndex(self.folder)))
+
+    def test_top_level_only_by_default(self):
+        pool = FilePool(self.folder, use_index=False)
+        self.assertEqual(['top.pcap'], [meta.filepath.name for meta in pool._files])
+
+    def test_partition_span(self):
+        self.assertIsNone(partition_span(('site', 'current')))
+        self.assertEqual((datetime(2025, 2, 1), datetime(2025, 3, 1)), partition_span(('site', '2025', '02')))
+        self.assertEqual((datetime(2025, 12, 31, 23), datetime(2026, 1, 1)),
+                         partition_span(('2025', '12', '31', '23', 'extra')))
+        # an invalid level ends the date
+        self.assertEqual((datetime(2025, 1, 1), datetime(2026, 1, 1)), partition_span(('2025', '13', '01')))
+
+
+if __name__ == '__main__':
+    unittest.main()
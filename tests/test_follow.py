@@ -0,0 +1,146 @@
+import io
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from msg_trace.follow import FollowExtractor, ReplaySource, TailSource, correlate_live
+from msg_trace.models import Message, MsgType, TCAPState
+from tests.test_pcapfile import pcap_bytes
+
+TS = [1711354583.0, 1711354583.1, 1711354583.3]
+
+# stands in for tshark: reads the capture from stdin and prints its size as a one-frame JSON array
+FAKE_TSHARK = '''#!{python}
+import sys
+data = sys.stdin.buffer.read()
+print('[{{"size": %d}}]' % len(data))
+'''
+
+
+class _PassThroughParser:
+    @staticmethod
+    def parse_frame(frame):
+        return frame
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.data = pcap_bytes(TS)
+        self.path = self.folder / 'dump.pcap'
+        self.path.write_bytes(self.data)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_replay_is_paced_by_capture_time(self):
+        sink = io.BytesIO()
+        start = time.monotonic()
+        ReplaySource(self.path, speed=2.0).pump(sink)
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+        self.assertEqual(self.data, sink.getvalue())
+
+    def test_replay_without_pacing(self):
+        sink = io.BytesIO()
+        start = time.monotonic()
+        ReplaySource(self.path, speed=0).pump(sink)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(self.data, sink.getvalue())
+
+    def test_tail_copies_until_idle(self):
+        sink = io.BytesIO()
+        TailSource(self.path, poll_interval=0.01, idle_timeout=0.05).pump(sink)
+        self.assertEqual(self.data, sink.getvalue())
+
+    def tail_in_background(self, sink) -> threading.Thread:
+        pumping = threading.Thread(target=TailSource(self.path, poll_interval=0.01, idle_timeout=0.5).pump,
+                                   args=(sink,))
+        pumping.start()
+        time.sleep(0.1)
+        return pumping
+
+    def test_tail_continues_in_next_ring_file(self):
+        first = self.folder / 'ring_00001_20240325081623.pcap'
+        first.write_bytes(self.data)
+        second = pcap_bytes([TS[2] + 1])
+        (self.folder / 'ring_00002_20240325081723.pcap').write_bytes(second)
+        (self.folder / 'other_00003_20240325081823.pcap').write_bytes(pcap_bytes([TS[2] + 2]))
+
+        sink = io.BytesIO()
+        TailSource(first, poll_interval=0.01, idle_timeout=0.05).pump(sink)
+        # one stream: the header of the first file, then the records of both
+        self.assertEqual(self.data + second[24:], sink.getvalue())
+
+    def test_tail_follows_replaced_file(self):
+        sink = io.BytesIO()
+        pumping = self.tail_in_background(sink)
+        self.path.rename(self.folder / 'dump.pcap.1')
+        replacement = pcap_bytes([TS[2] + 1])
+        self.path.write_bytes(replacement)
+        pumping.join()
+        self.assertEqual(self.data + replacement[24:], sink.getvalue())
+
+    def test_tail_follows_truncated_file(self):
+        sink = io.BytesIO()
+        pumping = self.tail_in_background(sink)
+        rewritten = pcap_bytes([TS[2] + 1])
+        with open(self.path, 'r+b') as fh:
+            fh.truncate(0)
+            fh.write(rewritten)
+        pumping.join()
+        self.assertEqual(self.data + rewritten[24:], sink.getvalue())
+
+    def test_tail_refuses_other_link_type(self):
+        first = self.folder / 'ring_00001_20240325081623.pcap'
+        first.write_bytes(self.data)
+        other = bytearray(pcap_bytes([TS[2] + 1]))
+        other[20] = 113  # Linux cooked capture
+        (self.folder / 'ring_00002_20240325081723.pcap').write_bytes(bytes(other))
+        with self.assertRaises(RuntimeError):
+            TailSource(first, poll_interval=0.01, idle_timeout=0.05).pump(io.BytesIO())
+
+    def test_follow_extractor_feeds_tshark_stdin(self):
+        fake = self.folder / 'tshark'
+        fake.write_text(FAKE_TSHARK.format(python=sys.executable))
+        fake.chmod(0o755)
+
+        extractor = FollowExtractor(ReplaySource(self.path, speed=0), tshark_path=str(fake))
+        self.assertEqual(["-l", "-r", "-"], extractor._build_cmd()[1:4])
+        extractor._parser = _PassThroughParser()
+        self.assertEqual([{"size": len(self.data)}], list(extractor.scan()))
+
+
+class TestCorrelateLive(unittest.TestCase):
+    def test_quiet_link_expires_chains(self):
+        resume = threading.Event()
+
+        def messages():
+            yield Message(ts_us=1711354583_000000, tcap_state=TCAPState.Begin, tid="01", opcode=MsgType.SRI,
+                          msisdn="79990000001")
+            # the link goes quiet
+            resume.wait(5)
+
+        start = time.monotonic()
+        chains = correlate_live(messages(), ttl=0.1, tick=0.02)
+        chain = next(chains)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual("79990000001", chain.msisdn)
+        self.assertFalse(chain.complete)
+        resume.set()
+        self.assertEqual([], list(chains))
+
+    def test_errors_of_the_stream_are_raised(self):
+        def messages():
+            raise RuntimeError('tshark command failed')
+            yield
+
+        with self.assertRaises(RuntimeError):
+            list(correlate_live(messages(), tick=0.02))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import copy
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from msg_trace.Parser import JsonParser
+from msg_trace.models import TCAPState
+from msg_trace.profiling import StageTimer
+from msg_trace.synthetic import generate_frames
+from tests.test_fields_parser import json_frame
+
+SRI_RESULT = {"gsm_old.returnResultLast_element": {
+    "gsm_old.invokeID": "1",
+    "gsm_old.resultretres_element": {"gsm_old.opCode": "0", "e212.imsi": "250991234567890"}}}
+
+
+def fields(msg) -> tuple:
+    return (msg.ts_us, msg.meta, msg.tcap_state, msg.tid, msg.opcode, msg.opc, msg.dpc, msg.frame,
+            msg.msisdn, msg.imsi)
+
+
+class TestFastPath(unittest.TestCase):
+    def setUp(self):
+        self.parser = JsonParser()
+
+    def assertSameAsGeneric(self, frame):
+        # the generic path renames keys in place, give it its own copy
+        expected = JsonParser()._generic_frame_to_msg(copy.deepcopy(frame))
+        result = self.parser.parse_frame(frame)
+        self.assertEqual(fields(expected), fields(result))
+        return result
+
+    def test_synthetic_traffic_identical(self):
+        frames = list(generate_frames(3000, subscribers=100, seed=3))
+        expected = [JsonParser()._generic_frame_to_msg(frame) for frame in copy.deepcopy(frames)]
+        with patch.object(self.parser, '_generic_frame_to_msg', side_effect=AssertionError('fallback used')):
+            result = list(self.parser.parse_frames(frames))
+        self.assertEqual([fields(msg) for msg in expected], [fields(msg) for msg in result])
+
+    def test_frame_is_not_modified(self):
+        frame = next(generate_frames(1))
+        original = copy.deepcopy(frame)
+        self.parser.parse_frame(frame)
+        self.assertEqual(original, frame)
+
+    def test_continue_and_new_rp_da_key(self):
+        frame = json_frame({"tcap.continue_element": {"tcap.tid": "00:01"}},
+                           {"gsm_old.invoke_element": {
+                               "gsm_old.opCode_tree": {"gsm_old.localValue": "46"},
+                               "gsm_map.sm.sm_RP_DA": "0",
+                               "gsm_map.sm.sm_RP_DA_tree": {"e212.imsi": "250991234567890"}}})
+        msg = self.assertSameAsGeneric(frame)
+        self.assertEqual((TCAPState.Continue, "250991234567890"), (msg.tcap_state, msg.imsi))
+
+    def test_result_variants(self):
+        for component in (SRI_RESULT,
+                          {"gsm_old.returnResultLast_element": {"gsm_old.invokeID": "1"}},
+                          {"gsm_old.returnResultLast_element": {
+                              "gsm_old.invokeID": "1", "gsm_old.resultretres_element": {}}},
+                          {"gsm_old.returnError_element": {"gsm_old.errorCode_tree": {"gsm_old.localValue": "27"}}},
+                          {"gsm_old.returnError_element": {"gsm_old.errorCode_tree": {}}},
+                          {}):
+            with self.subTest(component=component):
+                self.assertSameAsGeneric(json_frame({"tcap.end_element": {"tcap.tid": "00:02"}}, component))
+
+    def test_sms_variants(self):
+        invoke = {"gsm_old.invoke_element": {"gsm_old.opCode_tree": {"gsm_old.localValue": "46"},
+                                             "gsm_old.sm_RP_DA": "4"}}
+        for sms in ({"gsm_sms.tp-mti": "1", "TP-Destination-Address - (79001234567)": {"gsm_sms.tp-da": "79001234567"}},
+                    {"gsm_sms.tp-mti": "1", "tp-destination-address": {"gsm_sms.tp-da": "79001234567"}},
+                    {"gsm_sms.tp-mti": "1"},
+                    {"gsm_sms.tp-mti": "0"},
+                    {"gsm_sms.tp-mti": "2"}):
+            with self.subTest(sms=sms), redirect_stdout(io.StringIO()):
+                self.assertSameAsGeneric(json_frame({"tcap.begin_element": {"tcap.tid": "00:03"}}, invoke, sms))
+
+    def test_unusual_frames_fall_back(self):
+        lmsi = json_frame({"tcap.begin_element": {"tcap.tid": "00:04"}},
+                          {"gsm_old.invoke_element": {"gsm_old.opCode_tree": {"gsm_old.localValue": "46"},
+                                                      "gsm_old.sm_RP_DA": "1"}})
+        extra_result = json_frame({"tcap.end_element": {"tcap.tid": "00:05"}},
+                                  {"gsm_old.returnResultLast_element": {"gsm_old.invokeID": "1", "x": "1"}})
+        for frame in (lmsi, extra_result):
+            with self.subTest(frame=frame):
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    self.assertSameAsGeneric(frame)
+                # the generic path's warnings are kept
+                self.assertTrue(output.getvalue())
+
+    def test_m3ua_key_changes_between_frames(self):
+        frame = json_frame({"tcap.end_element": {"tcap.tid": "00:06"}}, SRI_RESULT)
+        self.assertSameAsGeneric(frame)
+        layers = frame["_source"]["layers"]
+        layers["m3ua"] = {"protocol-data": {"m3ua.protocol_data_opc": "1", "m3ua.protocol_data_dpc": "2"}}
+        msg = self.assertSameAsGeneric(frame)
+        self.assertEqual(("1", "2"), (msg.opc, msg.dpc))
+        layers["m3ua"] = {"Protocol data (SS7 message of 40 bytes)": {"m3ua.protocol_data_opc": "3"}}
+        msg = self.assertSameAsGeneric(frame)
+        self.assertEqual(("3", None), (msg.opc, msg.dpc))
+
+    def test_tp_da_position_changes_between_frames(self):
+        invoke = {"gsm_old.invoke_element": {"gsm_old.opCode_tree": {"gsm_old.localValue": "46"},
+                                             "gsm_old.sm_RP_DA": "4"}}
+        for destination, sms in (
+                ("79001234567", {"gsm_sms.tp-mti": "1", "gsm_sms.tp-mr": "1",
+                                 "TP-Destination-Address - (79001234567)": {"gsm_sms.tp-da": "79001234567"}}),
+                # same place, another subscriber
+                ("79007654321", {"gsm_sms.tp-mti": "1", "gsm_sms.tp-mr": "2",
+                                 "TP-Destination-Address - (79007654321)": {"gsm_sms.tp-da": "79007654321"}}),
+                ("79000000001", {"gsm_sms.tp-mti": "1",
+                                 "TP-Destination-Address - (79000000001)": {"gsm_sms.tp-da": "79000000001"}}),
+                ("79000000002", {"gsm_sms.tp-mti": "1", "tp-destination-address": {"gsm_sms.tp-da": "79000000002"}})):
+            with self.subTest(sms=sms):
+                frame = json_frame({"tcap.begin_element": {"tcap.tid": "00:0a"}}, invoke, sms)
+                self.assertEqual(destination, self.assertSameAsGeneric(frame).msisdn)
+
+    def test_errors_are_the_generic_ones(self):
+        frame = json_frame({}, SRI_RESULT)
+        with self.assertRaises(RuntimeError):
+            self.parser.parse_frame(frame)
+        frame = json_frame({"tcap.begin_element": {"tcap.tid": "00:07"}}, {})
+        with self.assertRaises(RuntimeError):
+            self.parser.parse_frame(frame)
+
+    def test_broken_frame_is_not_reparsed(self):
+        frame = json_frame({"tcap.end_element": {"tcap.tid": "00:08"}}, SRI_RESULT)
+        del frame["_source"]["layers"]["m3ua"]
+        with patch.object(self.parser, '_generic_frame_to_msg', side_effect=AssertionError('fallback used')):
+            with self.assertRaises(KeyError):
+                self.parser.parse_frame(frame)
+
+    def test_fallbacks_are_counted(self):
+        timer = StageTimer()
+        parser = JsonParser(timer=timer)
+        unknown_opcode = json_frame({"tcap.begin_element": {"tcap.tid": "00:09"}},
+                                    {"gsm_old.invoke_element": {"gsm_old.opCode_tree": {"gsm_old.localValue": "99"}}})
+        with self.assertRaises(ValueError):
+            parser.parse_frame(unknown_opcode)
+        list(parser.parse_frames(generate_frames(10)))
+        self.assertEqual(1, timer.summary()["stages"]["parse_fallback"]["items"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import io
+import json
+import unittest
+
+from msg_trace.jsonstream import JsonArrayDecoder, iter_json_array
+
+
+class TestJsonArrayDecoder(unittest.TestCase):
+    def setUp(self):
+        self.frames = [{"_source": {"layers": {"frame": {"frame.number": str(i)}, "text": "привет"}}}
+                       for i in range(5)]
+        self.raw = json.dumps(self.frames, indent=2, ensure_ascii=False).encode()
+
+    def test_feed_byte_by_byte(self):
+        decoder = JsonArrayDecoder()
+        result = []
+        for i in range(len(self.raw)):
+            result.extend(decoder.feed(self.raw[i:i + 1]))
+        decoder.close()
+
+        self.assertEqual(self.frames, result)
+        self.assertTrue(decoder.finished)
+
+    def test_elements_returned_before_array_is_closed(self):
+        decoder = JsonArrayDecoder()
+        head = self.raw[:self.raw.index(b'"1"')]
+
+        self.assertEqual(self.frames[:1], decoder.feed(head))
+
+    def test_empty_output(self):
+        self.assertEqual([], list(iter_json_array(io.BytesIO(b''))))
+        self.assertEqual([], list(iter_json_array(io.BytesIO(b'[\n\n]\n'))))
+
+    def test_truncated_output_raises(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(self.raw[:-10])))
+
+    def test_not_an_array_raises(self):
+        with self.assertRaises(ValueError):
+            JsonArrayDecoder().feed(b'{"a": 1}')
+
+    def test_iter_json_array_small_chunks(self):
+        result = list(iter_json_array(io.BytesIO(self.raw), chunk_size=7))
+        self.assertEqual(self.frames, result)
+
+
+if __name__ == "__main__":
+    unittest.main()
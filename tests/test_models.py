@@ -0,0 +1,52 @@
+import unittest
+from datetime import datetime, timezone
+
+from msg_trace.models import Message, epoch_str_to_us, epoch_to_us, intern_value, us_to_datetime
+from msg_trace.report import Reporter
+
+
+class TestTimestamps(unittest.TestCase):
+    def test_tshark_epoch_strings(self):
+        self.assertEqual(1711354583_123456, epoch_str_to_us("1711354583.123456000"))
+        self.assertEqual(1711354583_123457, epoch_str_to_us("1711354583.123456500"))
+        self.assertEqual(1711354583_123456, epoch_str_to_us("1711354583.123456499"))
+        self.assertEqual(1711354583_999999, epoch_str_to_us("1711354583.999999499"))
+        self.assertEqual(1711354584_000000, epoch_str_to_us("1711354583.9999995"))
+        self.assertEqual(1711354583_100000, epoch_str_to_us("1711354583.1"))
+        self.assertEqual(1711354583_000000, epoch_str_to_us("1711354583"))
+
+    def test_exact_where_float_is_not(self):
+        # 1711354583.0000005 is not representable, the double lies just below .5 us
+        self.assertEqual(1711354583_000001, epoch_str_to_us("1711354583.000000500"))
+        self.assertEqual(1711354583_000000, epoch_to_us(float("1711354583.000000500")))
+
+    def test_other_notations_use_float(self):
+        self.assertEqual(1_500_000, epoch_str_to_us("1.5e0"))
+        self.assertEqual(-1_500_000, epoch_str_to_us("-1.5"))
+        with self.assertRaises(ValueError):
+            epoch_str_to_us("")
+
+    def test_datetime_is_built_in_utc(self):
+        msg = Message(ts_us=epoch_str_to_us("1711354583.123456789"))
+        self.assertEqual(datetime(2024, 3, 25, 8, 16, 23, 123457, tzinfo=timezone.utc), msg.time)
+        self.assertEqual(Reporter._fmt_time(msg.time), Reporter._fmt_ts(msg.ts_us))
+        self.assertEqual("25/03 08:16:23", Reporter._fmt_ts(msg.ts_us))
+        self.assertEqual(us_to_datetime(0), datetime(1970, 1, 1, tzinfo=timezone.utc))
+
+
+class TestInterning(unittest.TestCase):
+    def test_only_point_codes_are_shared(self):
+        def fresh(value: str) -> str:
+            return "".join(list(value))
+
+        first = Message(tid=fresh("2f:7a:c6:22"), opc=fresh("14685"), msisdn=fresh("79999999999"))
+        second = Message(tid=fresh("2f:7a:c6:22"), opc=fresh("14685"), msisdn=fresh("79999999999"))
+        self.assertIs(first.opc, second.opc)
+        self.assertIsNot(first.tid, second.tid)
+        self.assertIsNot(first.msisdn, second.msisdn)
+        self.assertEqual(1234, intern_value(1234))
+        self.assertIsNone(intern_value(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime, timezone
+
+from msg_trace.colstore import ColumnarMessageStore
+from msg_trace.models import Message, MsgType
+from msg_trace.msgstore import MessageStore
+
+BASE = 1711354583_000000
+
+
+def make_store(store_cls, offsets):
+    store = store_cls()
+    for i, offset in enumerate(offsets):
+        store.add(Message(ts_us=BASE + offset, tid=f"{i:02x}", opcode=MsgType.SRI))
+    return store
+
+
+class TestTimeIndex(unittest.TestCase):
+    STORES = (MessageStore, ColumnarMessageStore)
+
+    def test_ordered_input_keeps_incremental_index(self):
+        for store_cls in self.STORES:
+            store = make_store(store_cls, [0, 1, 1, 5])
+            self.assertTrue(store._time_order_valid)
+            self.assertEqual([0, 1, 1, 5], [m.ts_us - BASE for m in store.iter_sorted()])
+
+    def test_out_of_order_input_is_sorted_lazily(self):
+        for store_cls in self.STORES:
+            store = make_store(store_cls, [3, 1, 2, 0])
+            self.assertFalse(store._time_order_valid)
+            self.assertEqual([0, 1, 2, 3], [m.ts_us - BASE for m in store.sort_by_datetime()])
+            self.assertTrue(store._time_order_valid)
+            # equal times keep insertion order
+            store.add(Message(ts_us=BASE + 3, tid="zz"))
+            self.assertEqual(["00", "zz"], [m.tid for m in store.between(BASE + 3, BASE + 3)])
+
+    def test_between_is_inclusive(self):
+        for store_cls in self.STORES:
+            store = make_store(store_cls, [4, 0, 2, 2, 6, 8])
+            self.assertEqual([2, 2, 4, 6], [m.ts_us - BASE for m in store.between(BASE + 1, BASE + 6)])
+            self.assertEqual([], store.between(BASE + 9, BASE + 20))
+            self.assertEqual([], store.between(BASE + 7, BASE + 3))
+
+    def test_between_accepts_datetimes(self):
+        for store_cls in self.STORES:
+            store = make_store(store_cls, [0, 1_000_000, 2_000_000])
+            since = datetime.fromtimestamp(BASE / 1e6 + 0.5, tz=timezone.utc)
+            to = datetime.fromtimestamp(BASE / 1e6 + 2, tz=timezone.utc)
+            self.assertEqual([1_000_000, 2_000_000], [m.ts_us - BASE for m in store.between(since, to)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import asyncio
+import gzip
+import json
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace.capinfo import CapInfo
+from msg_trace.extractor import TsharkExtractor
+from msg_trace import parallel
+from msg_trace.parallel import aextract_parallel, extract_parallel, iter_async
+from msg_trace.profiling import StageTimer
+from msg_trace.synthetic import generate_frames
+
+# stands in for tshark: prints <dump>.json, or fails for dumps named bad*
+FAKE_TSHARK = '''#!{python}
+import sys
+pcap = sys.argv[sys.argv.index('-r') + 1]
+if pcap.rsplit('/', 1)[-1].startswith('bad'):
+    sys.stderr.write('cannot read ' + pcap)
+    sys.exit(2)
+with open(pcap + '.json', 'rb') as fh:
+    sys.stdout.buffer.write(fh.read())
+'''
+
+# stands in for tshark on a classic pcap whose packets carry their frame number in
+# the payload: prints the prepared frame of every packet, numbered as tshark would
+FAKE_PCAP_TSHARK = '''#!{python}
+import gzip, json, re, struct, sys
+source = sys.argv[sys.argv.index('-r') + 1]
+data = sys.stdin.buffer.read() if source == '-' else open(source, 'rb').read()
+if data[:2] == b'\\x1f\\x8b':
+    data = gzip.decompress(data)
+with open({frames!r}) as fh:
+    frames = json.load(fh)
+skip = re.search(r'frame.number > (\\d+)', sys.argv[sys.argv.index('-Y') + 1])
+skip = int(skip.group(1)) if skip else 0
+out = []
+offset, local = 24, 0
+while offset < len(data):
+    incl_len, = struct.unpack_from('<I', data, offset + 8)
+    number, = struct.unpack_from('<I', data, offset + 16)
+    offset += 16 + incl_len
+    local += 1
+    if local > skip:
+        frame = frames[number - 1]
+        frame['_source']['layers']['frame']['frame.number'] = str(local)
+        out.append(frame)
+json.dump(out, sys.stdout)
+'''
+
+
+def fake_tshark_path(folder: Path, script: str):
+    tshark = folder / 'tshark'
+    tshark.write_text(script)
+    tshark.chmod(0o755)
+    return patch.dict(os.environ, PATH=f'{folder}{os.pathsep}{os.environ.get("PATH", "")}')
+
+
+class TestShardedExtraction(unittest.TestCase):
+    COUNT = 300
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        folder = Path(self._tmp.name)
+        frames = folder / 'frames.json'
+        frames.write_text(json.dumps(list(generate_frames(self.COUNT, subscribers=20))))
+        path = fake_tshark_path(folder, FAKE_PCAP_TSHARK.format(python=sys.executable, frames=str(frames)))
+        path.start()
+        self.addCleanup(path.stop)
+
+        # one packet per second, the payload is the frame number
+        data = struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+        for number in range(1, self.COUNT + 1):
+            data += struct.pack('<IIIII', 1711354583 + number, 0, 4, 4, number)
+        self.dump = CapInfo(folder / 'big.pcap')
+        self.dump.filepath.write_bytes(data)
+        self.dump.ts_start = datetime(2025, 3, 25)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def extract(self, shards: int) -> list:
+        return [(info, messages) for info, messages in extract_parallel([self.dump], {}, jobs=3, shards=shards)]
+
+    def test_shards_merge_in_frame_order(self):
+        with patch.object(parallel, 'MIN_SHARD_BYTES', 1):
+            sharded = self.extract(shards=3)
+        [(_, whole)] = self.extract(shards=1)
+
+        self.assertEqual(3, len(sharded))
+        messages = [message for _, part in sharded for message in part]
+        self.assertEqual(list(range(1, self.COUNT + 1)), [message.frame for message in messages])
+        self.assertEqual(whole, messages)
+        self.assertTrue(all(message.meta is self.dump for message in messages))
+
+    def test_small_dump_is_not_split(self):
+        self.assertEqual(1, len(self.extract(shards=3)))
+
+    def test_compressed_dump_is_read_whole(self):
+        [(_, whole)] = self.extract(shards=1)
+        compressed = self.dump.filepath.with_name('big.pcap.gz')
+        compressed.write_bytes(gzip.compress(self.dump.filepath.read_bytes()))
+        self.dump.filepath = compressed
+
+        with patch.object(parallel, 'MIN_SHARD_BYTES', 1):
+            [(_, messages)] = self.extract(shards=3)
+        self.assertEqual(whole, messages)
+        self.assertEqual(self.COUNT, messages[-1].frame)
+
+
+class TestAsyncExtraction(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        path = fake_tshark_path(self.folder, FAKE_TSHARK.format(python=sys.executable))
+        path.start()
+        self.addCleanup(path.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def dump(self, name: str, hour: int, frames: int = 0) -> CapInfo:
+        pcap = self.folder / name
+        pcap.write_bytes(b'')
+        (self.folder / f'{name}.json').write_text(json.dumps(list(generate_frames(frames, seed=hour))))
+        info = CapInfo(pcap)
+        info.ts_start = info.ts_end = datetime(2025, 3, 25, hour)
+        return info
+
+    def test_ascan_matches_scan(self):
+        info = self.dump('a.pcap', 1, 600)
+        extractor = TsharkExtractor(date_filter={}, pcap_path=info.filepath)
+
+        async def collect():
+            return [message async for message in extractor.ascan()]
+
+        expected = list(TsharkExtractor(date_filter={}, pcap_path=info.filepath, stream=True).scan())
+        self.assertEqual(expected, asyncio.run(collect()))
+
+    def test_files_in_chronological_order(self):
+        late, early, middle = self.dump('late.pcap', 3, 700), self.dump('early.pcap', 1, 300), self.dump('mid.pcap', 2)
+        messages = list(iter_async(aextract_parallel([late, early, middle], {}, jobs=2, max_queued=256)))
+
+        self.assertEqual(1000, len(messages))
+        self.assertEqual([early] * 300 + [late] * 700, [msg.meta for msg in messages])
+        self.assertEqual(list(range(1, 301)) + list(range(1, 701)), [msg.frame for msg in messages])
+
+    def test_failed_dump_raises(self):
+        files = [self.dump('a.pcap', 1, 10), self.dump('bad.pcap', 2, 10)]
+        with self.assertRaises(RuntimeError) as context:
+            list(iter_async(aextract_parallel(files, {}, jobs=2)))
+        self.assertIn('cannot read', str(context.exception))
+
+    def test_consumer_stops_early(self):
+        files = [self.dump(f'{i}.pcap', i, 2000) for i in range(4)]
+        timer = StageTimer()
+        messages = iter_async(aextract_parallel(files, {}, jobs=2, max_queued=256, timer=timer))
+        self.assertEqual(1, next(messages).frame)
+        messages.close()
+
+        self.assertIn('tshark_wait', timer.summary()["stages"])
+
+    def test_jobs_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            next(iter_async(aextract_parallel([], {}, jobs=0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import gzip
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace import pcapfile
+from msg_trace.pcapfile import compression, iter_records, plan_shards, read_bounds, read_frames
+
+TS = [1711354583.25, 1711354584.5, 1711354590.75]
+
+
+def pcap_bytes(timestamps, order='<', nano=False, payload=b'\x00' * 40) -> bytes:
+    magic = 0xA1B23C4D if nano else 0xA1B2C3D4
+    scale = 10 ** 9 if nano else 10 ** 6
+    data = struct.pack(order + 'IHHiIII', magic, 2, 4, 0, 0, 65535, 1)
+    for ts in timestamps:
+        sec = int(ts)
+        data += struct.pack(order + 'IIII', sec, round((ts - sec) * scale), len(payload), len(payload))
+        data += payload
+    return data
+
+
+def pcapng_block(order, block_type, body: bytes) -> bytes:
+    body += b'\x00' * (-len(body) % 4)
+    total = len(body) + 12
+    return struct.pack(order + 'II', block_type, total) + body + struct.pack(order + 'I', total)
+
+
+def pcapng_bytes(timestamps, order='<', tsresol=None, payload=b'\x00' * 40) -> bytes:
+    shb = pcapng_block(order, 0x0A0D0D0A, struct.pack(order + 'IHHq', 0x1A2B3C4D, 1, 0, -1))
+    options = b''
+    units = 10 ** 6
+    if tsresol is not None:
+        options = struct.pack(order + 'HH', 9, 1) + bytes([tsresol]) + b'\x00' * 3 + struct.pack(order + 'HH', 0, 0)
+        units = 10 ** tsresol
+    idb = pcapng_block(order, 1, struct.pack(order + 'HHI', 1, 0, 65535) + options)
+    data = shb + idb
+    for ts in timestamps:
+        raw = round(ts * units)
+        body = struct.pack(order + 'IIIII', 0, raw >> 32, raw & 0xFFFFFFFF, len(payload), len(payload)) + payload
+        data += pcapng_block(order, 6, body)
+    return data
+
+
+class TestReadBounds(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, name, data: bytes) -> Path:
+        path = self.folder / name
+        path.write_bytes(data)
+        return path
+
+    def assertBounds(self, path, frames=len(TS)):
+        fast = read_bounds(path)
+        self.assertIsNone(fast.frames)
+        self.assertAlmostEqual(TS[0], fast.ts_start, places=5)
+        self.assertAlmostEqual(TS[-1], fast.ts_end, places=5)
+
+        counted = read_bounds(path, count_frames=True)
+        self.assertEqual(frames, counted.frames)
+        self.assertAlmostEqual(TS[0], counted.ts_start, places=5)
+        self.assertAlmostEqual(TS[-1], counted.ts_end, places=5)
+
+    def test_pcap_little_endian(self):
+        self.assertBounds(self.write('le.pcap', pcap_bytes(TS)))
+
+    def test_pcap_big_endian_nanoseconds(self):
+        self.assertBounds(self.write('be.pcap', pcap_bytes(TS, order='>', nano=True)))
+
+    def test_pcap_truncated_tail(self):
+        path = self.write('growing.pcap', pcap_bytes(TS + [TS[-1] + 10])[:-5])
+
+        # no record ends at EOF, the reader falls back to walking all headers
+        bounds = read_bounds(path)
+        self.assertEqual(len(TS), bounds.frames)
+        self.assertAlmostEqual(TS[-1], bounds.ts_end, places=5)
+
+    def test_pcapng_little_endian(self):
+        self.assertBounds(self.write('le.pcapng', pcapng_bytes(TS)))
+
+    def test_pcapng_big_endian_tsresol(self):
+        self.assertBounds(self.write('be.pcapng', pcapng_bytes(TS, order='>', tsresol=9)))
+
+    def test_empty_capture(self):
+        bounds = read_bounds(self.write('empty.pcap', pcap_bytes([])))
+        self.assertEqual(0, bounds.frames)
+        self.assertIsNone(bounds.ts_start)
+
+    def test_unknown_format_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            read_bounds(self.write('junk.pcap', b'not a capture file'))
+
+
+class TestIterRecords(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_records_rebuild_the_file(self):
+        for name, data in (('a.pcap', pcap_bytes(TS)), ('a.pcapng', pcapng_bytes(TS, order='>'))):
+            path = self.folder / name
+            path.write_bytes(data)
+            records = list(iter_records(path))
+            self.assertEqual(data, b''.join(record for _, record in records))
+            stamps = [ts for ts, _ in records if ts is not None]
+            self.assertEqual(len(TS), len(stamps))
+            for expected, ts in zip(TS, stamps):
+                self.assertAlmostEqual(expected, ts, places=5)
+
+    def test_truncated_record_is_skipped(self):
+        path = self.folder / 'growing.pcap'
+        path.write_bytes(pcap_bytes(TS)[:-5])
+        self.assertEqual(len(TS) - 1, sum(1 for ts, _ in iter_records(path) if ts is not None))
+
+
+class TestPlanShards(unittest.TestCase):
+    # one packet per second
+    STAMPS = [1711354583.0 + i for i in range(100)]
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_shards_are_captures_covering_every_packet_once(self):
+        for name, data in (('a.pcap', pcap_bytes(self.STAMPS)), ('a.pcapng', pcapng_bytes(self.STAMPS, order='>'))):
+            with self.subTest(name=name):
+                path = self.folder / name
+                path.write_bytes(data)
+                shards = plan_shards(path, 4, lead_in=10.0)
+                self.assertEqual(4, len(shards))
+                self.assertEqual((1, 0), (shards[0].first_frame, shards[0].lead_in))
+
+                own = []
+                for shard in shards:
+                    shard_path = self.folder / f'shard.{name}'
+                    shard_path.write_bytes(b''.join(data[start:end] for start, end in shard.ranges()))
+                    stamps = [ts for ts, _ in iter_records(shard_path) if ts is not None]
+                    own.extend(stamps[shard.lead_in:])
+                    # frame numbers within the shard map back to the file
+                    self.assertEqual(self.STAMPS[shard.frame_offset + shard.lead_in], stamps[shard.lead_in])
+                    if shard.lead_in:
+                        self.assertEqual(10, shard.lead_in)
+                        self.assertEqual(stamps[shard.lead_in] - 10.0, stamps[0])
+                self.assertEqual(self.STAMPS, own)
+
+    def test_small_capture_gives_fewer_shards(self):
+        path = self.folder / 'a.pcap'
+        path.write_bytes(pcap_bytes(self.STAMPS[:2]))
+        self.assertEqual([1, 2], [shard.first_frame for shard in plan_shards(path, 8)])
+        empty = self.folder / 'empty.pcap'
+        empty.touch()
+        self.assertEqual([], plan_shards(empty, 2))
+
+    def test_unknown_format_raises_value_error(self):
+        path = self.folder / 'dump.pcap.gz'
+        path.write_bytes(b'\x1f\x8b\x08\x00 compressed')
+        with self.assertRaises(ValueError):
+            plan_shards(path, 2)
+
+
+class TestCompressed(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_gzip_read_as_stream(self):
+        for name, data in (('a.pcap.gz', pcap_bytes(TS, nano=True)), ('a.pcapng.gz', pcapng_bytes(TS, order='>'))):
+            with self.subTest(name=name):
+                path = self.folder / name
+                path.write_bytes(gzip.compress(data))
+                plain = self.folder / name[:-3]
+                plain.write_bytes(data)
+
+                self.assertEqual('gzip', compression(path))
+                self.assertIsNone(compression(plain))
+                bounds = read_bounds(path)
+                self.assertEqual(len(TS), bounds.frames)
+                self.assertAlmostEqual(TS[0], bounds.ts_start, places=5)
+                self.assertAlmostEqual(TS[-1], bounds.ts_end, places=5)
+                self.assertEqual(read_frames(plain, {2, 3}), read_frames(path, {2, 3}))
+
+    def test_truncated_gzip_stream(self):
+        path = self.folder / 'growing.pcap.gz'
+        path.write_bytes(gzip.compress(pcap_bytes(TS)[:-5]))
+        self.assertEqual(len(TS) - 1, read_bounds(path).frames)
+
+    def test_empty_capture(self):
+        path = self.folder / 'empty.pcap.gz'
+        path.write_bytes(gzip.compress(b''))
+        self.assertEqual((0, None, None), tuple(read_bounds(path)))
+
+    @unittest.skipIf(pcapfile.zstandard is None, 'zstandard is not installed')
+    def test_zstd_read_as_stream(self):
+        path = self.folder / 'a.pcapng.zst'
+        path.write_bytes(pcapfile.zstandard.ZstdCompressor().compress(pcapng_bytes(TS)))
+        self.assertEqual('zstd', compression(path))
+        self.assertEqual(len(TS), read_bounds(path).frames)
+
+    def test_zstd_without_zstandard(self):
+        path = self.folder / 'a.pcapng.zst'
+        path.write_bytes(b'\x28\xb5\x2f\xfd' + b'\x00' * 16)
+        with patch.object(pcapfile, 'zstandard', None):
+            with self.assertRaises(ValueError):
+                read_bounds(path)
+
+    def test_compressed_dump_is_not_sharded(self):
+        path = self.folder / 'a.pcap.gz'
+        path.write_bytes(gzip.compress(pcap_bytes(TS)))
+        with self.assertRaises(ValueError):
+            plan_shards(path, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace.extractor import TsharkExtractor
+from msg_trace.profiling import StageTimer
+from msg_trace.synthetic import generate_frames
+
+# stands in for tshark: prints a prepared JSON array whatever the arguments
+FAKE_TSHARK = '''#!{python}
+import sys
+with open({output!r}, 'rb') as fh:
+    sys.stdout.buffer.write(fh.read())
+'''
+
+
+class _Clock:
+    """perf_counter replacement advancing one second per call."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+class TestStageTimer(unittest.TestCase):
+    def test_nested_time_is_exclusive(self):
+        with patch('msg_trace.profiling.time.perf_counter', _Clock()):
+            timer = StageTimer()              # t=1
+            timer.start('outer')              # t=2
+            timer.start('inner')              # t=3: outer 1
+            timer.stop(5)                     # t=4: inner 1
+            timer.stop()                      # t=5: outer +1
+        stages = timer.summary()["stages"]
+        self.assertEqual({"seconds": 2.0, "calls": 1, "items": 0, "items_per_second": None}, stages["outer"])
+        self.assertEqual({"seconds": 1.0, "calls": 1, "items": 5, "items_per_second": 5.0}, stages["inner"])
+
+    def test_iter_and_wrap_count_items(self):
+        timer = StageTimer()
+        self.assertEqual([1, 2, 3], list(timer.iter('read', [1, 2, 3])))
+        double = timer.wrap('double', lambda value: value * 2)
+        self.assertEqual(4, double(2))
+
+        stages = timer.summary()["stages"]
+        self.assertEqual((4, 3), (stages["read"]["calls"], stages["read"]["items"]))
+        self.assertEqual((1, 1), (stages["double"]["calls"], stages["double"]["items"]))
+
+    def test_merge_worker_summary(self):
+        worker = StageTimer()
+        with worker.stage('parse', 10):
+            pass
+        worker.add_file(Path('a.pcap'), 10, 0.5, 0.25)
+
+        timer = StageTimer()
+        with timer.stage('parse', 5):
+            pass
+        timer.merge(worker.summary())
+        summary = timer.summary()
+        self.assertEqual((2, 15), (summary["stages"]["parse"]["calls"], summary["stages"]["parse"]["items"]))
+        self.assertEqual([{"path": "a.pcap", "frames": 10, "seconds": 0.5, "tshark_seconds": 0.25,
+                           "frames_per_second": 20.0, "cached": False}], summary["files"])
+
+    def test_write_json(self):
+        timer = StageTimer()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'profile.json'
+            timer.write(path)
+            with open(path) as fh:
+                data = json.load(fh)
+        self.assertEqual(1, data["version"])
+        self.assertIn("peak_rss_bytes", data)
+
+
+class TestExtractorTiming(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        folder = Path(self._tmp.name)
+        output = folder / 'frames.json'
+        output.write_text(json.dumps(list(generate_frames(50, subscribers=5))))
+        self.tshark = folder / 'tshark'
+        self.tshark.write_text(FAKE_TSHARK.format(python=sys.executable, output=str(output)))
+        self.tshark.chmod(0o755)
+        self.dump = folder / 'dump.pcap'
+        self.dump.write_bytes(b'')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_stages_and_file_record(self):
+        for stream in (True, False):
+            with self.subTest(stream=stream):
+                timer = StageTimer(profile_stage='parse')
+                extractor = TsharkExtractor(date_filter={}, tshark_path=str(self.tshark), pcap_path=self.dump,
+                                            stream=stream, timer=timer)
+                self.assertEqual(50, len(list(extractor.scan())))
+
+                summary = timer.summary()
+                self.assertEqual(50, summary["stages"]["parse"]["items"])
+                self.assertIn("json_decode", summary["stages"])
+                self.assertIn("tshark_wait", summary["stages"])
+                [record] = summary["files"]
+                self.assertEqual((str(self.dump), 50), (record["path"], record["frames"]))
+                self.assertIsNotNone(record["tshark_seconds"])
+
+    def test_no_timer(self):
+        extractor = TsharkExtractor(date_filter={}, tshark_path=str(self.tshark), pcap_path=self.dump, stream=True)
+        self.assertEqual(50, len(list(extractor.scan())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace import logic
+from msg_trace.analyzer import MessageChain
+from msg_trace.models import MsgType
+from msg_trace.msgstore import MessageStore
+from msg_trace.sqlindex import INDEX_DB_NAME, SCHEMA_VERSION, SqliteMessageStore, build_index
+from tests.test_colstore import BASE, sample_messages
+from tests.test_pcapfile import pcap_bytes
+
+
+def fake_extract(files, date_filter, backend='json', jobs=1):
+    for info in files:
+        yield info, sample_messages()
+
+
+class TestSqliteMessageStore(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.dump = self.folder / 'dump.pcap'
+        self.dump.write_bytes(pcap_bytes([1711354583.0]))
+        self.db_path = self.folder / INDEX_DB_NAME
+
+        self.messages = sample_messages()
+        for frame, msg in enumerate(self.messages, 1):
+            msg.frame = frame
+        self.store = SqliteMessageStore(self.db_path)
+        self.store.index_file(self.dump, self.messages)
+        self.reference = MessageStore()
+        for msg in self.messages:
+            self.reference.add(msg)
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def test_same_api_results_as_message_store(self):
+        self.assertEqual(self.reference.by_tid("aa"), self.store.by_tid("aa"))
+        self.assertEqual(self.reference.by_msisdn("79990000002"), self.store.by_msisdn("79990000002"))
+        self.assertEqual(self.reference.by_imsi("250990000000001"), self.store.by_imsi("250990000000001"))
+        self.assertEqual(self.reference.by_opcode(MsgType.SRI), self.store.by_opcode(MsgType.SRI))
+        self.assertEqual(list(self.reference.filter_all()), list(self.store.filter_all()))
+        self.assertEqual(self.reference.sort_by_datetime(), self.store.sort_by_datetime())
+        self.assertEqual(self.reference.between(BASE + 2, BASE + 4), self.store.between(BASE + 2, BASE + 4))
+        self.assertEqual([], self.store.by_tid(None))
+
+    def test_chain_from_reopened_database(self):
+        expected = MessageChain(self.reference, "79990000001")
+        expected.build()
+        chain = MessageChain(SqliteMessageStore(self.db_path), "79990000001")
+        chain.build()
+        self.assertEqual(expected.get_chain(), chain.get_chain())
+        self.assertEqual([2, 1], [msg.frame for msg in chain.get_chain()])
+
+    def test_time_window(self):
+        windowed = SqliteMessageStore(self.db_path, since=BASE + 2, to=BASE + 3)
+        self.assertEqual(2, len(windowed))
+        self.assertEqual([BASE + 3], [msg.ts_us for msg in windowed.by_tid("aa")])
+
+    def test_reindex_replaces_rows(self):
+        self.assertTrue(self.store.is_current(self.dump))
+        self.dump.write_bytes(pcap_bytes([1711354583.0, 1711354584.0]))
+        self.assertFalse(self.store.is_current(self.dump))
+
+        self.store.index_file(self.dump, self.messages[:2])
+        self.assertTrue(self.store.is_current(self.dump))
+        self.assertEqual(2, len(self.store))
+
+    def test_outdated_index_is_dropped(self):
+        self.store.close()
+        with patch('msg_trace.sqlindex.SCHEMA_VERSION', SCHEMA_VERSION + 1), patch('builtins.print'):
+            self.store = SqliteMessageStore(self.db_path)
+        self.assertEqual(0, len(self.store))
+        self.assertFalse(self.store.is_current(self.dump))
+
+    def test_newer_index_is_refused(self):
+        self.store.close()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        with self.assertRaises(RuntimeError):
+            self.store = SqliteMessageStore(self.db_path)
+        self.store = SqliteMessageStore(':memory:')
+
+    def test_trace_does_not_probe_dumps(self):
+        args = argparse.Namespace(since='2024-03-24', to='2024-03-26', msisdn='79990000001', msisdn_file=None,
+                                  imsi=None, dump_folder=None, recursive=False, db=self.db_path, correlate=False,
+                                  render='ascii', export_pcap=None)
+        with patch.object(logic, 'FilePool', side_effect=AssertionError('dumps probed')), \
+                patch.object(logic, 'render_report') as render, patch('builtins.print'):
+            logic.trace(args)
+        self.assertEqual([2, 1], [msg.frame for msg in render.call_args[0][0]])
+
+
+@patch('msg_trace.sqlindex.extract_parallel', fake_extract)
+class TestBuildIndex(unittest.TestCase):
+    def test_only_new_dumps_are_indexed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp)
+            (folder / 'a.pcap').write_bytes(pcap_bytes([1711354583.0]))
+            self.assertEqual(1, build_index(folder, settle=0))
+            self.assertEqual(0, build_index(folder, settle=0))
+
+            (folder / 'b.pcap').write_bytes(pcap_bytes([1711354590.0]))
+            self.assertEqual(1, build_index(folder, settle=0))
+            store = SqliteMessageStore(folder / INDEX_DB_NAME)
+            self.assertEqual(2 * len(sample_messages()), len(store))
+            store.close()
+
+    def test_partitioned_archive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp)
+            hour = folder / 'site' / '2025' / '03' / '25' / '08'
+            hour.mkdir(parents=True)
+            (hour / 'a.pcap').write_bytes(pcap_bytes([1711354583.0]))
+            self.assertEqual(0, build_index(folder, settle=0))
+            self.assertEqual(1, build_index(folder, settle=0, recursive=True))
+
+    def test_removed_dumps_are_dropped(self):
+        with tempfile.TemporaryDirectory() as tmp, patch('builtins.print'):
+            folder = Path(tmp)
+            for name in ('a.pcap', 'b.pcap'):
+                (folder / name).write_bytes(pcap_bytes([1711354583.0]))
+            self.assertEqual(2, build_index(folder, settle=0))
+            (folder / 'a.pcap').unlink()
+            self.assertEqual(0, build_index(folder, settle=0))
+
+            store = SqliteMessageStore(folder / INDEX_DB_NAME)
+            self.assertEqual(len(sample_messages()), len(store))
+            self.assertEqual({'b.pcap'}, {msg.meta.filepath.name for msg in store.filter_all()})
+            store.close()
+
+    def test_growing_dump_is_left_for_later(self):
+        with tempfile.TemporaryDirectory() as tmp, patch('builtins.print'):
+            folder = Path(tmp)
+            dump = folder / 'ring_00001.pcap'
+            dump.write_bytes(pcap_bytes([1711354583.0]))
+            self.assertEqual(0, build_index(folder, settle=60))
+            self.assertEqual(1, build_index(folder, settle=0))
+
+    def test_identity_is_taken_before_extraction(self):
+        with tempfile.TemporaryDirectory() as tmp, patch('builtins.print'):
+            folder = Path(tmp)
+            dump = folder / 'ring_00001.pcap'
+            dump.write_bytes(pcap_bytes([1711354583.0]))
+            before = dump.stat()
+
+            def extract_while_written(files, date_filter, backend='json', jobs=1):
+                for info, messages in fake_extract(files, date_filter):
+                    dump.write_bytes(pcap_bytes([1711354583.0, 1711354584.0]))
+                    os.utime(dump, ns=(before.st_atime_ns, before.st_mtime_ns - 10**9))
+                    yield info, messages
+
+            with patch('msg_trace.sqlindex.extract_parallel', extract_while_written):
+                self.assertEqual(0, build_index(folder, settle=0))
+            # the tail written meanwhile is indexed with the next run
+            self.assertEqual(1, build_index(folder, settle=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from collections import Counter
+
+from msg_trace.analyzer import MessageChain
+from msg_trace.models import MsgType, TCAPState
+from msg_trace.msgstore import MessageStore
+from msg_trace.Parser import JsonParser
+from msg_trace.synthetic import generate_frames, subscriber_imsi, subscriber_msisdn
+
+
+class TestGenerateFrames(unittest.TestCase):
+    def setUp(self):
+        self.frames = list(generate_frames(2000, subscribers=50, seed=7))
+        self.messages = list(JsonParser().parse_frames(self.frames))
+
+    def test_count_and_capture_order(self):
+        self.assertEqual(2000, len(self.messages))
+        self.assertEqual(list(range(1, 2001)), [msg.frame for msg in self.messages])
+        timestamps = [msg.ts_us for msg in self.messages]
+        self.assertEqual(sorted(timestamps), timestamps)
+
+    def test_deterministic(self):
+        # the parser renames keys of the frames it parses, compare fresh ones
+        frames = list(generate_frames(2000, subscribers=50, seed=7))
+        self.assertEqual(frames, list(generate_frames(2000, subscribers=50, seed=7)))
+        self.assertNotEqual(frames, list(generate_frames(2000, subscribers=50, seed=8)))
+
+    def test_message_mix(self):
+        kinds = Counter((msg.opcode, msg.tcap_state) for msg in self.messages)
+        self.assertGreater(kinds[MsgType.SRI, TCAPState.Begin], 0)
+        self.assertGreater(kinds[MsgType.Forward_SM, TCAPState.Begin], 0)
+        self.assertGreater(kinds[MsgType.MT_Forward_SM, TCAPState.Begin], 0)
+        self.assertGreater(kinds[MsgType.ResultLast, TCAPState.End], 0)
+        self.assertGreater(kinds[MsgType.Error, TCAPState.End], 0)
+        self.assertEqual(5, len(kinds))
+
+    def test_mt_v3_ratio(self):
+        def deliveries(ratio) -> Counter:
+            frames = generate_frames(2000, subscribers=50, mo_ratio=0, mt_v3_ratio=ratio, seed=7)
+            return Counter(msg.opcode for msg in JsonParser().parse_frames(frames)
+                           if msg.tcap_state == TCAPState.Begin and msg.opcode != MsgType.SRI)
+
+        self.assertEqual(0, deliveries(0)[MsgType.MT_Forward_SM])
+        self.assertEqual(0, deliveries(1)[MsgType.Forward_SM])
+        v3 = deliveries(0.5)
+        self.assertAlmostEqual(0.5, v3[MsgType.MT_Forward_SM] / sum(v3.values()), delta=0.1)
+
+    def test_chains_link_through_imsi(self):
+        store = MessageStore()
+        for msg in self.messages:
+            store.add(msg)
+        chain = MessageChain(store, subscriber_msisdn(0))
+        chain.build()
+        messages = chain.get_chain()
+
+        self.assertIn(subscriber_imsi(0), {msg.imsi for msg in messages})
+        deliveries = {msg.tid for msg in store.by_imsi(subscriber_imsi(0)) if msg.opcode == MsgType.Forward_SM}
+        results = [msg for msg in messages if msg.tid in deliveries]
+        self.assertTrue(results)
+        self.assertTrue(all(msg.opcode == MsgType.ResultLast for msg in results))
+
+    def test_zipf_concentrates_traffic(self):
+        frames = generate_frames(5000, subscribers=1000, distribution='zipf')
+        msisdns = Counter(msg.msisdn for msg in JsonParser().parse_frames(frames) if msg.msisdn)
+        top = sum(count for _, count in msisdns.most_common(10))
+        self.assertGreater(top / sum(msisdns.values()), 0.2)
+
+    def test_unknown_distribution(self):
+        with self.assertRaises(ValueError):
+            next(generate_frames(1, distribution='normal'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace.models import Message, MsgType, TCAPState, datetime_to_us
+from msg_trace.targeted import TargetedExtractor
+
+TIME = datetime_to_us(datetime(2025, 3, 25, 8, 26, 23, tzinfo=timezone.utc))
+MSISDN = "79999999999"
+IMSI = "250991234567890"
+
+SRI = Message(ts_us=TIME, tcap_state=TCAPState.Begin, tid="2f:7a:c6:22", opcode=MsgType.SRI, msisdn=MSISDN,
+              frame=1)
+SRI_RESP = Message(ts_us=TIME, tcap_state=TCAPState.End, tid="2f:7a:c6:22", opcode=MsgType.ResultLast, imsi=IMSI,
+                   frame=2)
+MT_FSM = Message(ts_us=TIME, tcap_state=TCAPState.Begin, tid="00:00:00:07", opcode=MsgType.MT_Forward_SM, imsi=IMSI,
+                 frame=3)
+MT_RESP = Message(ts_us=TIME, tcap_state=TCAPState.End, tid="00:00:00:07", opcode=MsgType.ResultLast, frame=4)
+
+
+class TestTargetedExtractor(unittest.TestCase):
+    def setUp(self):
+        self.extractor = TargetedExtractor([Path("a.pcap"), Path("b.pcap")], {"start": 0, "end": 1}, MSISDN)
+        self.calls = []
+
+    def fake_extract(self, pcap_path, display_filter):
+        self.calls.append((pcap_path.name, display_filter))
+        if pcap_path.name != "a.pcap":
+            return []
+        # what tshark returns: the frames of a filter, including those of earlier phases
+        if display_filter.startswith('e164.msisdn'):
+            return [SRI]
+        if display_filter == 'tcap.tid in {2f:7a:c6:22}':
+            return [SRI, SRI_RESP]
+        if display_filter == f'e212.imsi in {{"{IMSI}"}}':
+            return [SRI_RESP, MT_FSM]
+        if display_filter == 'tcap.tid in {00:00:00:07}':
+            return [MT_FSM, MT_RESP]
+        return []
+
+    def test_phases_follow_chain_links(self):
+        with patch.object(TargetedExtractor, '_extract', side_effect=self.fake_extract):
+            result = list(self.extractor.scan())
+
+        self.assertEqual([SRI, SRI_RESP, MT_FSM, MT_RESP], result)
+        # every phase runs over every file
+        self.assertEqual(8, len(self.calls))
+
+    def test_filters_do_not_grow_with_earlier_phases(self):
+        extractor = TargetedExtractor([Path("a.pcap")], {"start": 0, "end": 1}, MSISDN, chunk_size=2)
+        tids = [f"00:00:{i:02x}" for i in range(5)]
+        requests = [Message(ts_us=TIME, tcap_state=TCAPState.Begin, tid=tid, opcode=MsgType.SRI, msisdn=MSISDN,
+                            frame=i) for i, tid in enumerate(tids, 1)]
+
+        def extract(pcap_path, display_filter):
+            self.calls.append(display_filter)
+            return requests if display_filter.startswith('e164.msisdn') else []
+
+        with patch.object(TargetedExtractor, '_extract', side_effect=extract):
+            self.assertEqual(requests, list(extractor.scan()))
+        self.assertEqual(['tcap.tid in {00:00:00, 00:00:01}', 'tcap.tid in {00:00:02, 00:00:03}',
+                          'tcap.tid in {00:00:04}'], self.calls[1:])
+
+    def test_tid_filters_are_chunked_and_validated(self):
+        extractor = TargetedExtractor([], {}, MSISDN, chunk_size=2)
+
+        filters = extractor._tid_filters({"00:01", "00:02", "00:03", "bad tid\" || 1"})
+
+        self.assertEqual(["tcap.tid in {00:01, 00:02}", "tcap.tid in {00:03}"], filters)
+
+    def test_non_digit_msisdn_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            TargetedExtractor([], {}, '7999" || 1')
+
+
+if __name__ == "__main__":
+    unittest.main()
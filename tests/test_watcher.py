@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from msg_trace import watcher
+from msg_trace.file_pool import FilePool
+from msg_trace.models import Message, MsgType
+from msg_trace.watcher import FolderWatcher, MessageArchive
+from tests.test_pcapfile import pcap_bytes
+
+BASE = 1711354583_000000
+
+
+def messages(n, offset=0) -> list[Message]:
+    return [Message(ts_us=BASE + offset + i, tid=f"{i:02x}", opcode=MsgType.SRI, msisdn="79990000001")
+            for i in range(n)]
+
+
+def fake_extract(files, date_filter, backend='json', jobs=1):
+    for info in files:
+        yield info, messages(int(info.filepath.stem[-1]))
+
+
+class TestMessageArchive(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.dump = self.folder / 'dump1.pcap'
+        self.dump.write_bytes(pcap_bytes([1711354583.0]))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_segments_survive_restart(self):
+        archive = MessageArchive(self.folder)
+        archive.append(self.dump, messages(3))
+        self.assertTrue(archive.is_current(self.dump))
+
+        reopened = MessageArchive(self.folder)
+        self.assertEqual(3, len(reopened))
+        self.assertTrue(reopened.is_current(self.dump))
+        self.assertEqual(messages(3), list(reopened.messages()))
+        self.assertEqual(messages(3)[1:2], list(reopened.messages(BASE + 1, BASE + 1)))
+
+    def test_uncommitted_tail_is_discarded(self):
+        archive = MessageArchive(self.folder)
+        archive.append(self.dump, messages(2))
+        with open(self.folder / '.msg_trace_archive' / 'messages.msgs', 'ab') as fh:
+            fh.write(b'MTC1 half written segment')
+
+        reopened = MessageArchive(self.folder)
+        self.assertEqual(messages(2), list(reopened.messages()))
+        other = self.folder / 'other.pcap'
+        other.write_bytes(pcap_bytes([1711354583.0]))
+        reopened.append(other, messages(1, offset=10))
+        self.assertEqual(3, len(list(MessageArchive(self.folder).messages())))
+
+    def test_outdated_archive_is_discarded(self):
+        archive = MessageArchive(self.folder)
+        archive.append(self.dump, messages(2))
+        checkpoint = self.folder / '.msg_trace_archive' / 'checkpoint.json'
+        checkpoint.write_text(checkpoint.read_text().replace('"version": 2', '"version": 1'))
+
+        with patch('builtins.print'):
+            reopened = MessageArchive(self.folder)
+        self.assertEqual(0, len(reopened))
+        self.assertFalse(reopened.is_current(self.dump))
+        self.assertEqual([], list(reopened.messages()))
+
+    def test_rewritten_dump_replaces_its_segment(self):
+        archive = MessageArchive(self.folder)
+        archive.append(self.dump, messages(2))
+        self.dump.write_bytes(pcap_bytes([1711354583.0, 1711354584.0]))
+        self.assertFalse(archive.is_current(self.dump))
+
+        archive.append(self.dump, messages(4))
+        self.assertEqual(messages(4), list(MessageArchive(self.folder).messages()))
+
+    def test_replaced_segments_are_compacted(self):
+        archive = MessageArchive(self.folder)
+        other = self.folder / 'other.pcap'
+        other.write_bytes(pcap_bytes([1711354583.0]))
+        archive.append(other, messages(1, offset=10))
+        archive.append(self.dump, messages(20))
+        self.assertEqual(0, archive.compact())
+
+        # the dump is rewritten twice, its first segments are no longer referenced
+        archive.append(self.dump, messages(20))
+        archive.append(self.dump, messages(3))
+        self.assertGreater(archive.compact(), 0)
+        self.assertEqual(0, archive.compact())
+
+        files = list((self.folder / '.msg_trace_archive').glob('*.msgs'))
+        self.assertEqual(1, len(files))
+        self.assertEqual(sum(entry["length"] for entry in archive._files.values()), files[0].stat().st_size)
+        reopened = MessageArchive(self.folder)
+        self.assertEqual(messages(1, offset=10) + messages(3), list(reopened.messages()))
+        self.assertTrue(reopened.is_current(self.dump))
+        reopened.append(other, messages(2))
+        self.assertEqual(messages(3) + messages(2), list(MessageArchive(self.folder).messages()))
+
+    def test_segments_without_length_are_measured(self):
+        archive = MessageArchive(self.folder)
+        archive.append(self.dump, messages(20))
+        archive.append(self.dump, messages(2))
+        checkpoint = self.folder / '.msg_trace_archive' / 'checkpoint.json'
+        data = json.loads(checkpoint.read_text())
+        for entry in data["files"].values():
+            del entry["length"]
+        checkpoint.write_text(json.dumps(data))
+
+        reopened = MessageArchive(self.folder)
+        self.assertGreater(reopened.compact(), 0)
+        self.assertEqual(messages(2), list(MessageArchive(self.folder).messages()))
+
+
+@patch('msg_trace.watcher.extract_parallel', fake_extract)
+class TestFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write_dump(self, name, age: float):
+        path = self.folder / name
+        path.write_bytes(pcap_bytes([1711354583.0]))
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_only_new_dumps_are_ingested(self):
+        old = self.write_dump('dump2.pcap', age=3600)
+        watcher = FolderWatcher(self.folder, settle=60)
+        self.assertEqual([old], watcher.poll())
+        self.assertEqual([], watcher.poll())
+
+        new = self.write_dump('dump3.pcap', age=3600)
+        self.assertEqual([new], FolderWatcher(self.folder, settle=60).poll())
+        self.assertEqual(5, len(list(MessageArchive(self.folder).messages())))
+
+    def test_growing_dump_waits_until_stable(self):
+        current = self.write_dump('dump1.pcap', age=0)
+        watcher = FolderWatcher(self.folder, settle=60)
+        self.assertEqual([], watcher.poll())
+        # unchanged since the previous poll
+        self.assertEqual([current], watcher.poll())
+
+    def test_folder_is_searched_incrementally(self):
+        self.write_dump('dump1.pcap', age=3600)
+        probed = []
+        probe = FilePool._probe
+
+        def record(pool, file_path):
+            probed.append(file_path.name)
+            return probe(pool, file_path)
+
+        with patch.object(FilePool, '_probe', record), \
+                patch.object(watcher, 'FilePool', wraps=FilePool) as pools:
+            folder_watcher = FolderWatcher(self.folder, settle=60)
+            folder_watcher.poll()
+            folder_watcher.poll()
+            new = self.write_dump('dump2.pcap', age=3600)
+            self.assertEqual([new], folder_watcher.poll())
+        self.assertEqual(1, pools.call_count)
+        self.assertEqual(['dump1.pcap', 'dump2.pcap'], probed)
+
+    def test_partitioned_archive(self):
+        (self.folder / 'site' / '2025' / '03' / '25' / '08').mkdir(parents=True)
+        nested = self.write_dump('site/2025/03/25/08/dump2.pcap', age=3600)
+        self.assertEqual([], FolderWatcher(self.folder, settle=60).poll())
+        self.assertEqual([nested], FolderWatcher(self.folder, settle=60, recursive=True).poll())
+
+
+if __name__ == '__main__':
+    unittest.main()